@@ -0,0 +1,120 @@
+import collections
+import functools
+import re
+
+MATCH_SCHEDULE_ADDRESS = re.compile('^(/api/[^/]+/)([a-zA-Z0-9_]+)/([a-zA-Z0-9_]+)([^a-zA-Z0-9_].*)?$')
+MATCH_RULE_ADDRESS = re.compile('^(/)([a-zA-Z0-9_]+)/([a-zA-Z0-9_]+)([^a-zA-Z0-9_].*)?$')
+MATCH_RESOURCE_LINK = re.compile("^/([a-zA-Z0-9_]+)/([a-zA-Z0-9_]+)")
+
+# resource types, whose ids differ between bridges, and their names for messages
+TRANSLATED = {
+    "lights": "light",
+    "groups": "group",
+    "sensors": "sensor",
+    "schedules": "schedule",
+    "rules": "rule",
+    "scenes": "scene"
+}
+
+# parsed address: prefix ("/" or "/api/<key>/"), resource type, id and the rest (e.g., "/state")
+Address = collections.namedtuple("Address", ["prefix", "type", "id", "rest"])
+
+@functools.lru_cache(maxsize=16384)
+def parseAddress(address, with_api):
+    """
+    Parse address of a rule (with_api not set) or schedule (with_api set) into Address
+    or return None if the address is not valid. Addresses repeat a lot (e.g., the same
+    sensor in many rules), so parsed addresses are cached.
+    """
+    match = (MATCH_SCHEDULE_ADDRESS if with_api else MATCH_RULE_ADDRESS).match(address)
+    if not match:
+        return None
+    return Address(match.group(1), match.group(2), match.group(3), match.group(4) or "")
+
+class AddressTranslator():
+    """
+    Translation of addresses in rules, schedules and resource links between ids of two
+    bridges.
+
+    Maps is a dict of resource type to the dict mapping ids of the source to ids of the
+    destination (e.g., RestorePlanner.maps()). The maps are used directly, so ids mapped
+    later are translated as well. Each address is parsed once and translated addresses
+    are remembered, so repeated addresses only cost a single lookup in the map of their
+    type to check that the mapping did not change.
+
+    Problems are reported via the warning and error callbacks. With apiKey set, addresses
+    of schedules get the API key of the destination, otherwise they keep theirs.
+    """
+
+    def __init__(self, maps, apiKey=None, warning=None, error=None):
+        self.maps = maps
+        self.apiKey = apiKey
+        self.__warning = warning or (lambda msg: None)
+        self.__error = error or (lambda msg: None)
+        self.__translated = {}
+
+    def reverse(self):
+        """
+        Return translator of addresses from the destination back to the source (using the
+        current state of the maps)
+        """
+        maps = {ctype: {new: old for old, new in table.items()} for ctype, table in self.maps.items()}
+        return AddressTranslator(maps, None, self.__warning, self.__error)
+
+    def translate(self, address, with_api):
+        """
+        Translate address, return translated address and its Address or None, None if
+        the address cannot be translated
+        """
+        key = (address, with_api)
+        cached = self.__translated.get(key)
+        if cached is not None:
+            source_id, translated, parsed = cached
+            if parsed.type not in TRANSLATED or self.maps.get(parsed.type, {}).get(source_id) == parsed.id:
+                return translated, parsed
+        parsed = parseAddress(address, with_api)
+        if parsed is None:
+            self.__error("unknown schedule/rule address " + address)
+            return None, None
+        cid = parsed.id
+        if parsed.type in TRANSLATED:
+            table = self.maps.get(parsed.type, {})
+            if cid not in table:
+                self.__warning("not importing resource referencing non-existing " + TRANSLATED[parsed.type] + " " + cid)
+                return None, None
+            cid = table[cid]
+        elif parsed.type != "config":
+            self.__error("unsupported resource type in " + address)
+            return None, None
+        prefix = parsed.prefix
+        if with_api and self.apiKey is not None:
+            prefix = "/api/" + self.apiKey + "/"
+        result = Address(prefix, parsed.type, cid, parsed.rest)
+        translated = prefix + result.type + "/" + cid + result.rest
+        self.__translated[key] = (parsed.id, translated, result)
+        return translated, result
+
+    def translateAction(self, action, with_api):
+        """
+        Translate action of a rule or command of a schedule including the scene recalled
+        in the body, return translated action (a copy) and list of referenced resources or
+        None, None if the action cannot be translated
+        """
+        address, parsed = self.translate(action["address"], with_api)
+        if address is None:
+            return None, None
+        action = dict(action)
+        action["address"] = address
+        refs = [] if parsed.type == "config" else [parsed.type + "/" + parsed.id]
+        body = action.get("body")
+        if parsed.type == "groups" and type(body) is dict and "scene" in body:
+            # command addressing group, so maybe needs to fix scene in body
+            sid = body["scene"]
+            scenes = self.maps.get("scenes", {})
+            if sid not in scenes:
+                self.__warning("not importing resource referencing non-existing scene " + sid)
+                return None, None
+            action["body"] = dict(body)
+            action["body"]["scene"] = scenes[sid]
+            refs.append("scenes/" + scenes[sid])
+        return action, refs
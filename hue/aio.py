@@ -0,0 +1,429 @@
+import asyncio
+import heapq
+import json
+import time
+import urllib.parse
+from .transport import TransportError, Response, bridgeUrl
+from .scheduler import WriteScheduler, MAX_RATE
+from .executor import PlanExecutor
+from .profile import phase
+from .store import ResourceStore
+from .workflow import LOAD, REFRESH, FETCH_LIGHTSTATES, EXECUTE, DELETE, CALL, backupSteps, restoreSteps
+from .workflow import printStats, readResult, applyWrite, addLightstates
+from .fleet import FleetBackup
+
+class AsyncTransport():
+    """
+    Transport of requests to a single Hue bridge using asyncio streams.
+
+    Like HttpTransport, keep-alive connections to the bridge are pooled and reused
+    for the lifetime of the transport. At most jobs requests are sent to the bridge
+    at the same time. If limit (an asyncio.Semaphore) is given, it is shared by the
+    transports of several bridges and caps the number of concurrent requests over all
+    of them. Hooks are called like for Transport.
+    """
+
+    def __init__(self, urlbase, jobs=4, timeout=10, limit=None):
+        url = urllib.parse.urlsplit(urlbase)
+        self.hooks = []
+        self.timeout = timeout
+        self.__ssl = url.scheme == "https"
+        self.__host = url.hostname
+        self.__port = url.port or (443 if self.__ssl else 80)
+        self.__netloc = url.netloc
+        self.__path = url.path.rstrip("/")
+        self.__jobs = asyncio.Semaphore(max(1, jobs))
+        self.__limit = limit
+        self.__idle = []
+        self.__requests = 0
+        self.__connections = 0
+
+    async def request(self, method, resource, data=None, timeout=None):
+        """
+        Execute one request against the bridge and return the response
+        """
+        async with self.__jobs:
+            if self.__limit is None:
+                return await self.__timed(method, resource, data, timeout)
+            async with self.__limit:
+                return await self.__timed(method, resource, data, timeout)
+
+    async def __timed(self, method, resource, data, timeout):
+        if not self.hooks:
+            return await self.send(method, resource, data, timeout)
+        response = None
+        start = time.perf_counter()
+        try:
+            response = await self.send(method, resource, data, timeout)
+            return response
+        finally:
+            end = time.perf_counter()
+            for hook in self.hooks:
+                hook(method, resource, data, response, start, end)
+
+    async def send(self, method, resource, data, timeout):
+        if timeout is None:
+            timeout = self.timeout
+        body = b""
+        headers = "Host: " + self.__netloc + "\r\n"
+        if data is not None:
+            body = json.dumps(data).encode("utf-8")
+            headers += "Content-Type: application/json\r\n"
+        headers += "Content-Length: " + str(len(body)) + "\r\n"
+        request = (method + " " + self.__path + "/" + resource + " HTTP/1.1\r\n" + headers + "\r\n").encode("utf-8") + body
+        while True:
+            reader, writer, reused = await self.__acquire(timeout)
+            try:
+                status, content, keep_alive = await asyncio.wait_for(self.__exchange(reader, writer, request), timeout)
+            except (asyncio.IncompleteReadError, ConnectionError) as e:
+                writer.close()
+                if reused and method != "POST":
+                    # connection was closed by the bridge in the meantime, repeat on a new one
+                    continue
+                raise TransportError("Cannot " + method + " " + resource + ": " + (str(e) or type(e).__name__), True)
+            except (OSError, ValueError, asyncio.TimeoutError) as e:
+                writer.close()
+                raise TransportError("Cannot " + method + " " + resource + ": " + (str(e) or type(e).__name__), True)
+            except BaseException:
+                # cancelled, the state of the connection is unknown
+                writer.close()
+                raise
+            self.__requests += 1
+            if keep_alive:
+                self.__idle.append((reader, writer))
+            else:
+                writer.close()
+            return Response(status, content)
+
+    async def __exchange(self, reader, writer, request):
+        """
+        Send the request and return tuple of status, body and flag whether the
+        connection can be reused
+        """
+        writer.write(request)
+        await writer.drain()
+        version, status = (await reader.readuntil(b"\r\n")).decode("latin-1").split(None, 2)[0:2]
+        headers = {}
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        connection = headers.get("connection", "").lower()
+        keep_alive = connection == "keep-alive" or (version == "HTTP/1.1" and connection != "close")
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                chunk = await reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                chunks.append(chunk[:-2])
+            content = b"".join(chunks)
+        elif "content-length" in headers:
+            content = await reader.readexactly(int(headers["content-length"]))
+        else:
+            content = await reader.read()
+            keep_alive = False
+        return int(status), content, keep_alive
+
+    async def __acquire(self, timeout):
+        """
+        Return tuple of reader and writer of an open connection and flag whether it
+        was used before
+        """
+        while self.__idle:
+            reader, writer = self.__idle.pop()
+            # the reader of an idle connection is at its end only if the bridge closed it
+            if not reader.at_eof() and not writer.is_closing():
+                return reader, writer, True
+            writer.close()
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(self.__host, self.__port, ssl=self.__ssl or None), timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            raise TransportError("Cannot connect to bridge: " + (str(e) or type(e).__name__), False)
+        self.__connections += 1
+        return reader, writer, False
+
+    def stats(self):
+        return {
+            "requests": self.__requests,
+            "connections": self.__connections,
+            "reused": self.__requests - self.__connections
+        }
+
+    async def close(self):
+        idle = self.__idle
+        self.__idle = []
+        for reader, writer in idle:
+            writer.close()
+        for reader, writer in idle:
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+class AsyncWriteScheduler(WriteScheduler):
+    """
+    WriteScheduler for an AsyncTransport, waiting for tokens and backoff without
+    blocking the event loop
+    """
+
+    async def request(self, method, resource, data=None):
+        """
+        Execute one write request and return the response, retrying transient failures
+        """
+        attempt = 0
+        while True:
+            wait = self.bucket.reserve()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                result = await self.transport.request(method, resource, data, self.timeout)
+            except TransportError as e:
+                result = e
+            delay = self.retryDelay(method, resource, attempt, result)
+            if delay is None:
+                return result
+            await asyncio.sleep(delay)
+            attempt += 1
+
+class AsyncPlanExecutor(PlanExecutor):
+    """
+    PlanExecutor running the operations of a plan as asyncio tasks using the given
+    coroutine functions.
+
+    If an operation fails, no further operations are started and the error is raised
+    after running operations finish. If the execution is cancelled, running operations
+    are cancelled as well (and remain in doubt in the journal). The before check (see
+    PlanExecutor) may block and runs on a worker thread.
+    """
+
+    def __init__(self, put, post, delete, jobs=1, journal=None, before=None):
+        super().__init__(None, None, None, jobs, journal, before)
+        self.__put = put
+        self.__post = post
+        self.__delete = delete
+
+    async def run(self, graph, done=None):
+        """
+        Execute operations of the dependency graph of a plan, except operations in done
+        (dictionary of already completed operations to ids of created resources or None)
+        """
+        remaining, ready = self.prepare(graph, done)
+        running = {}
+        try:
+            while ready or running:
+                while ready and len(running) < self.jobs:
+                    n = heapq.heappop(ready)
+                    running[asyncio.ensure_future(self.execute(graph.ops[n]))] = n
+                finished, _ = await asyncio.wait(running.keys(), return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    n = running.pop(task)
+                    # raises the error of the operation, running operations are awaited below
+                    task.result()
+                    self.complete(graph, n, remaining, ready)
+        except asyncio.CancelledError:
+            for task in running.keys():
+                task.cancel()
+            raise
+        finally:
+            if running:
+                await asyncio.wait(running.keys())
+
+    async def execute(self, op):
+        if self.before is not None and (await asyncio.to_thread(self.before, op)) is False:
+            if self.journal:
+                await asyncio.to_thread(self.journal.completed, op)
+            return
+        resource = self.resolve(op.resource)
+        body = self.resolve(op.body)
+        # the journal syncs each record to disk, which must not block the event loop
+        if self.journal:
+            await asyncio.to_thread(self.journal.started, op)
+        with phase(op.phase):
+            if op.method == "PUT":
+                await self.__put(resource, body)
+            elif op.method == "POST":
+                self.ids[op.number] = await self.__post(resource, body)
+            elif op.method == "DELETE":
+                await self.__delete(resource)
+            else:
+                raise Exception("Unknown operation " + str(op))
+        if self.journal:
+            await asyncio.to_thread(self.journal.completed, op, self.ids.get(op.number))
+
+class AsyncHueBackup():
+    """
+    Asyncio variant of HueBackup.
+
+    Backup and restore run the same steps as HueBackup (see workflow.py), but
+    requests to the bridge are coroutines running on the event loop of the caller
+    and blocking steps (files, the journal, planning) run on worker threads, so one
+    event loop can back up or restore many bridges at the same time. Up to
+    jobs requests are sent to this bridge concurrently, limit is an optional
+    asyncio.Semaphore shared by several instances capping the number of concurrent
+    requests over all of them (see AsyncTransport).
+
+    Cancelling the task running backup() or restore() stops it after cancelling
+    outstanding requests. An interrupted restore can be resumed from its journal.
+    """
+
+    def __init__(self, bridge, apiKey, jobs=1, rate=MAX_RATE, hooks=None, limit=None):
+        self.bridge = bridge
+        self.apiKey = apiKey
+        self.jobs = max(1, jobs)
+        self.urlbase = bridgeUrl(bridge, apiKey)
+        self.__transport = AsyncTransport(self.urlbase, self.jobs, limit=limit)
+        if hooks:
+            self.__transport.hooks.extend(hooks)
+        self.__writer = AsyncWriteScheduler(self.__transport, rate)
+        self.__errors = []
+        self.__current = None
+        self.__store = None
+        # requests of the backup and restore steps (see workflow.py)
+        self.__requests = {
+            LOAD: self.__loaded,
+            REFRESH: self.__refreshed,
+            FETCH_LIGHTSTATES: self.__fetchLightstates,
+            EXECUTE: self.__execute,
+            DELETE: self.__delete,
+            # don't block other bridges while reading, compressing and writing files
+            CALL: asyncio.to_thread
+        }
+
+    async def backup(self, filename, incremental=False, full_every=7, fmt=None, intern=False, previous=None, cache=True, repository=False, catalog=None):
+        """
+        Store the backup of the bridge into specified file name (see HueBackup.backup())
+        """
+        await self.__run(backupSteps(self.bridge, filename, incremental, full_every, fmt, intern, previous, cache, repository, catalog))
+        self.__printStats()
+
+    async def restore(self, filename, point=None, dry_run=False, resume=False, only=None, verify=False):
+        """
+        Restore the backup from the file into the bridge (see HueBackup.restore())
+        """
+        report = await self.__run(restoreSteps(self.bridge, self.apiKey, filename, point, dry_run, resume, only, verify,
+                                               self.__writer.max_rate, self.__errors))
+        self.__printStats()
+        return report
+
+    async def close(self):
+        """
+        Close the connections to the bridge
+        """
+        await self.__transport.close()
+
+    def stats(self):
+        """
+        Return connection reuse statistics of the bridge transport
+        """
+        return self.__transport.stats()
+
+    def __printStats(self):
+        printStats(self.__transport.stats(), self.__writer.retried)
+
+    async def __run(self, steps):
+        """
+        Run backup or restore steps (see workflow.py) awaiting their requests, return
+        the result of the steps
+        """
+        result, error = None, None
+        while True:
+            try:
+                request = steps.send(result) if error is None else steps.throw(error)
+            except StopIteration as e:
+                return e.value
+            try:
+                result, error = await self.__requests[request[0]](*request[1:]), None
+            except BaseException as e:
+                # including cancellation, the steps close the journal
+                result, error = None, e
+
+    async def __loaded(self):
+        await self.__load()
+        return self.__store
+
+    async def __refreshed(self):
+        await self.__refresh()
+        return self.__store
+
+    async def __execute(self, graph, done, journal, before=None):
+        executor = AsyncPlanExecutor(self.__put, self.__post, self.__delete, self.jobs, journal, before)
+        await executor.run(graph, done)
+        return executor
+
+    async def __load(self):
+        # read the bridge state on first use
+        if self.__current is None:
+            with phase("refresh"):
+                await self.__refresh()
+
+    async def __refresh(self):
+        self.__current = await self.__get("")
+        self.__store = ResourceStore(self.__current)
+
+    async def __get(self, resource):
+        return readResult(await self.__transport.request("GET", resource))
+
+    async def __fetchLightstates(self, guids):
+        """
+        Read light states of given scenes into the current state
+        """
+        addLightstates(self.__current, guids, await self.__fetchAll(["scenes/" + guid for guid in guids]))
+
+    async def __fetchAll(self, resources):
+        """
+        Read all given resources from the bridge (the transport limits the number of
+        concurrent requests). Returns a list of data in the order of the input. If any
+        request fails, outstanding requests are cancelled and the error is raised.
+        """
+        # tasks inherit the phase of the caller
+        tasks = [asyncio.ensure_future(self.__get(resource)) for resource in resources]
+        try:
+            return await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def __put(self, resource, data):
+        applyWrite(self.__store, "PUT", resource, data, await self.__writer.request("PUT", resource, data))
+
+    async def __post(self, resource, data):
+        return applyWrite(self.__store, "POST", resource, data, await self.__writer.request("POST", resource, data))
+
+    async def __delete(self, resource):
+        applyWrite(self.__store, "DELETE", resource, None, await self.__writer.request("DELETE", resource))
+
+class AsyncFleetBackup(FleetBackup):
+    """
+    FleetBackup backing up all bridges on a single event loop using AsyncHueBackup.
+
+    At most parallel bridges are backed up at the same time, each of them using up
+    to jobs concurrent requests. If max_requests is set, it caps the number of
+    concurrent requests over all bridges.
+    """
+
+    def __init__(self, inventory, parallel=4, jobs=1, rate=MAX_RATE, incremental=False, full_every=7, max_requests=None, repository=False, catalog=None):
+        super().__init__(inventory, parallel, jobs, rate, incremental, full_every, repository, catalog, max_requests)
+
+    async def run(self):
+        """
+        Back up all bridges and return the summary as a list of per-bridge results
+        """
+        bridges = asyncio.Semaphore(self.parallel)
+        limit = asyncio.Semaphore(self.max_requests) if self.max_requests else None
+        return await asyncio.gather(*[self.__backupOne(entry, bridges, limit) for entry in self.inventory])
+
+    async def __backupOne(self, entry, bridges, limit):
+        async with bridges:
+            with self.bridgeResult(entry) as result:
+                br = AsyncHueBackup(entry["bridge"], entry["key"], self.jobs, self.rate, limit=limit)
+                try:
+                    await br.backup(entry["output"], self.incremental, self.full_every, repository=self.repository, catalog=self.catalog)
+                finally:
+                    result["requests"] = br.stats()["requests"]
+                    await br.close()
+            return result
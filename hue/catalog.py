@@ -0,0 +1,158 @@
+import os
+import sqlite3
+import time
+from .incremental import BackupChain, RESOURCE_SECTIONS, resourceHash
+from .repository import repositoryOf, bridgeName
+from .storage import sceneLightstates
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    bridge TEXT NOT NULL,
+    time TEXT NOT NULL,
+    location TEXT NOT NULL,
+    point INTEGER
+);
+CREATE TABLE IF NOT EXISTS resources (
+    snapshot INTEGER NOT NULL REFERENCES snapshots(id),
+    section TEXT NOT NULL,
+    resource TEXT NOT NULL,
+    name TEXT,
+    type TEXT,
+    hash TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS snapshots_bridge ON snapshots (bridge, time);
+CREATE INDEX IF NOT EXISTS snapshots_location ON snapshots (location, point);
+CREATE INDEX IF NOT EXISTS resources_name ON resources (section, name, snapshot);
+CREATE INDEX IF NOT EXISTS resources_snapshot ON resources (snapshot);
+"""
+
+def backupTime(timestamp=None):
+    """
+    Format time of a backup as stored in the catalog
+    """
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(timestamp))
+
+class BackupCatalog():
+    """
+    SQLite catalog of the backup history of many bridges.
+
+    For each backup (snapshot), the catalog stores the bridge, time and location of
+    the backup and id, name, type and content hash (ignoring volatile values) of each
+    of its resources. Questions like when a resource changed or which bridges still
+    have it are then answered by indexed queries, without reading the backup files.
+
+    Each BackupCatalog has its own connection, so concurrent backups (e.g., of a fleet)
+    use one BackupCatalog each and SQLite serializes their writes.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.__db = sqlite3.connect(filename, timeout=30)
+        self.__db.executescript(SCHEMA)
+
+    def close(self):
+        """
+        Close the catalog
+        """
+        self.__db.close()
+
+    def add(self, bridge, state, location, point=None, timestamp=None, skip_existing=False):
+        """
+        Add the backup of the bridge with the given name stored at the location (file,
+        manifest or backup chain directory with the point in the chain) to the catalog.
+        With skip_existing set, a backup at a location already in the catalog is not
+        added again (a backup file overwritten by a new backup is added normally).
+        Returns True if the backup was added.
+        """
+        location = os.path.abspath(location)
+        with self.__db:
+            if skip_existing and self.__db.execute("SELECT 1 FROM snapshots WHERE location = ? AND point IS ?", (location, point)).fetchone():
+                return False
+            snapshot = self.__db.execute("INSERT INTO snapshots (bridge, time, location, point) VALUES (?, ?, ?, ?)",
+                                         (bridge, backupTime(timestamp), location, point)).lastrowid
+            self.__db.executemany("INSERT INTO resources VALUES (?, ?, ?, ?, ?, ?)", self.__rows(snapshot, state))
+        return True
+
+    def addFile(self, filename):
+        """
+        Add an existing backup file, manifest of a backup repository or all backups of
+        a backup chain directory to the catalog, skipping backups already added, returns
+        number of added backups
+        """
+        if os.path.isdir(filename):
+            chain = BackupChain(filename)
+            added = 0
+            for point, entry in enumerate(chain.snapshots()):
+                timestamp = time.mktime(time.strptime(entry["time"], "%Y-%m-%dT%H:%M:%S"))
+                state = chain.load(point)
+                added += self.add(bridgeName(state, os.path.basename(os.path.abspath(filename))), state, filename, point, timestamp, True)
+            return added
+        # imported here, since the workflow module imports the catalog
+        from .workflow import loadBackup
+        state = loadBackup(filename)
+        name = os.path.basename(os.path.dirname(filename)) if repositoryOf(filename) else os.path.basename(filename)
+        return int(self.add(bridgeName(state, name), state, filename, None, os.path.getmtime(filename), True))
+
+    def history(self, section, name, bridge=None):
+        """
+        Return changes of resources of the section with the given name over all backups
+        (of the given bridge) as list of dictionaries with bridge, time, change ("added",
+        "changed" or "removed"), id of the resource and location and point of the backup
+        """
+        query = ("SELECT s.bridge, s.id, r.resource, r.hash FROM resources r JOIN snapshots s ON s.id = r.snapshot "
+                 "WHERE r.section = ? AND r.name = ?")
+        params = [section, name]
+        if bridge is not None:
+            query += " AND s.bridge = ?"
+            params.append(bridge)
+        query += " ORDER BY s.bridge, s.id, r.resource"
+        # names are not unique (e.g., scenes of different rooms), so resources are told apart by their ids
+        found = {}
+        for bridge_name, snapshot, resource, content in self.__db.execute(query, params):
+            found.setdefault(bridge_name, {}).setdefault(snapshot, {})[resource] = content
+        changes = []
+        for bridge_name in sorted(found.keys()):
+            resources = sorted(set(resource for snapshot in found[bridge_name].values() for resource in snapshot),
+                               key=lambda resource: (len(resource), resource))
+            # walk all backups of the bridge to notice, when a resource disappeared
+            previous = {}
+            for snapshot, timestamp, location, point in self.__db.execute(
+                    "SELECT id, time, location, point FROM snapshots WHERE bridge = ? ORDER BY time, id", (bridge_name,)):
+                current = found[bridge_name].get(snapshot, {})
+                for resource in resources:
+                    change = None
+                    if resource not in current and resource in previous:
+                        change = "removed"
+                    elif resource in current and resource not in previous:
+                        change = "added"
+                    elif resource in current and current[resource] != previous[resource]:
+                        change = "changed"
+                    if change:
+                        changes.append({"bridge": bridge_name, "time": timestamp, "change": change,
+                                        "id": resource, "location": location, "point": point})
+                previous = current
+        return changes
+
+    def find(self, section, name):
+        """
+        Return bridges, whose latest backup contains a resource of the section with the
+        given name, as list of dictionaries with bridge, time, id of the resource and
+        location and point of the backup
+        """
+        # the latest backup of a bridge is the last one added among backups of the same time
+        query = ("SELECT s.bridge, s.time, r.resource, s.location, s.point FROM resources r JOIN snapshots s ON s.id = r.snapshot "
+                 "WHERE r.section = ? AND r.name = ? AND s.id = "
+                 "(SELECT id FROM snapshots WHERE bridge = s.bridge ORDER BY time DESC, id DESC LIMIT 1) "
+                 "ORDER BY s.bridge, r.resource")
+        return [{"bridge": bridge, "time": timestamp, "id": resource, "location": location, "point": point}
+                for bridge, timestamp, resource, location, point in self.__db.execute(query, (section, name))]
+
+    def __rows(self, snapshot, state):
+        for section in RESOURCE_SECTIONS:
+            for idx, data in state.get(section, {}).items():
+                if section == "scenes" and "lightstates" in data:
+                    # hash the light states themselves, whether interned in the backup or not
+                    data = dict(data)
+                    data["lightstates"] = sceneLightstates(state, data)
+                yield (snapshot, section, idx, data.get("name"), data.get("type"), resourceHash(section, data))
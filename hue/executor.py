@@ -0,0 +1,234 @@
+import heapq
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from .planner import MATCH_PLACEHOLDER, placeholder, placeholders
+from .profile import phase
+
+# harmless condition and action used for rules created before the rules they reference
+STUB_CONDITION = {"address": "/config/localtime", "operator": "dx"}
+STUB_ACTION = {"address": "/sensors/1/config", "method": "PUT", "body": {"on": True}}
+
+class DependencyGraph():
+    """
+    Dependency graph of the operations of a restore plan.
+
+    An operation depends on operations creating resources it references by placeholder,
+    on operations writing resources it references (e.g., a scene depends on the update
+    of its group) and on the previous write to the same resource.
+
+    Cycles (e.g., new rules enabling and disabling each other) are broken by creating
+    the rules of the cycle first as disabled stubs without references to each other and
+    patching them with the complete body afterwards. A new rule referencing itself (e.g.,
+    its own lasttriggered) is a cycle of its own and is created the same way.
+    """
+
+    def __init__(self, plan):
+        self.plan = plan
+        self.__build()
+        cyclic = self.__cyclic()
+        if cyclic:
+            self.__breakCycles(cyclic)
+            self.__build()
+            cyclic = self.__cyclic()
+            if cyclic:
+                raise Exception("Cannot resolve circular dependency between " + ", ".join(str(op) for op in cyclic))
+
+    def __build(self):
+        self.ops = {op.number: op for op in self.plan.operations}
+        self.deps = {}
+        self.dependents = {number: [] for number in self.ops.keys()}
+        writers = {}
+        # operations creating a resource, which they reference themselves
+        self.__self_referencing = set()
+        for op in self.plan.operations:
+            deps = set(n for n in placeholders(op.resource) | placeholders(op.body) if n in self.ops)
+            for ref in op.refs:
+                if ref in writers:
+                    deps.add(writers[ref])
+            path = op.path()
+            if path in writers:
+                deps.add(writers[path])
+            writers[path] = op.number
+            if op.number in deps:
+                self.__self_referencing.add(op.number)
+            deps.discard(op.number)
+            self.deps[op.number] = deps
+            for d in deps:
+                self.dependents[d].append(op.number)
+
+    def __cyclic(self):
+        """
+        Return operations which cannot be ordered because of cycles
+        """
+        remaining = {n: len(d) for n, d in self.deps.items()}
+        ready = [n for n, c in remaining.items() if c == 0]
+        while ready:
+            n = ready.pop()
+            del remaining[n]
+            for d in self.dependents[n]:
+                remaining[d] -= 1
+                if remaining[d] == 0:
+                    ready.append(d)
+        return [self.ops[n] for n in sorted(set(remaining.keys()) | self.__self_referencing)]
+
+    def __breakCycles(self, cyclic):
+        pending = set(op.number for op in cyclic)
+        for op in cyclic:
+            if op.method != "POST" or op.resource != "rules":
+                continue
+            body = op.body
+            conditions = [c for c in body["conditions"] if not placeholders(c) & pending]
+            actions = [a for a in body["actions"] if not placeholders(a) & pending]
+            print("   - creating rule " + body["name"] + " in two steps to break circular dependency")
+            patch = {"name": body["name"], "status": body["status"], "conditions": body["conditions"], "actions": body["actions"]}
+            op.body = {"name": body["name"], "status": "disabled", "recycle": body["recycle"],
+                       "conditions": conditions if conditions else [STUB_CONDITION],
+                       "actions": actions if actions else [STUB_ACTION]}
+            self.plan.phase = op.phase
+            self.plan.put("rules/" + placeholder(op.number), patch, None, op.refs)
+            self.plan.phase = None
+
+    def levels(self):
+        """
+        Return number of levels of the graph, i.e., the length of the longest chain of
+        operations which have to be executed one after another
+        """
+        remaining = {n: len(d) for n, d in self.deps.items()}
+        ready = [n for n, c in remaining.items() if c == 0]
+        levels = 0
+        while ready:
+            levels += 1
+            next_ready = []
+            for n in ready:
+                for d in self.dependents[n]:
+                    remaining[d] -= 1
+                    if remaining[d] == 0:
+                        next_ready.append(d)
+            ready = next_ready
+        return levels
+
+class PlanExecutor():
+    """
+    Executor of a restore plan.
+
+    Runs the operations of the plan in dependency order using the given functions,
+    replacing placeholders by ids of resources created by already executed operations.
+    Up to jobs independent operations (e.g., scenes of different rooms) are executed
+    concurrently. If an operation fails, no further operations are started and the
+    error is raised after running operations finish.
+
+    If a journal (see RestoreJournal) is given, start and completion of each operation
+    is recorded in it.
+
+    If before is given, it is called with each operation before its execution (e.g.,
+    to complete its body with data not known when planning) and can return False to
+    skip an operation, which turned out to be unnecessary.
+    """
+
+    def __init__(self, put, post, delete, jobs=1, journal=None, before=None):
+        self.__put = put
+        self.__post = post
+        self.__delete = delete
+        self.jobs = max(1, jobs)
+        self.journal = journal
+        self.before = before
+        self.ids = {}
+
+    def run(self, graph, done=None):
+        """
+        Execute operations of the dependency graph of a plan, except operations in done
+        (dictionary of already completed operations to ids of created resources or None)
+        """
+        remaining, ready = self.prepare(graph, done)
+        if self.jobs == 1:
+            while ready:
+                n = heapq.heappop(ready)
+                self.execute(graph.ops[n])
+                self.complete(graph, n, remaining, ready)
+            return
+        executor = ThreadPoolExecutor(max_workers=self.jobs)
+        try:
+            running = {}
+            while ready or running:
+                while ready and len(running) < self.jobs:
+                    n = heapq.heappop(ready)
+                    running[executor.submit(self.execute, graph.ops[n])] = n
+                done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    n = running.pop(future)
+                    # raises the error of the operation, running operations are awaited below
+                    future.result()
+                    self.complete(graph, n, remaining, ready)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def prepare(self, graph, done=None):
+        """
+        Take over ids created by operations in done and return tuple of the number
+        of unfinished dependencies per operation and the heap of operations ready to run
+        """
+        done = done or {}
+        for n, idx in done.items():
+            if idx is not None:
+                self.ids[n] = idx
+        remaining = {n: len(d) for n, d in graph.deps.items()}
+        for n in done.keys():
+            for d in graph.dependents[n]:
+                remaining[d] -= 1
+        print("Executing " + str(len(remaining) - len(done)) + " request(s) in " + str(graph.levels()) + " level(s) using " + str(self.jobs) + " job(s)")
+        # ready operations are started in plan order
+        ready = [n for n, c in remaining.items() if c == 0 and n not in done]
+        heapq.heapify(ready)
+        return remaining, ready
+
+    def complete(self, graph, n, remaining, ready):
+        """
+        Mark operation n as finished, adding operations depending on it to ready
+        """
+        for d in graph.dependents[n]:
+            remaining[d] -= 1
+            if remaining[d] == 0:
+                heapq.heappush(ready, d)
+
+    def execute(self, op):
+        if self.before is not None and self.before(op) is False:
+            if self.journal:
+                self.journal.completed(op)
+            return
+        resource = self.resolve(op.resource)
+        body = self.resolve(op.body)
+        if self.journal:
+            self.journal.started(op)
+        with phase(op.phase):
+            if op.method == "PUT":
+                self.__put(resource, body)
+            elif op.method == "POST":
+                self.ids[op.number] = self.__post(resource, body)
+            elif op.method == "DELETE":
+                self.__delete(resource)
+            else:
+                raise Exception("Unknown operation " + str(op))
+        if self.journal:
+            self.journal.completed(op, self.ids.get(op.number))
+
+    def resolve(self, value):
+        """
+        Replace placeholders in the value (string, list or dictionary) by actual ids
+        """
+        if type(value) is str:
+            if "${" not in value:
+                return value
+            return MATCH_PLACEHOLDER.sub(self.__resolveMatch, value)
+        if type(value) is list:
+            return [self.resolve(v) for v in value]
+        if type(value) is dict:
+            return {self.resolve(k): self.resolve(v) for k, v in value.items()}
+        return value
+
+    def __resolveMatch(self, match):
+        number = int(match.group(1))
+        if number not in self.ids:
+            raise Exception("Operation " + str(number) + " did not create a resource")
+        idx = self.ids[number]
+        if match.group(2):
+            idx = idx.zfill(int(match.group(2)))
+        return idx
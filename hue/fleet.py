@@ -0,0 +1,96 @@
+import contextlib
+import csv
+import json
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from .hue_backup import HueBackup
+from .scheduler import MAX_RATE
+
+def loadInventory(filename):
+    """
+    Load bridge inventory from a JSON or CSV file.
+
+    JSON inventory is a list of objects with keys "bridge", "key" and "output", CSV
+    inventory has a header line with columns bridge, key and output.
+    """
+    with open(filename, "r", newline="") as f:
+        if filename.lower().endswith(".csv"):
+            inventory = [dict(row) for row in csv.DictReader(f)]
+        else:
+            inventory = json.load(f)
+    for entry in inventory:
+        for k in ["bridge", "key", "output"]:
+            if not entry.get(k):
+                raise Exception("Inventory entry " + str(entry) + " is missing " + k)
+    return inventory
+
+class FleetBackup():
+    """
+    Back up many bridges in parallel.
+
+    At most parallel bridges are backed up at the same time (global concurrency cap),
+    each of them using up to jobs concurrent requests (per-bridge worker limit).
+    A failure of one bridge doesn't stop the backup of other bridges.
+    With incremental set, outputs are backup chain directories (see BackupChain).
+    With repository set, outputs are directories of backup repositories, which can be
+    shared by all bridges (see BackupRepository).
+    With catalog set, all backups are added to the SQLite catalog in this file.
+    If max_requests is set, it caps the number of concurrent requests over all bridges.
+    """
+
+    def __init__(self, inventory, parallel=4, jobs=1, rate=MAX_RATE, incremental=False, full_every=7, repository=False, catalog=None, max_requests=None):
+        self.inventory = inventory
+        self.parallel = max(1, parallel)
+        self.jobs = jobs
+        self.rate = rate
+        self.incremental = incremental
+        self.full_every = full_every
+        self.repository = repository
+        self.catalog = catalog
+        self.max_requests = max_requests
+
+    def run(self):
+        """
+        Back up all bridges and return the summary as a list of per-bridge results
+        """
+        limit = threading.BoundedSemaphore(self.max_requests) if self.max_requests else None
+        with ThreadPoolExecutor(max_workers=self.parallel) as executor:
+            return list(executor.map(lambda entry: self.__backupOne(entry, limit), self.inventory))
+
+    def __backupOne(self, entry, limit):
+        with self.bridgeResult(entry) as result:
+            br = HueBackup(entry["bridge"], entry["key"], self.jobs, self.rate, limit=limit)
+            try:
+                br.backup(entry["output"], self.incremental, self.full_every, repository=self.repository, catalog=self.catalog)
+            finally:
+                result["requests"] = br.stats()["requests"]
+                br.close()
+        return result
+
+    @contextlib.contextmanager
+    def bridgeResult(self, entry):
+        """
+        Context of the backup of one bridge of the inventory yielding its result for
+        the summary, a failure of the backup is recorded in the result
+        """
+        result = {"bridge": entry["bridge"], "output": entry["output"], "requests": 0, "error": None}
+        start = time.monotonic()
+        try:
+            yield result
+        except Exception as e:
+            traceback.print_exc()
+            result["error"] = str(e)
+        result["duration"] = round(time.monotonic() - start, 3)
+
+def printSummary(summary):
+    failed = 0
+    print("Fleet backup summary:")
+    for r in summary:
+        status = "OK" if not r["error"] else "FAILED: " + r["error"]
+        if r["error"]:
+            failed += 1
+        print(" - " + r["bridge"] + ": " + ("%.1f" % r["duration"]) + "s, " + str(r["requests"]) + " request(s), " + status)
+    print(str(len(summary) - failed) + " of " + str(len(summary)) + " bridge(s) backed up successfully")
+    return failed
@@ -0,0 +1,208 @@
+import hashlib
+import json
+import os
+import time
+
+# sections of the bridge state, which consist of individually hashed resources
+RESOURCE_SECTIONS = ["lights", "groups", "scenes", "rules", "schedules", "resourcelinks", "sensors"]
+
+# volatile runtime values, which change all the time (e.g., when a light is switched
+# or a rule fires) and are not restored anyway, so they don't constitute a change of
+# the resource; "key/subkey" removes subkey of the nested dictionary key
+VOLATILE = {
+    "lights": ["state", "swupdate"],
+    "sensors": ["state", "config/battery", "config/reachable", "swupdate"],
+    "groups": ["state", "action"],
+    "rules": ["lasttriggered", "timestriggered"],
+    "config": ["UTC", "localtime", "whitelist", "swupdate", "swupdate2", "portalstate",
+               "portalconnection", "internetservices", "linkbutton"]
+}
+
+INDEX_FILE = "chain.json"
+COMPACT = (",", ":")
+
+def stableData(section, data):
+    """
+    Return one resource (or a whole non-resource section) without volatile values
+    """
+    if section not in VOLATILE or type(data) is not dict:
+        return data
+    data = dict(data)
+    for path in VOLATILE[section]:
+        key, sep, subkey = path.partition("/")
+        if not sep:
+            data.pop(key, None)
+        elif type(data.get(key)) is dict:
+            data[key] = {k: v for k, v in data[key].items() if k != subkey}
+    return data
+
+def volatileData(section, data):
+    """
+    Return the volatile values of one resource (or of a whole non-resource section)
+    removed by stableData as dictionary (nested for "key/subkey") or None if it has none
+    """
+    if section not in VOLATILE or type(data) is not dict:
+        return None
+    volatile = {}
+    for path in VOLATILE[section]:
+        key, sep, subkey = path.partition("/")
+        if not sep:
+            if key in data:
+                volatile[key] = data[key]
+        elif type(data.get(key)) is dict and subkey in data[key]:
+            volatile.setdefault(key, {})[subkey] = data[key][subkey]
+    return volatile or None
+
+def resourceHash(section, data):
+    """
+    Compute content hash of one resource (or of a whole non-resource section)
+    """
+    return hashlib.sha1(json.dumps(stableData(section, data), sort_keys=True, separators=COMPACT).encode("utf-8")).hexdigest()
+
+def sectionFingerprints(state):
+    """
+    Compute one hash per section of the bridge state ignoring volatile values, to
+    cheaply find out whether anything changed since the state was read last time
+    """
+    fingerprints = {}
+    for section, tree in state.items():
+        if section in RESOURCE_SECTIONS:
+            tree = {index: stableData(section, data) for index, data in tree.items()}
+        else:
+            tree = stableData(section, tree)
+        fingerprints[section] = hashlib.sha1(json.dumps(tree, sort_keys=True, separators=COMPACT).encode("utf-8")).hexdigest()
+    return fingerprints
+
+def stateHashes(state):
+    """
+    Compute hashes of all resources in the bridge state
+    """
+    hashes = {}
+    for section, tree in state.items():
+        if section in RESOURCE_SECTIONS:
+            hashes[section] = {index: resourceHash(section, data) for index, data in tree.items()}
+        else:
+            hashes[section] = resourceHash(section, tree)
+    return hashes
+
+class BackupChain():
+    """
+    Chain of incremental backups in a directory.
+
+    Each backup is stored either as a full snapshot or as a delta against the previous
+    backup in the chain, containing only resources which changed since then. A full
+    snapshot is written every full_every backups to limit the length of the chain,
+    which needs to be replayed on restore.
+
+    The directory contains the index file chain.json with the list of backups and
+    hashes of all resources of the latest backup, so the previous backup doesn't have
+    to be read to compute the next delta.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.__indexFile = os.path.join(directory, INDEX_FILE)
+        if os.path.exists(self.__indexFile):
+            with open(self.__indexFile, "r") as f:
+                self.__index = json.load(f)
+        else:
+            self.__index = {"version": 1, "snapshots": [], "hashes": {}}
+
+    def snapshots(self):
+        """
+        Return the list of backups in the chain (oldest first)
+        """
+        return self.__index["snapshots"]
+
+    def write(self, state, full_every=7, skip_unchanged=False):
+        """
+        Append the bridge state to the chain, returning the name of the written file.
+        With skip_unchanged set, nothing is written (and None is returned) if no
+        resource changed since the latest backup.
+        """
+        snapshots = self.__index["snapshots"]
+        hashes = stateHashes(state)
+        if skip_unchanged and snapshots and hashes == self.__index["hashes"]:
+            return None
+        since_full = 0
+        for entry in reversed(snapshots):
+            if entry["type"] == "full":
+                break
+            since_full += 1
+        number = len(snapshots)
+        if not snapshots or since_full + 1 >= full_every:
+            kind = "full"
+            content = {"type": "full", "state": state}
+            print("   - writing full snapshot")
+        else:
+            kind = "delta"
+            content = self.__makeDelta(state, hashes, self.__index["hashes"])
+            content["base"] = snapshots[-1]["file"]
+            changed = sum(len(v) for v in content["changed"].values()) + len(content["sections"])
+            removed = sum(len(v) for v in content["removed"].values())
+            print("   - writing delta with " + str(changed) + " changed and " + str(removed) + " removed resource(s)")
+        name = "%06d-%s.json" % (number, kind)
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, name), "w") as f:
+            json.dump(content, f, separators=COMPACT)
+        snapshots.append({"file": name, "type": kind, "time": time.strftime("%Y-%m-%dT%H:%M:%S")})
+        self.__index["hashes"] = hashes
+        # write the index last, so an interrupted backup doesn't corrupt the chain
+        tmpname = self.__indexFile + ".tmp"
+        with open(tmpname, "w") as f:
+            json.dump(self.__index, f, separators=COMPACT)
+        os.replace(tmpname, self.__indexFile)
+        return name
+
+    def __makeDelta(self, state, hashes, previous):
+        changed = {}
+        removed = {}
+        sections = {}
+        for section, tree in state.items():
+            old = previous.get(section)
+            if section not in RESOURCE_SECTIONS:
+                if old != hashes[section]:
+                    sections[section] = tree
+                continue
+            if old is None:
+                old = {}
+            for index, data in tree.items():
+                if old.get(index) != hashes[section][index]:
+                    changed.setdefault(section, {})[index] = data
+            for index in old.keys():
+                if index not in tree:
+                    removed.setdefault(section, []).append(index)
+        return {"type": "delta", "changed": changed, "removed": removed, "sections": sections}
+
+    def load(self, point=None):
+        """
+        Rebuild the bridge state at the given point of the chain (index into the list
+        of snapshots, negative numbers count from the end, default is the latest backup)
+        """
+        snapshots = self.__index["snapshots"]
+        if not snapshots:
+            raise Exception("No backups found in " + self.directory)
+        if point is None:
+            point = len(snapshots) - 1
+        elif point < 0:
+            point = len(snapshots) + point
+        if point < 0 or point >= len(snapshots):
+            raise Exception("Backup " + str(point) + " not found in " + self.directory + ", there are " + str(len(snapshots)) + " backup(s)")
+        start = point
+        while snapshots[start]["type"] != "full":
+            start -= 1
+        state = None
+        for entry in snapshots[start:point + 1]:
+            with open(os.path.join(self.directory, entry["file"]), "r") as f:
+                content = json.load(f)
+            if content["type"] == "full":
+                state = content["state"]
+                continue
+            for section, tree in content["changed"].items():
+                state.setdefault(section, {}).update(tree)
+            for section, indexes in content["removed"].items():
+                for index in indexes:
+                    state[section].pop(index, None)
+            state.update(content["sections"])
+        print("   - rebuilt backup " + str(point) + " from " + snapshots[point]["time"] + " using " + str(point - start + 1) + " file(s)")
+        return state
@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+import threading
+from .planner import Operation, RestorePlan, MATCH_PLACEHOLDER
+from .storage import BackupSections
+from .store import sceneKey
+
+JOURNAL_VERSION = 1
+COMPACT = (",", ":")
+
+def backupFingerprint(bridge, target):
+    """
+    Compute fingerprint of the restore of the given backup data into the bridge
+    """
+    if isinstance(target, BackupSections):
+        # don't decode all sections of a compressed backup
+        data = target.digest
+    else:
+        data = json.dumps(target, sort_keys=True, separators=COMPACT)
+    return hashlib.sha1((bridge + "\n" + data).encode("utf-8")).hexdigest()
+
+def inDoubtPosts(in_doubt):
+    """
+    Return POST operations in doubt, whose resources can be looked up by name
+    """
+    return [op for op in in_doubt if op.method == "POST" and op.body and "name" in op.body]
+
+def existingIds(store, plan):
+    """
+    Return ids of resources existing in the bridge before the restore in all sections,
+    where the plan creates resources
+    """
+    sections = set(op.resource for op in plan.operations if op.method == "POST")
+    return {section: sorted(store.section(section).keys()) for section in sections}
+
+class RestoreJournal():
+    """
+    Write-ahead journal of a restore.
+
+    The journal is a file with one JSON record per line. The first record holds the
+    complete restore plan together with the maps of ids from the backup to the bridge
+    (with placeholders for resources to be created) and the ids of resources, which
+    already existed in sections where resources are created. Before an operation is sent to
+    the bridge a "start" record is appended, after it succeeded a "done" record with
+    the id of the created resource (for POST). Each record is flushed to disk before
+    the request is sent or the next operation depending on it is started.
+
+    When an interrupted restore is resumed, completed operations are skipped and
+    placeholders are replaced by ids from the journal. Operations which were started
+    but not completed are in doubt: PUT and DELETE are simply repeated, for POST the
+    caller has to find out whether the resource was created.
+
+    The journal is removed after the restore completed successfully.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.__lock = threading.Lock()
+        self.__file = None
+        self.__existing = None
+        self.deferred = {}
+
+    def exists(self):
+        return os.path.exists(self.filename)
+
+    def begin(self, fingerprint, plan, maps, errors, existing=None, deferred=None):
+        """
+        Start a new journal for the given plan, replacing any previous journal.
+        Existing are ids of resources in the bridge when the plan was made (see
+        existingIds()), deferred the operations of scenes planned without light states
+        (see RestorePlanner.deferred), which are restored into deferred on resume.
+        """
+        self.__file = open(self.filename, "w")
+        self.__append({
+            "type": "plan",
+            "version": JOURNAL_VERSION,
+            "fingerprint": fingerprint,
+            "operations": [{"number": op.number, "method": op.method, "resource": op.resource,
+                            "body": op.body, "refs": sorted(op.refs), "phase": op.phase}
+                           for op in plan.operations],
+            "maps": maps,
+            "errors": errors,
+            "existing": existing,
+            "deferred": deferred or {}
+        })
+
+    def resume(self, fingerprint):
+        """
+        Read the journal of an interrupted restore and continue writing it.
+
+        Returns tuple of the plan, maps, planning errors, dictionary of completed
+        operations (number to id of the created resource or None) and list of
+        operations in doubt.
+        """
+        header = None
+        done = {}
+        started = set()
+        complete = True
+        with open(self.filename, "r") as f:
+            for line in f:
+                complete = line.endswith("\n")
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # incomplete record of an interrupted write
+                    continue
+                if record["type"] == "plan":
+                    header = record
+                elif record["type"] == "start":
+                    started.add(record["op"])
+                elif record["type"] == "done":
+                    done[record["op"]] = record.get("id")
+        if header is None or header.get("version") != JOURNAL_VERSION:
+            raise Exception("Invalid restore journal " + self.filename)
+        if header["fingerprint"] != fingerprint:
+            raise Exception("Restore journal " + self.filename + " belongs to a different backup or bridge")
+        plan = RestorePlan()
+        for o in header["operations"]:
+            plan.append(Operation(o["number"], o["method"], o["resource"], o["body"], o["refs"], o["phase"]))
+        in_doubt = [op for op in plan.operations if op.number in started and op.number not in done]
+        # journals written by older versions don't know existing resources
+        self.__existing = header.get("existing")
+        self.deferred = {int(n): tuple(value) for n, value in header.get("deferred", {}).items()}
+        self.__file = open(self.filename, "a")
+        if not complete:
+            self.__file.write("\n")
+        return plan, header["maps"], header["errors"], done, in_doubt
+
+    def resolveInDoubt(self, store, plan, done, posts):
+        """
+        Find out, which of the resources of POST operations in doubt were created
+        before the interruption, record them as completed and return dictionary of
+        operations to created ids. Resources are looked up in the store of the current
+        bridge state by name (scenes by group and name, see sceneKey()) among resources,
+        which neither existed when the plan was made nor were created by the restore.
+        """
+        ops = {op.number: op for op in plan.operations}
+        known = set((ops[n].resource, idx) for n, idx in done.items() if idx is not None)
+        if self.__existing is not None:
+            known.update((section, idx) for section, ids in self.__existing.items() for idx in ids)
+        ids = dict(done)
+        result = {}
+        for op in sorted(posts, key=lambda op: op.number):
+            key, value = self.__lookupKey(op, ids)
+            if value is None:
+                continue
+            for idx in store.findAll(op.resource, key, value):
+                if (op.resource, idx) not in known:
+                    print("   - " + op.resource + " " + op.body["name"] + " was created before the interruption as " + idx)
+                    known.add((op.resource, idx))
+                    result[op.number] = idx
+                    ids[op.number] = idx
+                    self.completed(op, idx)
+                    break
+        return result
+
+    def __lookupKey(self, op, ids):
+        # key of the store index and its value identifying the resource created by the POST
+        if op.resource != "scenes":
+            return "name", op.body["name"]
+        body = op.body
+        if "group" in body:
+            match = MATCH_PLACEHOLDER.fullmatch(body["group"])
+            if match:
+                group = ids.get(int(match.group(1)))
+                if group is None:
+                    # the group was not created, so neither was the scene
+                    return "scene", None
+                body = dict(body, group=group)
+        return "scene", sceneKey(None, body)
+
+    def started(self, op):
+        self.__append({"type": "start", "op": op.number})
+
+    def completed(self, op, idx=None):
+        record = {"type": "done", "op": op.number}
+        if idx is not None:
+            record["id"] = idx
+        self.__append(record)
+
+    def finish(self):
+        """
+        Close and remove the journal of a successfully completed restore
+        """
+        self.close()
+        os.remove(self.filename)
+
+    def close(self):
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+    def __append(self, record):
+        line = json.dumps(record, separators=COMPACT) + "\n"
+        with self.__lock:
+            self.__file.write(line)
+            self.__file.flush()
+            os.fsync(self.__file.fileno())
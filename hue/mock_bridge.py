@@ -0,0 +1,237 @@
+import copy
+import json
+import socket
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from .transport import Transport, Response
+
+class MockBridge():
+    """
+    State and statistics of a mock Hue bridge.
+
+    Latency is added to each request, connect_cost to each new connection (both in
+    seconds). If rate is set, write requests exceeding rate per second (with a burst
+    of the same size) are rejected with Hue internal error 901, as the real bridge
+    does when its command queue is full.
+    """
+
+    def __init__(self, key, state, latency=0, connect_cost=0, rate=None):
+        self.key = key
+        self.state = state
+        self.latency = latency
+        self.connect_cost = connect_cost
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.connections = 0
+        self.rejected = 0
+        self.__nextid = 1
+        for section in self.state.values():
+            for index in section.keys():
+                if index.isdigit():
+                    self.__nextid = max(self.__nextid, int(index) + 1)
+        self.__tokens = rate
+        self.__last = time.monotonic()
+
+    def resetStats(self):
+        with self.lock:
+            self.requests = {}
+            self.connections = 0
+            self.rejected = 0
+
+    def stats(self):
+        with self.lock:
+            return {"requests": dict(self.requests), "total": sum(self.requests.values()),
+                    "connections": self.connections, "rejected": self.rejected}
+
+    def count(self, method):
+        with self.lock:
+            self.requests[method] = self.requests.get(method, 0) + 1
+
+    def admit(self):
+        """
+        Check whether a write request can be accepted within the rate limit
+        """
+        if not self.rate:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            self.__tokens = min(self.rate, self.__tokens + (now - self.__last) * self.rate)
+            self.__last = now
+            if self.__tokens < 1:
+                self.rejected += 1
+                return False
+            self.__tokens -= 1
+            return True
+
+    def newId(self):
+        idx = str(self.__nextid)
+        self.__nextid += 1
+        return idx
+
+    def handle(self, method, path, body):
+        """
+        Handle request to the given URL path, return data of the response
+        """
+        self.count(method)
+        if self.latency:
+            time.sleep(self.latency)
+        parts = [p for p in path.split("/") if p]
+        if len(parts) < 2 or parts[0] != "api" or parts[1] != self.key:
+            return self.__error(1, path, "unauthorized user")
+        if method != "GET" and not self.admit():
+            return self.__error(901, path, "Internal error, 503")
+        parts = parts[2:]
+        if method == "GET":
+            return self.__get(parts)
+        elif method == "POST":
+            return self.__post(parts, body)
+        elif method == "PUT":
+            return self.__put(parts, body)
+        elif method == "DELETE":
+            return self.__delete(parts)
+        return self.__error(4, path, "method, " + method + ", not available for resource")
+
+    def __error(self, etype, address, description):
+        return [{"error": {"type": etype, "address": address, "description": description}}]
+
+    def __notAvailable(self, path):
+        return self.__error(3, "/" + "/".join(path), "resource, /" + "/".join(path) + ", not available")
+
+    def __get(self, path):
+        with self.lock:
+            node = self.state
+            for p in path:
+                if type(node) is not dict or p not in node:
+                    return self.__notAvailable(path)
+                node = node[p]
+            node = copy.deepcopy(node)
+        # scene light states are only returned when reading a single scene
+        if len(path) == 0:
+            for scene in node["scenes"].values():
+                scene.pop("lightstates", None)
+        elif path == ["scenes"]:
+            for scene in node.values():
+                scene.pop("lightstates", None)
+        return node
+
+    def __post(self, path, body):
+        if len(path) != 1 or path[0] not in self.state:
+            return self.__error(4, "/" + "/".join(path), "method, POST, not available for resource")
+        with self.lock:
+            if path[0] == "scenes":
+                idx = "scene" + self.newId()
+                body.setdefault("version", 2)
+                body.setdefault("lastupdated", time.strftime("%Y-%m-%dT%H:%M:%S"))
+                body.setdefault("locked", False)
+            else:
+                idx = self.newId()
+            body.setdefault("recycle", False)
+            if path[0] in ["rules", "schedules"]:
+                body.setdefault("status", "enabled")
+            self.state[path[0]][idx] = body
+        return [{"success": {"id": idx}}]
+
+    def __put(self, path, body):
+        with self.lock:
+            if len(path) < 2 or path[0] not in self.state or path[1] not in self.state[path[0]]:
+                return self.__notAvailable(path)
+            node = self.state[path[0]][path[1]]
+            for p in path[2:]:
+                node = node.setdefault(p, {})
+            result = []
+            for k, v in body.items():
+                if type(v) is dict and type(node.get(k)) is dict and k != "lightstates":
+                    node[k].update(v)
+                else:
+                    node[k] = v
+                result.append({"success": {"/" + "/".join(path + [k]): v}})
+            if path[0] == "scenes":
+                self.state["scenes"][path[1]]["lastupdated"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        return result
+
+    def __delete(self, path):
+        with self.lock:
+            if len(path) != 2 or path[0] not in self.state or path[1] not in self.state[path[0]]:
+                return self.__notAvailable(path)
+            del self.state[path[0]][path[1]]
+        return [{"success": "/" + "/".join(path) + " deleted"}]
+
+class MockBridgeHandler(BaseHTTPRequestHandler):
+    """
+    HTTP request handler serving a MockBridge
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        # answer immediately, response header and body are written separately
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        bridge = self.server.bridge
+        with bridge.lock:
+            bridge.connections += 1
+        if bridge.connect_cost:
+            time.sleep(bridge.connect_cost)
+
+    def __send(self, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def __handle(self):
+        length = int(self.headers.get("Content-Length", 0) or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        self.__send(self.server.bridge.handle(self.command, self.path, body))
+
+    def do_GET(self):
+        self.__handle()
+
+    def do_POST(self):
+        self.__handle()
+
+    def do_PUT(self):
+        self.__handle()
+
+    def do_DELETE(self):
+        self.__handle()
+
+class MockTransport(Transport):
+    """
+    Transport calling a MockBridge directly in the same process, without HTTP
+    """
+
+    def __init__(self, bridge, apiKey):
+        super().__init__()
+        self.bridge = bridge
+        self.apiKey = apiKey
+
+    def send(self, method, resource, data, timeout):
+        # pass data through JSON like over the network, so no objects are shared with the bridge
+        body = json.loads(json.dumps(data)) if data is not None else None
+        result = self.bridge.handle(method, "/api/" + self.apiKey + "/" + resource, body)
+        return Response(200, json.dumps(result).encode("utf-8"))
+
+class MockBridgeServer():
+    """
+    Mock Hue bridge served over HTTP on localhost in a background thread
+    """
+
+    def __init__(self, key, state, latency=0, connect_cost=0, rate=None, port=0):
+        self.bridge = MockBridge(key, state, latency, connect_cost, rate)
+        self.__server = ThreadingHTTPServer(("127.0.0.1", port), MockBridgeHandler)
+        self.__server.daemon_threads = True
+        self.__server.bridge = self.bridge
+        self.address = "127.0.0.1:" + str(self.__server.server_address[1])
+        self.__thread = threading.Thread(target=self.__server.serve_forever, daemon=True)
+        self.__thread.start()
+
+    def close(self):
+        self.__server.shutdown()
+        self.__server.server_close()
@@ -0,0 +1,849 @@
+import re
+from .storage import sceneLightstates
+from .store import sceneKey
+from .address import AddressTranslator, parseAddress, MATCH_RESOURCE_LINK
+
+MATCH_HUEAPP_SCENEDATA = re.compile('^(.....)_r([0-9][0-9])_d([0-9][0-9])$')
+
+# placeholder for the id of a resource created by operation number N of the plan,
+# optionally zero-padded to the given width: ${N} or ${N:width}
+MATCH_PLACEHOLDER = re.compile(r'\$\{([0-9]+)(?::([0-9]+))?\}')
+
+def placeholder(number, width=None):
+    """
+    Return placeholder for the id of resource created by operation number
+    """
+    if width:
+        return "${" + str(number) + ":" + str(width) + "}"
+    return "${" + str(number) + "}"
+
+def isUpToDate(body, current):
+    """
+    Check whether writing body to a resource with the current state would change nothing,
+    i.e., all values in body are already present in the current state
+    """
+    if type(body) is dict:
+        if type(current) is not dict:
+            return False
+        for k, v in body.items():
+            if k not in current or not isUpToDate(v, current[k]):
+                return False
+        return True
+    if type(body) is list:
+        if type(current) is not list or len(body) != len(current):
+            return False
+        for b, c in zip(body, current):
+            if not isUpToDate(b, c):
+                return False
+        return True
+    return body == current
+
+def mergeBody(body, update):
+    """
+    Merge the body of a later write to the same resource into the body of an earlier one
+    """
+    for k, v in update.items():
+        if type(v) is dict and type(body.get(k)) is dict:
+            body[k] = dict(body[k])
+            mergeBody(body[k], v)
+        else:
+            body[k] = v
+
+def placeholders(value):
+    """
+    Return set of operation numbers referenced by placeholders in the value
+    """
+    if type(value) is str:
+        if "${" not in value:
+            return set()
+        return set(int(m.group(1)) for m in MATCH_PLACEHOLDER.finditer(value))
+    result = set()
+    if type(value) is list:
+        for v in value:
+            result |= placeholders(v)
+    elif type(value) is dict:
+        for k, v in value.items():
+            result |= placeholders(k)
+            result |= placeholders(v)
+    return result
+
+def padId(idx, width):
+    """
+    Zero-pad resource id (which may be a placeholder) to the given width
+    """
+    match = MATCH_PLACEHOLDER.fullmatch(idx)
+    if match:
+        return placeholder(match.group(1), width)
+    return idx.zfill(width)
+
+class Operation():
+    """
+    One write operation of a restore plan.
+    
+    Resource and body may contain placeholders for ids of resources created by other
+    operations of the plan. Refs is the set of resources ("type/id") referenced by
+    the operation, which need to be written before it. Phase is the restore phase
+    which planned the operation (e.g., "restoreScenes").
+    """
+
+    def __init__(self, number, method, resource, body, refs, phase=None):
+        self.number = number
+        self.method = method
+        self.resource = resource
+        self.body = body
+        self.refs = set(refs) if refs else set()
+        self.phase = phase
+
+    def path(self):
+        """
+        Return the resource written by this operation
+        """
+        if self.method == "POST":
+            return self.resource + "/" + placeholder(self.number)
+        return self.resource
+
+    def __str__(self):
+        s = str(self.number) + ": " + self.method + " " + self.resource
+        if self.body is not None:
+            s = s + " " + str(self.body)
+        return s
+
+class RestorePlan():
+    """
+    Write operations restoring a backup into a bridge, in the order they were planned.
+    
+    Writes, which wouldn't change the current state of the resource, are skipped and
+    multiple writes to the same resource are merged into one request.
+    """
+
+    def __init__(self):
+        self.phase = None
+        self.operations = []
+        self.skipped = 0
+        self.merged = 0
+        self.__puts = {}
+        self.__next = 0
+
+    def put(self, resource, body, current=None, refs=None):
+        """
+        Add operation updating a resource with the given current state (if known) and
+        return it (None if skipped)
+        """
+        if current is not None and isUpToDate(body, current):
+            self.skipped += 1
+            return None
+        op = self.__puts.get(resource)
+        if op is not None and max(placeholders(body), default=-1) < op.number:
+            # merge into the pending write to the same resource
+            mergeBody(op.body, body)
+            if refs:
+                op.refs |= set(refs)
+            self.merged += 1
+            return op
+        op = self.__add("PUT", resource, dict(body), refs)
+        self.__puts[resource] = op
+        return op
+
+    def post(self, resource, body, refs=None):
+        """
+        Add operation creating a resource and return placeholder for the id of the new resource
+        """
+        return placeholder(self.__add("POST", resource, body, refs).number)
+
+    def reserve(self, resource):
+        """
+        Add operation creating a resource, whose body will be defined later.
+        
+        This allows referencing the new resource before its body is known.
+        """
+        return self.__add("POST", resource, None, None)
+
+    def define(self, op, body, refs=None):
+        """
+        Define body of a reserved operation
+        """
+        op.body = body
+        if refs:
+            op.refs |= set(refs)
+
+    def cancel(self, op):
+        """
+        Remove a reserved operation, which turned out to be not needed
+        """
+        self.operations.remove(op)
+
+    def append(self, op):
+        """
+        Add an already numbered operation (e.g., of a plan read from a restore journal)
+        """
+        self.operations.append(op)
+        self.__next = max(self.__next, op.number + 1)
+
+    def delete(self, resource):
+        self.__puts.pop(resource, None)
+        self.__add("DELETE", resource, None, None)
+
+    def __add(self, method, resource, body, refs):
+        op = Operation(self.__next, method, resource, body, refs, self.phase)
+        self.__next += 1
+        self.operations.append(op)
+        return op
+
+    def __len__(self):
+        return len(self.operations)
+
+    def counts(self):
+        """
+        Return number of operations per HTTP method
+        """
+        counts = {}
+        for op in self.operations:
+            counts[op.method] = counts.get(op.method, 0) + 1
+        return counts
+
+    def print(self, rate=None):
+        print("Restore plan:")
+        for op in self.operations:
+            print("   " + str(op))
+        counts = self.counts()
+        summary = ", ".join(str(counts[m]) + " " + m for m in ["PUT", "POST", "DELETE"] if m in counts)
+        s = "Restore plan has " + str(len(self.operations)) + " request(s)"
+        if summary:
+            s = s + " (" + summary + ")"
+        if rate:
+            s = s + ", estimated time " + ("%.1f" % (len(self.operations) / rate)) + "s"
+        print(s)
+
+    def printSavings(self):
+        if self.skipped > 0 or self.merged > 0:
+            print("   - skipped " + str(self.skipped) + " write(s) of up-to-date resources, merged " + str(self.merged) + " write(s) to the same resource")
+
+def completeScene(op, old, lightstates, map_light):
+    """
+    Add light states (as in the target, translated using the map of lights) to the
+    deferred operation of a scene, whose current state in the bridge is old (None if
+    the scene is created). Returns False if the scene is already up to date.
+    """
+    lightstates = {map_light[lidx]: ldata for lidx, ldata in lightstates.items() if lidx in map_light}
+    if lightstates or old is not None:
+        op.body["lightstates"] = lightstates
+    return old is None or not isUpToDate(op.body, old)
+
+class RestorePlanner():
+    """
+    Planner of the restore of a backup into a bridge.
+    
+    Matches the backup (target configuration) with a snapshot of the bridge state
+    (current configuration), both given as ResourceStore, and builds the ordered list
+    of write operations needed to restore the backup, together with the mapping of ids
+    of resources from the original bridge to this bridge. Resources, which need to be
+    created, get placeholder ids, which are resolved when the plan is executed.
+
+    With defer set, scenes of the target without light states (e.g., still being read
+    from the source bridge of a migration) are planned without them. Operations of
+    these scenes are listed in deferred (operation number to scene id in the target and
+    current state of the scene, if it exists) and have to be completed using
+    completeScene() with the map of lights of maps() before they are executed.
+    """
+
+    def __init__(self, current, target, apiKey, defer=False):
+        self.__current = current
+        self.__target = target
+        self.apiKey = apiKey
+        self.defer = defer
+        self.deferred = {}
+        self.errors = []
+        self.plan = RestorePlan()
+        # resources referenced by the resource being planned, collected while mapping addresses
+        self.__refs = set()
+        self.__map_light = {}
+        self.__map_sensor = {"1": "1"}
+        self.__map_group = {"0": "0"}
+        self.__map_scene = {}
+        self.__map_schedule = {}
+        self.__map_rule = {}
+        self.__map_resource_links = {}
+        # maps are shared with the translator, so it sees ids as they are mapped
+        self.__addresses = AddressTranslator(self.maps(), apiKey, self.__warning, self.__error)
+
+    def run(self):
+        """
+        Build the restore plan and return it
+        """
+        print("Planning restore of lights")
+        self.plan.phase = "restoreLights"
+        self.__restoreLights()
+        print("Planning restore of sensors")
+        self.plan.phase = "restoreSensors"
+        self.__restoreSensors()
+        print("Planning restore of groups")
+        self.plan.phase = "restoreGroups"
+        self.__restoreGroups()
+        print("Planning restore of scenes")
+        self.plan.phase = "restoreScenes"
+        self.__restoreScenes()
+        print("Planning restore of schedules")
+        self.plan.phase = "restoreSchedules"
+        self.__restoreSchedules()
+        print("Planning restore of rules")
+        self.plan.phase = "restoreRules"
+        self.__restoreRules()
+        print("Planning restore of resource links")
+        self.plan.phase = "restoreResourceLinks"
+        self.__restoreResourceLinks()
+        self.plan.phase = None
+        self.plan.printSavings()
+        return self.plan
+
+    def maps(self):
+        """
+        Return mapping of ids from the original bridge to this bridge per resource type
+        (ids of resources to be created are placeholders)
+        """
+        return {
+            "lights": self.__map_light,
+            "sensors": self.__map_sensor,
+            "groups": self.__map_group,
+            "scenes": self.__map_scene,
+            "schedules": self.__map_schedule,
+            "rules": self.__map_rule,
+            "resourcelinks": self.__map_resource_links
+        }
+
+    def __restoreLights(self):
+        """
+        Restore light names and build mapping of lights from original bridge to this bridge into __map_light
+        """
+        s = self.__current.section("lights")
+        t = self.__target.section("lights")
+        self.__checkUniqueIds(self.__current, "lights")
+        self.__checkUniqueIds(self.__target, "lights")
+        # for each light in target configuration, look up the light in current configuration and reconfigure
+        for index, data in t.items():
+            uniq = data.get("uniqueid")
+            if uniq is None:
+                continue
+            si = self.__current.find("lights", "uniqueid", uniq)
+            if si is not None:
+                sname = s[si]["name"]
+                tname = t[index]["name"]
+                self.__map_light[index] = si
+                print("   - mapping light '" + sname + "' from " + index + " to " + si + " as '" + tname + "'")
+                if sname != tname:
+                    print("   - renaming light to " + tname)
+                    self.plan.put(
+                        "lights/" + si,
+                        {"name": tname},
+                        s[si]
+                    )
+            else:
+                self.__warning("light " + uniq + " cannot be restored, since it doesn't exist in target bridge")
+        print("   - light map: " + str(self.__map_light))
+
+    def __restoreSensors(self):
+        """
+        Restore sensor names and build mapping of sensors from original bridge to this bridge into __map_sensor
+        """
+        s = self.__current.section("sensors")
+        t = self.__target.section("sensors")
+        self.__checkUniqueIds(self.__current, "sensors")
+        self.__checkUniqueIds(self.__target, "sensors")
+        # for each sensor in target configuration, look up the sensor in current configuration and reconfigure
+        for index, data in t.items():
+            uniq = data.get("uniqueid")
+            if uniq is None:
+                continue
+            si = self.__current.find("sensors", "uniqueid", uniq)
+            # copy known sensor configuration parameters
+            # TODO do we have more config values, which can be copied?
+            config = {}
+            for k in ["on", "sunriseoffset", "sunsetoffset"]:
+                if k in data["config"]:
+                    config[k] = data["config"][k]
+            if si is not None:
+                sname = s[si]["name"]
+                tname = data["name"]
+                self.__map_sensor[index] = si
+                print("   - mapping sendor '" + sname + "' from " + index + " to " + si + " as '" + tname + "'")
+                if s[si]["type"] != data["type"]:
+                    self.__error("sensor " + uniq + " has different type, expected " + data["type"])
+                if sname != tname:
+                    print("   - renaming sensor to " + tname)
+                    self.plan.put("sensors/" + si, {"name": tname}, s[si])
+                if len(config.keys()) > 0:
+                    # merged with the rename above into a single request, skipped if up to date
+                    self.plan.put("sensors/" + si, {"config": config}, s[si])
+            elif data["type"] == "CLIPGenericFlag" or data["type"] == "CLIPGenericStatus":
+                # CLIP sensor can be recreated
+                body = {"name" : data["name"], "modelid": data["modelid"], "swversion": data["swversion"], "type": data["type"],
+                        "uniqueid": uniq, "manufacturername": data["manufacturername"], "recycle": data["recycle"]}
+                print("   - creating sensor " + uniq + ": " + str(body))
+                if len(config.keys()) > 0:
+                    body["config"] = config 
+                self.__map_sensor[index] = self.plan.post("sensors", body)
+            else:
+                self.__warning("sensor " + uniq + " cannot be restored, since it doesn't exist in target bridge")
+        print("   - sensor map: " + str(self.__map_sensor))
+
+    def __restoreGroups(self):
+        """
+        Restore groups and build mapping of groups from original bridge to this bridge into __map_group
+        """
+        s = self.__current.section("groups")
+        t = self.__target.section("groups")
+        self.__checkNames("group", "groups")
+        for index, data in t.items():
+            name = data["name"]
+            lights = []
+            missing_lights = []
+            for lidx in data["lights"]:
+                if lidx in self.__map_light:
+                    lights.append(self.__map_light[lidx])
+                else:
+                    missing_lights.append(self.__target.section("lights")[lidx]["name"])
+            sensors = []
+            missing_sensors = []
+            for sidx in data["sensors"]:
+                if sidx in self.__map_sensor:
+                    sensors.append(self.__map_sensor[sidx])
+                else:
+                    missing_sensors.append(self.__target.section("sensors")[sidx]["name"])
+ 
+            body = {"name" : name, "lights": lights, "sensors": sensors}
+            refs = ["lights/" + l for l in lights] + ["sensors/" + x for x in sensors]
+            if "class" in data:
+                body["class"] = data["class"]
+            if len(lights) == 0:
+                self.__warning("group " + name + " cannot be restored, since it doesn't contain any lights in the target bridge")
+                continue
+            
+            if len(missing_lights) != 0 or len(missing_sensors) != 0:
+                self.__warning("group " + name + " is missing lights " + str(missing_lights) + " or sensors " + str(missing_sensors))
+
+            # find whether the group already exists in this bridge and if it does, update the old one
+            idx = self.__current.find("groups", "name", name)
+            if idx is not None:
+                # yes, it exists, update group
+                if s[idx]["type"] != data["type"]:
+                    self.__error("group " + name + " has different type, expected " + data["type"])
+                    continue
+                print("   - updating group " + name + '/' + idx)
+                self.plan.put("groups/" + idx, body, s[idx], refs)
+            else:
+                # create a new group                
+                #body["recycle"] = data["recycle"]
+                body["type"] = data["type"]
+                print("   - creating group " + name + ": " + str(body))
+                idx = self.plan.post("groups", body, refs)
+            self.__map_group[index] = idx
+        print("   - group map: " + str(self.__map_group))
+    
+    def __sceneKey(self, guid, data):
+        """
+        Compute key of a scene of the backup in this bridge
+        """
+        if data["type"] != "GroupScene":
+            return sceneKey(guid, data)
+        if data["group"] in self.__map_group:
+            return sceneKey(guid, data, self.__map_group[data["group"]])
+        # group does not exist in target, use some dummy group ID
+        return sceneKey(guid, data, "~" + data["group"])
+
+    def __restoreScenes(self):
+        """
+        Restore scenes and fill __map_scene with mapping for existing scenes
+        """
+        s = self.__current.section("scenes")
+        t = self.__target.section("scenes")
+        for key, guids in self.__current.duplicates("scenes", "scene"):
+            self.__error("current scene " + guids[-1] + " has duplicate key " + key)
+        for key, guids in self.__target.duplicates("scenes", "scene"):
+            self.__error("to-be-restored scene " + guids[-1] + " has duplicate key " + key)
+        self.__map_scene.clear()
+        for guid, data in t.items():
+            if self.__target.find("scenes", "scene", sceneKey(guid, data)) != guid:
+                # only the last of scenes with duplicate key is restored
+                continue
+            key = self.__sceneKey(guid, data)
+            
+            body = {"name": data["name"]}
+            if "group" in data:
+                if data["group"] in self.__map_group:
+                    body["group"] = self.__map_group[data["group"]]
+                else:
+                    self.__warning("scene " + guid + " cannot be restored, missing group " + self.__target.section("groups")[data["group"]]["name"])
+                    continue
+            elif "lights" in data: 
+                lights = []
+                missing_lights = []
+                for lidx in data["lights"]:
+                    if lidx in self.__map_light:
+                        lights.append(self.__map_light[lidx])
+                    else:
+                        missing_lights.append(self.__target.section("lights")[lidx]["name"])
+                if len(lights) == 0:
+                    self.__warning("scene " + guid + " cannot be restored, missing all lights " + str(missing_lights))
+                    continue
+                self.__warning("scene " + guid + " can be only partially restored, missing lights " + str(missing_lights))
+                body["lights"] = lights
+                
+            deferred = self.defer and not "lightstates" in data
+            if not "lightstates" in data and not deferred:
+                self.__error("scene " + guid + " cannot be restored, since light states are not present in backup")
+                continue
+            
+            lightstates = {}
+            if not deferred:
+                lightstates = self.__mapLightstates(sceneLightstates(self.__target.state, data))
+            if "group" in body:
+                refs = ["groups/" + body["group"]]
+            else:
+                refs = ["lights/" + l for l in body.get("lights", [])]
+            
+            sid = self.__current.find("scenes", "scene", key)
+            if sid is not None:
+                # scene exists in the bridge, just update it
+                old = s[sid]
+                if old["type"] != data["type"]:
+                    self.__error("scene " + guid + " has different type, expected " + data["type"])
+                    continue
+                if old["recycle"] != data["recycle"]:
+                    self.__error("scene " + guid + " has different recycle flag, expected " + data["recycle"])
+                # TODO check lights?
+                print("   - updating scene " + guid)
+                body["lightstates"] = lightstates
+                body.pop("group", None)
+                #body.pop("lights", None)
+                if deferred:
+                    self.deferred[self.plan.put("scenes/" + sid, body, None, refs).number] = (guid, old)
+                else:
+                    self.plan.put("scenes/" + sid, body, old, refs)
+                    
+            else:
+                # new scene, so far does not exist in the bridge
+                body["type"] = data["type"]
+                body["recycle"] = data["recycle"]
+                body["appdata"] = dict(data["appdata"])
+                if not "data" in body["appdata"]:
+                    # create dummy app data with GUID to have unique scene IDs
+                    body["appdata"]["version"] = 1
+                    body["appdata"]["data"] = guid
+                if data["type"] == "GroupScene":
+                    # map appdata to show in Hue App
+                    match = MATCH_HUEAPP_SCENEDATA.match(body["appdata"]["data"])
+                    if match:
+                        g = padId(body["group"], 2)
+                        body["appdata"]["data"] = match.group(1) + "_r" + g + "_d" + match.group(3) 
+                if lightstates:
+                    body["lightstates"] = lightstates
+                print("   - creating scene " + guid)
+                sid = self.plan.post("scenes", body, refs)
+                if deferred:
+                    self.deferred[self.plan.operations[-1].number] = (guid, None)
+                
+            self.__map_scene[guid] = sid
+        print("   - scene mapping: " + str(self.__map_scene))
+
+    def __mapLightstates(self, lightstates):
+        return {self.__map_light[lidx]: ldata for lidx, ldata in lightstates.items() if lidx in self.__map_light}
+
+    def __mapAddress(self, address, with_api):
+        """
+        Map address from old system to the new system, return new address and type or None, None if no mapping possible.
+        """
+        address, parsed = self.__addresses.translate(address, with_api)
+        if address is None:
+            return None, None
+        if parsed.type != "config":
+            self.__refs.add(parsed.type + "/" + parsed.id)
+        return address, parsed.type
+
+    def __mapAction(self, action, with_api):
+        """
+        Map action from old system to new system or return None if not possible
+        """
+        action, refs = self.__addresses.translateAction(action, with_api)
+        if action is None:
+            return None
+        self.__refs.update(refs)
+        return action
+
+    def __restoreSchedules(self):
+        """
+        Restore schedules and build mapping of schedules from original bridge to this bridge into __map_schedule
+        """
+        s = self.__current.section("schedules")
+        t = self.__target.section("schedules")
+        self.__checkNames("schedule", "schedules")
+        for index, data in t.items():
+            name = data["name"]
+ 
+            self.__refs = set()
+            command = self.__mapAction(data["command"], True)
+            if not command:
+                self.__warning("not importing schedule " + name + " referencing non-existing item")
+                continue
+
+            body = {"name" : name, "description": data["description"], "command": command,
+                    "status": data["status"], "localtime": data["localtime"]}
+            if "autodelete" in data:
+                body["autodelete"] = data["autodelete"]
+            
+            # find whether the schedule already exists in this bridge and if it does, update the old one
+            idx = self.__current.find("schedules", "name", name)
+            if idx is not None:
+                # yes, it exists, update schedule
+                if s[idx]["recycle"] != data["recycle"]:
+                    self.__error("schedule " + name + " has different recycle flag, expected " + data["recycle"])
+                print("   - updating schedule " + name + '/' + idx)
+                self.plan.put("schedules/" + idx, body, s[idx], self.__refs)
+            else:
+                # create a new schedule                
+                body["recycle"] = data["recycle"]
+                print("   - creating schedule " + name + ": " + str(body))
+                idx = self.plan.post("schedules", body, self.__refs)
+            self.__map_schedule[index] = idx
+        print("   - schedule map: " + str(self.__map_schedule))
+   
+    def __restoreRules(self):
+        """
+        Restore rules and build mapping of rules from original bridge to this bridge into __map_rule
+        """
+        s = self.__current.section("rules")
+        t = self.__target.section("rules")
+        self.__checkNames("rule", "rules")
+        # first pass: assign ids to all rules, so rules can reference rules restored later
+        indexes = []
+        created = {}
+        for index, data in t.items():
+            if data["status"] == "resourcedeleted":
+                continue
+            indexes.append(index)
+            idx = self.__current.find("rules", "name", data["name"])
+            if idx is not None:
+                self.__map_rule[index] = idx
+            else:
+                created[index] = self.plan.reserve("rules")
+                self.__map_rule[index] = placeholder(created[index].number)
+
+        # second pass: map conditions and actions
+        bodies = {}
+        refs = {}
+        for index in indexes:
+            data = t[index]
+            name = data["name"]
+            self.__refs = set()
+            conditions = []
+            actions = []
+            error = False
+            for c in data["conditions"]:
+                # map one condition
+                caddr, ctype = self.__mapAddress(c["address"], False)
+                if caddr:
+                    c = dict(c)
+                    c["address"] = caddr
+                    conditions.append(c)
+                else:
+                    error = True
+                    break
+            if error:
+                continue
+            for a in data["actions"]:
+                # map one action
+                a = self.__mapAction(a, False)
+                if a: 
+                    actions.append(a)
+                else:
+                    error = True
+                    break
+            if error:
+                continue
+            bodies[index] = {"name" : name, "status": data["status"], "conditions": conditions, "actions": actions}
+            refs[index] = self.__refs
+
+        # drop rules referencing new rules, which cannot be restored
+        dropped = set(op.number for index, op in created.items() if index not in bodies)
+        while dropped:
+            newly_dropped = set()
+            for index, body in list(bodies.items()):
+                if placeholders(body) & dropped:
+                    self.__warning("not importing rule " + body["name"] + " referencing rule which cannot be restored")
+                    del bodies[index]
+                    if index in created:
+                        newly_dropped.add(created[index].number)
+            dropped = newly_dropped
+        for index in indexes:
+            if index not in bodies:
+                del self.__map_rule[index]
+                if index in created:
+                    self.plan.cancel(created[index])
+
+        for index, body in bodies.items():
+            data = t[index]
+            name = body["name"]
+            # find whether the rule already exists in this bridge and if it does, update the old one
+            if index not in created:
+                # yes, it exists, update rule
+                idx = self.__map_rule[index]
+                if s[idx]["recycle"] != data["recycle"]:
+                    self.__error("rule " + name + " has different recycle flag, expected " + data["recycle"])
+                print("   - updating rule " + name + '/' + idx)
+                self.plan.put("rules/" + idx, body, s[idx], refs[index])
+            else:
+                # create a new rule                
+                body["recycle"] = data["recycle"]
+                print("   - creating rule " + name + ": " + str(body))
+                self.plan.define(created[index], body, refs[index])
+        print("   - rule map: " + str(self.__map_rule))
+    
+    def __restoreResourceLinks(self):
+        """
+        Restore resource links and build mapping of resource links from original bridge to this bridge into __map_resource_links
+        """
+        s = self.__current.section("resourcelinks")
+        t = self.__target.section("resourcelinks")
+        self.__checkNames("resource link", "resourcelinks")
+        for index, data in t.items():
+            name = data["name"]
+            idx = self.__current.find("resourcelinks", "name", name)
+ 
+            self.__refs = set()
+            links = []
+            missing_links = []
+            makes_sense = False
+            for l in data["links"]:
+                cl, ctype = self.__mapAddress(l, False)
+                if cl:
+                    links.append(cl)
+                    if ctype == "rules":
+                        makes_sense = True
+                else:
+                    missing_links.append(l)
+            if len(links) == 0:
+                self.__warning("not importing resource link " + name + " with no links")
+                continue
+            if not makes_sense:
+                if idx is not None:
+                    # drop the link
+                    print("   - deleting resource link " + name + " without any rules")
+                    self.plan.delete("resourcelinks/" + idx)
+                else:
+                    self.__warning("not importing resource link " + name + " without any rules")
+                continue
+            if len(missing_links) > 0:
+                self.__warning("resource link " + name + " is missing linked resources " + str(missing_links))
+            body = {"name" : name, "description": data["description"], "classid": data["classid"], "links": links}
+            
+            # find whether the resource link already exists in this bridge and if it does, update the old one
+            if idx is not None:
+                # yes, it exists, update rule
+                if s[idx]["recycle"] != data["recycle"]:
+                    self.__error("resource link " + name + " has different recycle flag, expected " + data["recycle"])
+                print("   - updating resource link " + name + '/' + idx)
+                self.plan.put("resourcelinks/" + idx, body, s[idx], self.__refs)
+            else:
+                # create the resource link                
+                body["recycle"] = data["recycle"]
+                print("   - creating resource link " + name + ": " + str(body))
+                idx = self.plan.post("resourcelinks", body, self.__refs)
+            self.__map_resource_links[index] = idx
+        print("   - resource link map: " + str(self.__map_resource_links))
+
+    def __checkUniqueIds(self, store, section):
+        for uniq, ids in store.duplicates(section, "uniqueid"):
+            self.__error("duplicate uniqueid " + uniq)
+        for index, data in store.section(section).items():
+            if "uniqueid" not in data and data["name"] != "Daylight":
+                self.__error("missing uniqueid for index " + index)
+
+    def __checkNames(self, kind, section):
+        for name, ids in self.__current.duplicates(section, "name"):
+            self.__error("duplicate " + kind + " name " + name)
+        for name, ids in self.__target.duplicates(section, "name"):
+            self.__error("duplicate " + kind + " name " + name + " at indexes " + ", ".join(ids))
+
+    def __error(self, msg):
+        print("   - ERROR: " + msg)
+        self.errors.append(msg)
+        
+    def __warning(self, msg):
+        print("   - WARNING: " + msg)
+
+class ResourceLinkCleanup():
+    """
+    Selection of restored resource links, which don't reference any rule or schedule
+    touching a light or a light group (e.g., only touching restored CLIP sensors for
+    non-existing accessories after a partial restore) and thus should be dropped.
+
+    Current is the ResourceStore of the bridge after the restore, target the backup
+    and map_resource_links the map of resource link ids from the backup to the bridge.
+    """
+
+    def __init__(self, current, target, map_resource_links):
+        self.__current = current
+        self.__target = target
+        self.__map_resource_links = map_resource_links
+        self.errors = []
+
+    def run(self):
+        """
+        Return list of resources of resource links to be deleted
+        """
+        relevant = self.__relevantResources()
+        s = self.__current.section("resourcelinks")
+        drop = []
+        for key, data in self.__target.section("resourcelinks").items():
+            if key not in self.__map_resource_links:
+                continue
+            key = self.__map_resource_links[key]
+            if key not in s:
+                self.__warning("restored resource link " + data["name"] + " not found in the bridge")
+                continue
+            data = s[key]
+            print("   - checking " + data["name"])
+            is_relevant = False
+            for l in data["links"]:
+                match = MATCH_RESOURCE_LINK.match(l)
+                if not match:
+                    self.__warning("Resource link " + l + " doesn't conform to link format for " + data["name"])
+                    continue
+                # other types than rules and schedules are ignored
+                if relevant.get(match.group(1) + "/" + match.group(2), False):
+                    print("   - relevant " + l)
+                    is_relevant = True
+                    break
+            if not is_relevant:
+                print("   - dropping non-relevant resource link " + data["name"])
+                drop.append("resourcelinks/" + key)
+        return drop
+
+    def __isRelevantAddress(self, address, with_api):
+        # Check if the address addresses a light or light group
+        parsed = parseAddress(address, with_api)
+        if parsed is None:
+            self.__error("unknown schedule/rule address " + address)
+            return False
+        if parsed.type == "lights":
+            return True
+        if parsed.type == "groups":
+            return parsed.id != "0"
+        return False
+
+    def __relevantResources(self):
+        """
+        Build index of rules and schedules in the current state with flag whether they
+        touch a light or a light group
+        """
+        relevant = {}
+        for rkey, rule in self.__current.section("rules").items():
+            relevant["rules/" + rkey] = any(self.__isRelevantAddress(a["address"], False) for a in rule["actions"])
+        for skey, schedule in self.__current.section("schedules").items():
+            relevant["schedules/" + skey] = self.__isRelevantAddress(schedule["command"]["address"], True)
+        return relevant
+
+    def __error(self, msg):
+        print("   - ERROR: " + msg)
+        self.errors.append(msg)
+
+    def __warning(self, msg):
+        print("   - WARNING: " + msg)
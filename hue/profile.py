@@ -0,0 +1,101 @@
+import contextvars
+import json
+import threading
+import time
+
+_phase = contextvars.ContextVar("phase", default=None)
+
+def currentPhase():
+    """
+    Return the backup/restore phase of the current thread or asyncio task
+    """
+    return _phase.get()
+
+class phase():
+    """
+    Context manager setting the backup/restore phase of the current thread or asyncio
+    task, which is recorded with each request to the bridge
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.token = _phase.set(self.name)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _phase.reset(self.token)
+
+def resourceType(resource):
+    """
+    Return resource type of the request ("all" for reading the complete state)
+    """
+    if not resource:
+        return "all"
+    return resource.split("/", 1)[0]
+
+class Profiler():
+    """
+    Transport hook recording latency, payload size, HTTP verb, resource type and phase
+    of every request to the bridge.
+    """
+
+    def __init__(self):
+        self.records = []
+        self.__lock = threading.Lock()
+        self.__start = time.perf_counter()
+
+    def __call__(self, method, resource, data, response, start, end):
+        record = {
+            "method": method,
+            "resource": resource,
+            "type": resourceType(resource),
+            "phase": currentPhase() or "other",
+            "start": start - self.__start,
+            "latency": end - start,
+            "request_size": len(json.dumps(data)) if data is not None else 0,
+            "response_size": len(response.content) if response is not None else 0,
+            "status": response.status_code if response is not None else None,
+            "thread": threading.get_ident()
+        }
+        with self.__lock:
+            self.records.append(record)
+
+    def breakdown(self, key):
+        """
+        Return statistics of requests grouped by the given record key (e.g., "phase" or "type")
+        """
+        result = {}
+        for r in self.records:
+            s = result.setdefault(r[key], {"requests": 0, "time": 0.0, "max": 0.0, "bytes": 0})
+            s["requests"] += 1
+            s["time"] += r["latency"]
+            s["max"] = max(s["max"], r["latency"])
+            s["bytes"] += r["request_size"] + r["response_size"]
+        return result
+
+    def report(self):
+        for key, title in [("phase", "phase"), ("type", "resource type")]:
+            print("Profile by " + title + ":")
+            print("   %-24s %8s %10s %10s %10s %10s" % (title, "requests", "time [s]", "avg [ms]", "max [ms]", "bytes"))
+            for name, s in sorted(self.breakdown(key).items(), key=lambda i: -i[1]["time"]):
+                print("   %-24s %8d %10.3f %10.1f %10.1f %10d" % (name, s["requests"], s["time"],
+                      1000 * s["time"] / s["requests"], 1000 * s["max"], s["bytes"]))
+
+    def writeTrace(self, filename):
+        """
+        Write the requests as JSON trace in Trace Event Format (loadable in chrome://tracing or Perfetto)
+        """
+        threads = {}
+        events = []
+        for r in self.records:
+            tid = threads.setdefault(r["thread"], len(threads) + 1)
+            events.append({
+                "name": r["method"] + " " + r["type"], "cat": r["phase"], "ph": "X", "pid": 1, "tid": tid,
+                "ts": round(r["start"] * 1000000), "dur": round(r["latency"] * 1000000),
+                "args": {"resource": r["resource"], "phase": r["phase"], "status": r["status"],
+                         "request_size": r["request_size"], "response_size": r["response_size"]}
+            })
+        with open(filename, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms",
+                       "otherData": {"phases": self.breakdown("phase"), "types": self.breakdown("type")}}, f)
@@ -0,0 +1,66 @@
+import json
+import threading
+from .transport import Transport, TransportError, Response
+
+def exchangeKey(method, resource, data):
+    return method + " " + resource + " " + json.dumps(data, sort_keys=True)
+
+class RecordingTransport(Transport):
+    """
+    Transport recording all requests and responses of another transport, which are
+    written as JSON to the file on close (e.g., to replay a backup or restore with
+    ReplayTransport when debugging)
+    """
+
+    def __init__(self, transport, filename):
+        super().__init__()
+        self.transport = transport
+        self.filename = filename
+        self.exchanges = []
+        self.__lock = threading.Lock()
+
+    def send(self, method, resource, data, timeout):
+        response = self.transport.send(method, resource, data, timeout)
+        with self.__lock:
+            self.exchanges.append({"method": method, "resource": resource, "data": data,
+                                   "status": response.status_code, "response": response.text})
+        return response
+
+    def stats(self):
+        return self.transport.stats()
+
+    def close(self):
+        self.transport.close()
+        with open(self.filename, "w") as f:
+            json.dump(self.exchanges, f, indent=1)
+
+class ReplayTransport(Transport):
+    """
+    Transport answering requests with responses recorded by RecordingTransport.
+
+    Requests are matched by method, resource and data. Identical requests get the
+    recorded responses in the recorded order. An unknown request fails as if the
+    bridge was not reachable.
+    """
+
+    def __init__(self, filename):
+        super().__init__()
+        with open(filename, "r") as f:
+            exchanges = json.load(f)
+        self.__responses = {}
+        for e in exchanges:
+            self.__responses.setdefault(exchangeKey(e["method"], e["resource"], e["data"]), []).append(e)
+        self.__lock = threading.Lock()
+        self.__requests = 0
+
+    def send(self, method, resource, data, timeout):
+        with self.__lock:
+            recorded = self.__responses.get(exchangeKey(method, resource, data))
+            if not recorded:
+                raise TransportError("No recorded response for " + method + " " + resource, False)
+            e = recorded.pop(0) if len(recorded) > 1 else recorded[0]
+            self.__requests += 1
+        return Response(e["status"], e["response"].encode("utf-8"))
+
+    def stats(self):
+        return {"requests": self.__requests, "connections": 0, "reused": self.__requests}
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+from .incremental import RESOURCE_SECTIONS, stableData, volatileData
+
+MANIFEST_VERSION = 1
+COMPACT = (",", ":")
+OBJECTS = "objects"
+MANIFESTS = "manifests"
+
+def canonicalJson(data):
+    return json.dumps(data, sort_keys=True, separators=COMPACT)
+
+def repositoryOf(filename):
+    """
+    Return the directory of the backup repository, if the file is a manifest in it,
+    otherwise None
+    """
+    manifests = os.path.dirname(os.path.dirname(os.path.abspath(filename)))
+    root = os.path.dirname(manifests)
+    if os.path.basename(manifests) != MANIFESTS or not os.path.isdir(os.path.join(root, OBJECTS)):
+        return None
+    return root
+
+def bridgeName(state, bridge):
+    """
+    Return name of the directory of manifests of the bridge (its bridge id, if known)
+    """
+    name = state.get("config", {}).get("bridgeid") or bridge
+    return re.sub("[^A-Za-z0-9._-]", "_", name)
+
+class BackupRepository():
+    """
+    Repository of backups of many bridges with content-addressed storage.
+
+    Each resource of a backup and each light state of a scene is stored once as an
+    object named by the hash of its canonical JSON in directory objects. A backup is
+    a small manifest in directory manifests/<bridge> referencing the objects of all
+    resources of the bridge. Resources identical across bridges and backups (e.g.,
+    rules, schedules or light states of scenes) are thus stored only once, and each
+    backup writes only objects which are not in the repository yet. Volatile values
+    (e.g., the state of lights, see incremental.VOLATILE) are kept in the manifest, so
+    a light switched on or a rule fired since the last backup needs no new object.
+
+    Objects are never removed, the repository can be shared by concurrent backups.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def write(self, bridge, state):
+        """
+        Store the bridge state as a new backup of the bridge with the given name and
+        return the file name of the manifest
+        """
+        self.__written = 0
+        self.__total = 0
+        sections = {}
+        volatile = {}
+        for section, tree in state.items():
+            if section in RESOURCE_SECTIONS:
+                sections[section] = {}
+                for idx, data in tree.items():
+                    if section == "scenes":
+                        data = self.__sceneObject(data)
+                    sections[section][idx] = self.__put(stableData(section, data))
+                    values = volatileData(section, data)
+                    if values is not None:
+                        volatile.setdefault(section, {})[idx] = values
+            else:
+                sections[section] = self.__put(stableData(section, tree))
+                values = volatileData(section, tree)
+                if values is not None:
+                    volatile[section] = values
+        directory = os.path.join(self.directory, MANIFESTS, bridge)
+        os.makedirs(directory, exist_ok=True)
+        manifest = {"type": "manifest", "version": MANIFEST_VERSION, "bridge": bridge,
+                    "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "sections": sections, "volatile": volatile}
+        # names sort by time of the backup
+        name = time.strftime("%Y%m%dT%H%M%S")
+        number = 0
+        while True:
+            filename = os.path.join(directory, name + "-%03d.json" % number)
+            if not os.path.exists(filename):
+                break
+            number += 1
+        # resources keep the order of the bridge, so they are restored in the same order
+        self.__writeFile(filename, json.dumps(manifest, separators=COMPACT))
+        print("   - stored " + str(self.__written) + " new of " + str(self.__total) + " object(s), manifest " + filename)
+        return filename
+
+    def manifests(self, bridge):
+        """
+        Return file names of manifests of the bridge (oldest first)
+        """
+        directory = os.path.join(self.directory, MANIFESTS, bridge)
+        if not os.path.isdir(directory):
+            return []
+        return [os.path.join(directory, name) for name in sorted(os.listdir(directory)) if name.endswith(".json")]
+
+    def latest(self, bridge):
+        """
+        Return file name of the latest manifest of the bridge or None
+        """
+        manifests = self.manifests(bridge)
+        return manifests[-1] if manifests else None
+
+    def load(self, filename):
+        """
+        Rebuild the bridge state from the manifest
+        """
+        with open(filename, "r") as f:
+            manifest = json.load(f)
+        if manifest.get("type") != "manifest" or manifest.get("version") != MANIFEST_VERSION:
+            raise Exception("Invalid backup manifest " + filename)
+        # objects shared by many resources (e.g., light states) are read only once
+        cache = {}
+        state = {}
+        volatile = manifest.get("volatile", {})
+        for section, tree in manifest["sections"].items():
+            if section == "scenes":
+                state[section] = {idx: self.__scene(self.__get(key, cache), cache) for idx, key in tree.items()}
+            elif section in RESOURCE_SECTIONS:
+                values = volatile.get(section, {})
+                state[section] = {idx: self.__withVolatile(self.__get(key, cache), values.get(idx)) for idx, key in tree.items()}
+            else:
+                state[section] = self.__withVolatile(self.__get(tree, cache), volatile.get(section))
+        return state
+
+    def __sceneObject(self, data):
+        if "lightstates" not in data:
+            return data
+        data = dict(data)
+        data["lightstates"] = {lidx: self.__put(ldata) for lidx, ldata in data["lightstates"].items()}
+        return data
+
+    def __scene(self, data, cache):
+        if "lightstates" in data:
+            data["lightstates"] = {lidx: self.__get(key, cache) for lidx, key in data["lightstates"].items()}
+        return data
+
+    def __withVolatile(self, data, volatile):
+        for key, value in (volatile or {}).items():
+            if type(data.get(key)) is dict and type(value) is dict:
+                data[key].update(value)
+            else:
+                data[key] = value
+        return data
+
+    def __path(self, key):
+        return os.path.join(self.directory, OBJECTS, key[0:2], key[2:])
+
+    def __put(self, data):
+        content = canonicalJson(data)
+        key = hashlib.sha1(content.encode("utf-8")).hexdigest()
+        path = self.__path(key)
+        self.__total += 1
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.__writeFile(path, content)
+            self.__written += 1
+        return key
+
+    def __get(self, key, cache):
+        if key not in cache:
+            with open(self.__path(key), "r") as f:
+                cache[key] = f.read()
+        # each resource gets its own copy, since the restore may modify it
+        return json.loads(cache[key])
+
+    def __writeFile(self, filename, content):
+        # write to a temporary file first, so readers never see a partial object
+        fd, tmpname = tempfile.mkstemp(dir=os.path.dirname(filename), prefix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+        os.replace(tmpname, filename)
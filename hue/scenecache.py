@@ -0,0 +1,83 @@
+import os
+from .incremental import BackupChain
+from .repository import BackupRepository, repositoryOf
+from .storage import readBackup, sceneLightstates
+
+class SceneCache():
+    """
+    Light states of scenes from a previous backup.
+
+    Light states are only returned when reading a single scene, so a backup would need
+    one request per scene. However, the bridge updates lastupdated of a scene on each
+    change of the scene, including its light states. Light states of a scene with the
+    same id, lastupdated, version and lights as in the previous backup are thus taken
+    from the previous backup instead of reading them from the bridge again.
+    """
+
+    def __init__(self, state=None):
+        self.__scenes = {}
+        if state is not None:
+            self.add(state)
+
+    @staticmethod
+    def load(filename):
+        """
+        Load the cache from the backup file, a manifest of a backup repository or the
+        latest backup of the backup chain directory (empty cache if there is no readable
+        backup)
+        """
+        try:
+            root = repositoryOf(filename)
+            if root is not None:
+                return SceneCache(BackupRepository(root).load(filename))
+            if os.path.isdir(filename):
+                chain = BackupChain(filename)
+                if not chain.snapshots():
+                    return SceneCache()
+                return SceneCache(chain.load())
+            if not os.path.isfile(filename):
+                return SceneCache()
+            return SceneCache(readBackup(filename))
+        except Exception as e:
+            print("WARNING: cannot use light states of the previous backup " + filename + ": " + str(e))
+            return SceneCache()
+
+    def add(self, state):
+        """
+        Add light states of all scenes of the backup state
+        """
+        for guid, data in state.get("scenes", {}).items():
+            # scenes without lastupdated cannot be checked for changes
+            if data.get("lastupdated") and "lightstates" in data:
+                self.__scenes[guid] = (data["lastupdated"], data.get("version"), sceneLightstates(state, data))
+
+    def lookup(self, guid, data):
+        """
+        Return cached light states of the scene with the given data (as returned by
+        the bridge without light states) or None if the scene changed
+        """
+        cached = self.__scenes.get(guid)
+        if cached is None or not data.get("lastupdated"):
+            return None
+        lastupdated, version, lightstates = cached
+        if lastupdated != data["lastupdated"] or version != data.get("version"):
+            return None
+        if set(lightstates.keys()) != set(data.get("lights", [])):
+            return None
+        return lightstates
+
+    def apply(self, scenes):
+        """
+        Set cached light states of unchanged scenes and return list of ids of scenes
+        whose light states have to be read from the bridge
+        """
+        missing = []
+        for guid, data in scenes.items():
+            lightstates = self.lookup(guid, data)
+            if lightstates is None:
+                missing.append(guid)
+            else:
+                data["lightstates"] = lightstates
+        if len(missing) < len(scenes):
+            print("   - " + str(len(scenes) - len(missing)) + " of " + str(len(scenes)) + " scene(s) unchanged since the previous backup")
+        return missing
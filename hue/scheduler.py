@@ -0,0 +1,146 @@
+import json
+import random
+import threading
+import time
+from .transport import TransportError
+
+# The bridge processes roughly 10 commands per second; beyond that, commands are
+# queued and the bridge starts dropping them or answering with errors.
+MAX_RATE = 10.0
+MIN_RATE = 0.5
+
+# HTTP status codes and Hue API error types which indicate an overloaded bridge
+TRANSIENT_STATUS = [429, 500, 502, 503, 504]
+TRANSIENT_ERRORS = [901]
+# HTTP status codes, with which the request is rejected without being processed
+REJECTED_STATUS = [429, 503]
+
+def isTransient(response, method=None):
+    """
+    Check whether the response to a request with the given method reports an overloaded
+    bridge, so the request can be repeated. Other server errors don't tell, whether the
+    bridge processed the request, so a POST answered by them is not repeated, as it may
+    have created the resource already.
+    """
+    if response.status_code in TRANSIENT_STATUS:
+        return method != "POST" or response.status_code in REJECTED_STATUS
+    if response.status_code != 200:
+        return False
+    try:
+        result = json.loads(response.text)
+    except ValueError:
+        return False
+    if type(result) is list and len(result) > 0 and "error" in result[0]:
+        return result[0]["error"].get("type") in TRANSIENT_ERRORS
+    return False
+
+class TokenBucket():
+    """
+    Thread-safe token bucket limiting the rate of requests.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.__tokens = burst
+        self.__last = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Take one token and return the time in seconds to wait before it is available
+        """
+        with self.__lock:
+            now = time.monotonic()
+            self.__tokens = min(self.burst, self.__tokens + (now - self.__last) * self.rate)
+            self.__last = now
+            # reserve the token even if we have to wait for it, so concurrent callers queue up
+            self.__tokens -= 1
+            return -self.__tokens / self.rate if self.__tokens < 0 else 0
+
+    def acquire(self):
+        """
+        Take one token, waiting until it is available
+        """
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+class WriteScheduler():
+    """
+    Scheduler for write requests (PUT/POST/DELETE) to the bridge.
+
+    Requests are paced by a token bucket, which adapts its rate to the bridge: it is
+    halved each time the bridge reports overload and slowly increased back up to the
+    known command limit of the bridge on success (AIMD). Transient failures are retried
+    with jittered exponential backoff. A POST is only retried if it is certain that it
+    did not reach the bridge, to prevent creating duplicate resources.
+    """
+
+    def __init__(self, transport, max_rate=MAX_RATE, retries=6, backoff=0.5, max_backoff=10.0, timeout=None):
+        self.transport = transport
+        self.max_rate = max_rate
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.bucket = TokenBucket(max_rate, max(1, int(max_rate)))
+        self.retried = 0
+        self.__lock = threading.Lock()
+
+    def request(self, method, resource, data=None):
+        """
+        Execute one write request and return the response, retrying transient failures
+        """
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            try:
+                result = self.transport.request(method, resource, data, self.timeout)
+            except TransportError as e:
+                result = e
+            delay = self.retryDelay(method, resource, attempt, result)
+            if delay is None:
+                return result
+            time.sleep(delay)
+            attempt += 1
+
+    def retryDelay(self, method, resource, attempt, result):
+        """
+        Decide about the result (response or TransportError) of the given attempt of the
+        request: return None if the response is final, otherwise adapt the rate and return
+        the backoff delay before the next attempt. Raises the TransportError of a POST,
+        which may have reached the bridge, and if the request is out of retries.
+        """
+        if isinstance(result, TransportError):
+            if result.sent and method == "POST":
+                raise result
+            reason = str(result)
+        elif isTransient(result, method):
+            reason = "response " + result.text
+        else:
+            self.onSuccess()
+            return None
+        return self.onOverload(method, resource, attempt, reason)
+
+    def onSuccess(self):
+        """
+        Increase the rate after a successful request
+        """
+        with self.__lock:
+            self.bucket.rate = min(self.max_rate, self.bucket.rate + 0.1 * self.max_rate / self.bucket.rate)
+
+    def onOverload(self, method, resource, attempt, reason):
+        """
+        Decrease the rate after a transient failure of the given attempt of the request
+        and return the backoff delay before the next attempt (or raise if out of retries)
+        """
+        with self.__lock:
+            self.bucket.rate = max(MIN_RATE, self.bucket.rate / 2)
+        if attempt >= self.retries:
+            raise Exception("Cannot " + method.lower() + " " + resource + " after " + str(attempt + 1) + " attempts: " + reason)
+        delay = min(self.max_backoff, self.backoff * (2 ** attempt)) * random.uniform(0.5, 1.5)
+        print("   - bridge busy (" + reason + "), retrying " + method + " " + resource + " in " + ("%.1f" % delay) + "s")
+        with self.__lock:
+            self.retried += 1
+        return delay
@@ -0,0 +1,119 @@
+from .address import parseAddress, MATCH_RESOURCE_LINK
+from .incremental import RESOURCE_SECTIONS
+
+# kinds of resources, which can be selected, and their sections
+SELECTABLE = {
+    "light": "lights",
+    "sensor": "sensors",
+    "group": "groups",
+    "scene": "scenes",
+    "schedule": "schedules",
+    "rule": "rules",
+    "resourcelink": "resourcelinks"
+}
+
+def parseSelector(spec):
+    """
+    Parse selector "<kind>:<name>" into tuple of section and name
+    """
+    kind, sep, name = spec.partition(":")
+    if not sep or kind not in SELECTABLE or not name:
+        raise Exception("Invalid selection " + spec + ", expected <kind>:<name> with kind one of " + ", ".join(SELECTABLE.keys()))
+    return SELECTABLE[kind], name
+
+class RestoreSelection():
+    """
+    Selection of resources of a backup to restore, closed over everything they need.
+
+    Resources are selected by kind and name (e.g., group:Kitchen). The selection is
+    extended transitively by all resources referenced by selected ones: lights and
+    sensors of groups, group and lights of scenes, resources addressed by conditions
+    and actions of rules and by commands of schedules (including scenes recalled by
+    them) and resources linked by resource links. A selected group also includes its
+    scenes, so a room is restored completely, while a group only needed by another
+    resource is restored without its scenes.
+
+    Target is the backup as ResourceStore. run() returns the backup reduced to the
+    selection, which can be restored like the complete backup.
+    """
+
+    def __init__(self, target, selectors):
+        self.__target = target
+        self.__selectors = [parseSelector(spec) for spec in selectors]
+        self.selected = {}
+
+    def run(self):
+        """
+        Return the backup state reduced to the selected resources and their dependencies
+        """
+        pending = []
+        for section, name in self.__selectors:
+            ids = self.__target.findAll(section, "name", name)
+            if not ids:
+                raise Exception("No " + section[:-1] + " named " + name + " found in the backup")
+            for idx in ids:
+                pending.append((section, idx))
+                if section == "groups":
+                    pending.extend(("scenes", sid) for sid in self.__scenesOfGroup(idx))
+        while pending:
+            section, idx = pending.pop()
+            if idx in self.selected.setdefault(section, set()):
+                continue
+            data = self.__target.get(section, idx)
+            if data is None:
+                # e.g., group 0 or the daylight sensor, which exist on every bridge
+                continue
+            self.selected[section].add(idx)
+            pending.extend(self.__references(section, data))
+        print("Selected " + ", ".join(str(len(ids)) + " " + section for section, ids in self.selected.items() if ids) + " to restore")
+        state = {}
+        for section, tree in self.__target.state.items():
+            if section in RESOURCE_SECTIONS:
+                ids = self.selected.get(section, set())
+                state[section] = {idx: data for idx, data in tree.items() if idx in ids}
+            else:
+                state[section] = tree
+        return state
+
+    def __scenesOfGroup(self, group):
+        return [sid for sid, data in self.__target.section("scenes").items() if data.get("group") == group]
+
+    def __references(self, section, data):
+        """
+        Return list of (section, id) of resources referenced by the resource
+        """
+        refs = []
+        if section == "groups":
+            refs.extend(("lights", l) for l in data.get("lights", []))
+            refs.extend(("sensors", s) for s in data.get("sensors", []))
+        elif section == "scenes":
+            if "group" in data:
+                refs.append(("groups", data["group"]))
+            refs.extend(("lights", l) for l in data.get("lights", []))
+            refs.extend(("lights", l) for l in data.get("lightstates", {}).keys())
+        elif section == "rules":
+            for condition in data["conditions"]:
+                refs.extend(self.__address(condition["address"], False))
+            for action in data["actions"]:
+                refs.extend(self.__action(action, False))
+        elif section == "schedules":
+            refs.extend(self.__action(data["command"], True))
+        elif section == "resourcelinks":
+            for link in data["links"]:
+                match = MATCH_RESOURCE_LINK.match(link)
+                if match:
+                    refs.append((match.group(1), match.group(2)))
+        return refs
+
+    def __address(self, address, with_api):
+        parsed = parseAddress(address, with_api)
+        if parsed is None or parsed.type == "config":
+            return []
+        return [(parsed.type, parsed.id)]
+
+    def __action(self, action, with_api):
+        refs = self.__address(action["address"], with_api)
+        body = action.get("body")
+        if refs and refs[0][0] == "groups" and type(body) is dict and "scene" in body:
+            refs.append(("scenes", body["scene"]))
+        return refs
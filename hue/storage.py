@@ -0,0 +1,167 @@
+import gzip
+import hashlib
+import json
+import lzma
+from collections.abc import Mapping
+
+COMPACT = (",", ":")
+
+# magic bytes at the start of compressed files
+GZIP_MAGIC = b"\x1f\x8b"
+XZ_MAGIC = b"\xfd7zXZ\x00"
+
+FORMATS = ["json", "gzip", "xz"]
+
+# section of the backup with light states shared by scenes
+LIGHTSTATE_TABLE = "lightstates"
+
+def formatFromFilename(filename):
+    """
+    Return backup format implied by the extension of the file name
+    """
+    if filename.endswith(".gz"):
+        return "gzip"
+    if filename.endswith(".xz") or filename.endswith(".lzma"):
+        return "xz"
+    return "json"
+
+def detectFormat(filename):
+    """
+    Detect format of an existing backup file from its content
+    """
+    with open(filename, "rb") as f:
+        magic = f.read(len(XZ_MAGIC))
+    if magic.startswith(GZIP_MAGIC):
+        return "gzip"
+    if magic == XZ_MAGIC:
+        return "xz"
+    return "json"
+
+def openCompressed(filename, fmt, mode):
+    if fmt == "gzip":
+        return gzip.open(filename, mode + "t", encoding="utf-8", compresslevel=6)
+    if fmt == "xz":
+        return lzma.open(filename, mode + "t", encoding="utf-8")
+    raise Exception("Unknown backup format " + fmt)
+
+def internLightstates(state):
+    """
+    Return copy of the bridge state, where each distinct scene light state is stored
+    only once in the section "lightstates" and scenes reference it by id.
+
+    Scenes created by the Hue app repeat the same few light states over and over,
+    so this makes the backup a lot smaller.
+    """
+    table = {}
+    ids = {}
+    scenes = {}
+    for guid, data in state["scenes"].items():
+        if "lightstates" not in data:
+            scenes[guid] = data
+            continue
+        refs = {}
+        for lidx, lightstate in data["lightstates"].items():
+            key = json.dumps(lightstate, sort_keys=True, separators=COMPACT)
+            if key not in ids:
+                ids[key] = str(len(ids) + 1)
+                table[ids[key]] = lightstate
+            refs[lidx] = ids[key]
+        scenes[guid] = dict(data, lightstates=refs)
+    result = dict(state)
+    result["scenes"] = scenes
+    result[LIGHTSTATE_TABLE] = table
+    return result
+
+def sceneLightstates(state, scene):
+    """
+    Return light states of the scene from the backup state, with or without interned
+    light states
+    """
+    lightstates = scene["lightstates"]
+    if LIGHTSTATE_TABLE not in state:
+        return lightstates
+    table = state[LIGHTSTATE_TABLE]
+    return {lidx: table[ref] if type(ref) is str else ref for lidx, ref in lightstates.items()}
+
+def writeBackup(filename, state, fmt=None):
+    """
+    Write bridge state to the backup file in the given format (default by file name).
+
+    Plain JSON is written indented for readability. Compressed backups are compact JSON
+    with one section of the state per line, written section by section, so the whole
+    backup never needs to be serialized in memory at once.
+    """
+    if fmt is None:
+        fmt = formatFromFilename(filename)
+    if fmt == "json":
+        with open(filename, "w") as f:
+            json.dump(state, f, indent=4)
+        return
+    with openCompressed(filename, fmt, "w") as f:
+        f.write("{\n")
+        sections = list(state.keys())
+        for i, section in enumerate(sections):
+            f.write(json.dumps(section) + ":" + json.dumps(state[section], separators=COMPACT))
+            f.write(",\n" if i < len(sections) - 1 else "\n")
+        f.write("}\n")
+
+def readBackup(filename):
+    """
+    Read backup file in any format, return the bridge state.
+
+    For compressed backups, the state is returned as BackupSections, which decodes
+    each section only when it is first accessed.
+    """
+    fmt = detectFormat(filename)
+    if fmt == "json":
+        with open(filename, "r") as f:
+            return json.load(f)
+    with openCompressed(filename, fmt, "r") as f:
+        return BackupSections(f)
+
+class BackupSections(Mapping):
+    """
+    Read-only bridge state from a compressed backup with lazily decoded sections.
+
+    The backup is decompressed line by line, but the JSON text of all sections is
+    kept in memory, only decoding to objects is deferred until a section is first
+    accessed (the text of a section is dropped once it is decoded). So memory of a
+    restore is about the decompressed text plus the sections actually used, not the
+    size of the compressed file.
+
+    Digest is the SHA-1 hash of the decompressed backup.
+    """
+
+    def __init__(self, lines):
+        self.__sections = []
+        self.__raw = {}
+        self.__decoded = {}
+        digest = hashlib.sha1()
+        decoder = json.JSONDecoder()
+        for line in lines:
+            digest.update(line.encode("utf-8"))
+            line = line.rstrip("\n")
+            if line in ["{", "}"]:
+                continue
+            if line.endswith(","):
+                line = line[:-1]
+            section, end = decoder.raw_decode(line)
+            if type(section) is not str or line[end] != ":":
+                raise Exception("Invalid compressed backup")
+            self.__sections.append(section)
+            self.__raw[section] = line[end + 1:]
+        self.digest = digest.hexdigest()
+
+    def __getitem__(self, section):
+        if section not in self.__decoded:
+            self.__decoded[section] = json.loads(self.__raw.pop(section))
+        return self.__decoded[section]
+
+    def __iter__(self):
+        return iter(self.__sections)
+
+    def __len__(self):
+        return len(self.__sections)
+
+    def __contains__(self, section):
+        return section in self.__decoded or section in self.__raw
@@ -0,0 +1,175 @@
+import threading
+
+# keys, by which resources are indexed, and sections, where they apply
+INDEX_KEYS = {
+    "name": None,
+    "uniqueid": ["lights", "sensors"],
+    "type": None,
+    "scene": ["scenes"]
+}
+
+def sceneKey(guid, data, group=None):
+    """
+    Compute key identifying a scene across bridges: group and name for group scenes
+    (group optionally replaced by the given group id), app data and name for light scenes
+    """
+    if data["type"] == "GroupScene":
+        if group is None:
+            group = data["group"]
+        return group + "%" + data["name"]
+    elif data["type"] == "LightScene":
+        if "data" in data["appdata"]:
+            return data["appdata"]["data"] + "!" + data["name"]
+        else:
+            return guid + "!" + data["name"]
+    else:
+        raise Exception("Unknown scene type in " + str(data))
+
+def fixNames(store, section):
+    """
+    Make names of resources in the section of the store unique by adding a numeric
+    suffix (or prefix, if the name would get too long), the first resource keeps its name
+    """
+    duplicates = {name: 0 for name, ids in store.duplicates(section, "name")}
+    for key, data in store.section(section).items():
+        name = data["name"]
+        if name in duplicates.keys():
+            index = duplicates[name]
+            if index == 0:
+                duplicates[name] = 1
+                continue
+            while True:
+                index = index + 1
+                fixed_name = name + str(index)
+                if len(fixed_name) > 31:
+                    # too long name produced, try to do it differently - put index at the beginning
+                    fixed_name = str(index) + name
+                    fixed_name = fixed_name[0:31]
+                if store.find(section, "name", fixed_name) is None:
+                    store.update(section + "/" + key, {"name": fixed_name})
+                    print("WARNING: fixing duplicate name '" + name + "' to '" + fixed_name + "' for resource '" + section + "/" + key + "'")
+                    break
+            duplicates[name] = index
+
+class ResourceStore():
+    """
+    Bridge state (of the live bridge or of a backup) with indexes of resources.
+
+    Resources of each section are indexed by name, unique id (lights and sensors),
+    type and scene key (scenes), so resources can be looked up without scanning the
+    section. Indexes of a section are built when the section is first looked up.
+    Rules with status "resourcedeleted" (kept by the bridge after deletion) are not
+    indexed.
+
+    Writes to the bridge are applied to the store in place (and to the underlying
+    state), so the store reflects the bridge without reading it again. The store
+    may be updated from several threads.
+    """
+
+    def __init__(self, state):
+        self.state = state
+        self.__indexes = {}
+        self.__lock = threading.RLock()
+
+    def section(self, section):
+        """
+        Return resources of the section as dictionary from id to data
+        """
+        return self.state.get(section, {})
+
+    def get(self, section, idx):
+        return self.section(section).get(idx)
+
+    def find(self, section, key, value):
+        """
+        Return id of the resource with the given value of the key (the last one of
+        duplicates) or None
+        """
+        ids = self.__index(section, key).get(value)
+        return ids[-1] if ids else None
+
+    def findAll(self, section, key, value):
+        """
+        Return ids of all resources with the given value of the key
+        """
+        return list(self.__index(section, key).get(value, []))
+
+    def duplicates(self, section, key):
+        """
+        Return list of values of the key shared by multiple resources with their ids
+        """
+        return [(value, list(ids)) for value, ids in self.__index(section, key).items() if len(ids) > 1]
+
+    def update(self, resource, body):
+        """
+        Apply successful PUT of the body to "section/id" (nested objects are merged)
+        """
+        parts = resource.split("/")
+        with self.__lock:
+            data = self.get(parts[0], parts[1]) if len(parts) > 1 else None
+            if data is None:
+                return
+            self.__unindex(parts[0], parts[1])
+            node = data
+            for p in parts[2:]:
+                node = node.setdefault(p, {})
+            for k, v in body.items():
+                if type(v) is dict and type(node.get(k)) is dict:
+                    node[k] = dict(node[k], **v)
+                else:
+                    node[k] = v
+            self.__add(parts[0], parts[1], data)
+
+    def create(self, section, idx, body):
+        """
+        Apply successful POST of the body creating resource with the given id
+        """
+        with self.__lock:
+            data = dict(body)
+            self.state.setdefault(section, {})[idx] = data
+            self.__add(section, idx, data)
+
+    def delete(self, resource):
+        """
+        Apply successful DELETE of "section/id"
+        """
+        parts = resource.split("/")
+        with self.__lock:
+            if len(parts) != 2 or self.get(parts[0], parts[1]) is None:
+                return
+            self.__unindex(parts[0], parts[1])
+            del self.state[parts[0]][parts[1]]
+
+    def __index(self, section, key):
+        with self.__lock:
+            if section not in self.__indexes:
+                self.__indexes[section] = {k: {} for k, sections in INDEX_KEYS.items() if sections is None or section in sections}
+                for idx, data in self.section(section).items():
+                    self.__add(section, idx, data)
+            return self.__indexes[section].get(key, {})
+
+    def __values(self, section, idx, data):
+        if section == "rules" and data.get("status") == "resourcedeleted":
+            return {}
+        values = {}
+        for key in self.__indexes[section].keys():
+            if key == "scene":
+                values[key] = sceneKey(idx, data)
+            elif key in data:
+                values[key] = data[key]
+        return values
+
+    def __add(self, section, idx, data):
+        if section not in self.__indexes:
+            return
+        for key, value in self.__values(section, idx, data).items():
+            self.__indexes[section][key].setdefault(value, []).append(idx)
+
+    def __unindex(self, section, idx):
+        if section not in self.__indexes:
+            return
+        for key, value in self.__values(section, idx, self.state[section][idx]).items():
+            ids = self.__indexes[section][key][value]
+            ids.remove(idx)
+            if not ids:
+                del self.__indexes[section][key][value]
@@ -0,0 +1,121 @@
+import copy
+import random
+
+# small palette of light states, so scenes share identical light states like real Hue app scenes do
+PALETTE = [
+    {"on": True, "bri": 254, "ct": 366},
+    {"on": True, "bri": 254, "ct": 233},
+    {"on": True, "bri": 144, "ct": 447},
+    {"on": True, "bri": 77, "xy": [0.5612, 0.4042]},
+    {"on": True, "bri": 203, "xy": [0.4449, 0.4066]},
+    {"on": True, "bri": 1, "ct": 447},
+    {"on": False}
+]
+SCENE_CODES = ["f4d5b", "a7c2e", "b93d1", "c0e7a", "d8f16", "e25b4", "fa831"]
+ROOM_CLASSES = ["Living room", "Kitchen", "Bedroom", "Bathroom", "Office", "Hallway", "Dining"]
+
+def uniqueId(rnd, suffix):
+    return "00:17:88:01:" + ":".join("%02x" % rnd.randrange(256) for i in range(4)) + "-" + suffix
+
+def generateConfig(lights=30, rooms=6, scenes_per_room=4, switches=6, schedules=3, seed=1):
+    """
+    Generate synthetic bridge state (in the format of the bridge, including scene light
+    states, like a backup) with the given number of lights, rooms with scenes, switches
+    with one rule per button and a resource link each, and wake-up schedules
+    """
+    rnd = random.Random(seed)
+    state = {"lights": {}, "groups": {}, "scenes": {}, "rules": {}, "schedules": {},
+             "sensors": {}, "resourcelinks": {}, "config": {"name": "Synthetic bridge", "apiversion": "1.50.0"}}
+    for i in range(1, lights + 1):
+        state["lights"][str(i)] = {
+            "name": "Light " + str(i), "type": "Extended color light", "modelid": "LCT015",
+            "manufacturername": "Signify Netherlands B.V.", "uniqueid": uniqueId(rnd, "0b"),
+            "swversion": "1.50.2_r30933", "state": {"on": False, "bri": 254, "reachable": True}
+        }
+    state["sensors"]["1"] = {"name": "Daylight", "type": "Daylight", "modelid": "PHDL00", "manufacturername": "Signify Netherlands B.V.",
+                             "swversion": "1.0", "config": {"on": True, "configured": True, "sunriseoffset": 30, "sunsetoffset": -30},
+                             "state": {"daylight": None, "lastupdated": "none"}}
+    rooms = max(1, min(rooms, lights))
+    nextsensor = 2
+    nextrule = 1
+    for r in range(1, rooms + 1):
+        room_lights = [str(i) for i in range(r, lights + 1, rooms)]
+        state["groups"][str(r)] = {"name": "Room " + str(r), "lights": room_lights, "sensors": [], "type": "Room",
+                                   "class": ROOM_CLASSES[r % len(ROOM_CLASSES)], "recycle": False,
+                                   "action": {"on": False}, "state": {"all_on": False, "any_on": False}}
+        for n in range(scenes_per_room):
+            guid = "%015x" % rnd.randrange(16 ** 15)
+            state["scenes"][guid] = {
+                "name": "Scene " + str(n) + " of room " + str(r), "type": "GroupScene", "group": str(r),
+                "lights": room_lights, "owner": "synthetic", "recycle": False, "locked": False,
+                "appdata": {"version": 1, "data": SCENE_CODES[n % len(SCENE_CODES)] + "_r%02d_d%02d" % (r, n % 100)},
+                "picture": "", "lastupdated": "2021-01-%02dT10:00:00" % (1 + n % 28), "version": 2,
+                "lightstates": {l: dict(PALETTE[(n + int(l)) % len(PALETTE)]) for l in room_lights}
+            }
+    room_scenes = {}
+    for guid, scene in state["scenes"].items():
+        room_scenes.setdefault(scene["group"], []).append(guid)
+    for w in range(switches):
+        room = str(1 + w % rooms)
+        sid = str(nextsensor)
+        nextsensor += 1
+        status = str(nextsensor)
+        nextsensor += 1
+        state["sensors"][sid] = {"name": "Switch " + str(w), "type": "ZLLSwitch", "modelid": "RWL021",
+                                 "manufacturername": "Signify Netherlands B.V.", "uniqueid": uniqueId(rnd, "02-fc00"),
+                                 "swversion": "6.1.1.28573", "config": {"on": True, "battery": 100, "reachable": True},
+                                 "state": {"buttonevent": 1002, "lastupdated": "2021-01-01T10:00:00"}}
+        state["sensors"][status] = {"name": "Switch " + str(w) + " status", "type": "CLIPGenericStatus", "modelid": "RWL021",
+                                    "manufacturername": "Philips", "uniqueid": "switch-status-" + str(w), "swversion": "1.0",
+                                    "recycle": True, "config": {"on": True, "reachable": True}, "state": {"status": 0}}
+        links = ["/sensors/" + sid, "/sensors/" + status]
+        scenes = room_scenes.get(room, [])
+        for button in range(4):
+            rid = str(nextrule)
+            nextrule += 1
+            event = str((button + 1) * 1000 + 2)
+            if button == 3 or not scenes:
+                action = {"address": "/groups/" + room + "/action", "method": "PUT", "body": {"on": False}}
+            else:
+                action = {"address": "/groups/" + room + "/action", "method": "PUT", "body": {"scene": scenes[button % len(scenes)]}}
+            state["rules"][rid] = {
+                "name": "Switch " + str(w) + " button " + str(button), "owner": "synthetic", "status": "enabled", "recycle": True,
+                "conditions": [{"address": "/sensors/" + sid + "/state/buttonevent", "operator": "eq", "value": event},
+                               {"address": "/sensors/" + sid + "/state/lastupdated", "operator": "dx"}],
+                "actions": [action, {"address": "/sensors/" + status + "/state", "method": "PUT", "body": {"status": button}}]
+            }
+            links.append("/rules/" + rid)
+        state["resourcelinks"][str(w + 1)] = {"name": "Switch " + str(w) + " link", "description": "Switch " + str(w),
+                                              "type": "Link", "classid": 10010, "owner": "synthetic", "recycle": False,
+                                              "links": links}
+    for s in range(1, schedules + 1):
+        room = str(1 + s % rooms)
+        state["schedules"][str(s)] = {"name": "Wake up " + str(s), "description": "Wake up in room " + room,
+                                      "command": {"address": "/api/synthetic/groups/" + room + "/action", "method": "PUT",
+                                                  "body": {"on": True, "bri": 254, "transitiontime": 600}},
+                                      "localtime": "W124/T0%d:30:00" % (5 + s % 4), "time": "W124/T0%d:30:00" % (4 + s % 4),
+                                      "created": "2021-01-01T10:00:00", "status": "enabled", "autodelete": False, "recycle": False}
+    return state
+
+def newBridgeState(state, seed=2):
+    """
+    Derive the state of a new bridge from the given state: the same lights and
+    accessories connected under different ids and without any names or configuration
+    """
+    rnd = random.Random(seed)
+    state = copy.deepcopy(state)
+    result = {"lights": {}, "groups": {}, "scenes": {}, "rules": {}, "schedules": {},
+              "sensors": {}, "resourcelinks": {}, "config": state["config"]}
+    lights = list(state["lights"].values())
+    rnd.shuffle(lights)
+    for i, light in enumerate(lights):
+        light["name"] = "Hue color lamp " + str(i + 1)
+        result["lights"][str(i + 1)] = light
+    result["sensors"]["1"] = state["sensors"]["1"]
+    n = 2
+    for sensor in state["sensors"].values():
+        if sensor["type"] in ["ZLLSwitch", "ZLLPresence", "ZLLTemperature", "ZLLLightLevel"]:
+            sensor["name"] = "Hue dimmer switch " + str(n)
+            result["sensors"][str(n)] = sensor
+            n += 1
+    return result
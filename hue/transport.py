@@ -0,0 +1,254 @@
+import http.client
+import json
+import select
+import threading
+import time
+import urllib.parse
+
+class TransportError(Exception):
+    """
+    Error communicating with the bridge.
+
+    The attribute sent is False if the request certainly did not reach the bridge
+    (so it can be safely repeated even if it is not idempotent).
+    """
+
+    def __init__(self, msg, sent):
+        super().__init__(msg)
+        self.sent = sent
+
+class Response():
+    """
+    Response of the bridge with status code and body
+    """
+
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+        self.encoding = "utf-8"
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding)
+
+def bridgeUrl(bridge, apiKey):
+    """
+    Return base URL of the API of the bridge
+    """
+    return "http://" + bridge + "/api/" + apiKey
+
+class Transport():
+    """
+    Transport of requests to a single Hue bridge.
+
+    Subclasses implement send(), which executes one request and returns an object
+    with status_code, content and text (like Response) or raises TransportError.
+
+    Hooks are called after every request with method, resource, request data, response
+    (None if the request failed), start and end time (time.perf_counter()). Without
+    hooks no timing is done at all.
+
+    If limit (a threading.BoundedSemaphore) is set, it is shared by the transports of
+    several bridges and caps the number of concurrent requests over all of them.
+    """
+
+    def __init__(self):
+        self.hooks = []
+        self.limit = None
+
+    def request(self, method, resource, data=None, timeout=None):
+        """
+        Execute one request against the bridge and return the response
+        """
+        if self.limit is None:
+            return self.__timed(method, resource, data, timeout)
+        with self.limit:
+            return self.__timed(method, resource, data, timeout)
+
+    def __timed(self, method, resource, data, timeout):
+        if not self.hooks:
+            return self.send(method, resource, data, timeout)
+        response = None
+        start = time.perf_counter()
+        try:
+            response = self.send(method, resource, data, timeout)
+            return response
+        finally:
+            end = time.perf_counter()
+            for hook in self.hooks:
+                hook(method, resource, data, response, start, end)
+
+    def send(self, method, resource, data, timeout):
+        raise NotImplementedError()
+
+    def stats(self):
+        """
+        Return connection reuse counters as a dictionary with number of requests,
+        connections opened and requests served over an already open connection
+        """
+        return {"requests": 0, "connections": 0, "reused": 0}
+
+    def close(self):
+        pass
+
+class HttpTransport(Transport):
+    """
+    HTTP transport using http.client from the standard library.
+
+    Keep-alive connections to the bridge are pooled and reused for the whole lifetime
+    of the transport instead of being reopened for every request (the embedded HTTP
+    stack of the bridge is slow at accepting new connections). Connections closed
+    by the bridge while idle are detected before reuse.
+    """
+
+    def __init__(self, urlbase, pool_size=4, timeout=10):
+        super().__init__()
+        url = urllib.parse.urlsplit(urlbase)
+        self.timeout = timeout
+        self.__connectionClass = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+        self.__host = url.netloc
+        self.__path = url.path.rstrip("/")
+        self.__pool_size = pool_size
+        self.__idle = []
+        self.__lock = threading.Lock()
+        self.__requests = 0
+        self.__connections = 0
+
+    def send(self, method, resource, data, timeout):
+        if timeout is None:
+            timeout = self.timeout
+        body = None
+        headers = {}
+        if data is not None:
+            body = json.dumps(data).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        while True:
+            conn, reused = self.__acquire(timeout)
+            try:
+                conn.request(method, self.__path + "/" + resource, body, headers)
+                response = conn.getresponse()
+                content = response.read()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError) as e:
+                conn.close()
+                if reused and method != "POST":
+                    # connection was closed by the bridge in the meantime, repeat on a new one
+                    continue
+                raise TransportError("Cannot " + method + " " + resource + ": " + str(e), True)
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                raise TransportError("Cannot " + method + " " + resource + ": " + str(e), True)
+            with self.__lock:
+                self.__requests += 1
+            if response.will_close:
+                conn.close()
+            else:
+                self.__release(conn)
+            return Response(response.status, content)
+
+    def __acquire(self, timeout):
+        """
+        Return tuple of an open connection and flag whether it was used before
+        """
+        while True:
+            with self.__lock:
+                conn = self.__idle.pop() if self.__idle else None
+            if conn is None:
+                break
+            # an idle connection is readable only if the bridge closed it
+            if conn.sock is not None and not select.select([conn.sock], [], [], 0)[0]:
+                conn.sock.settimeout(timeout)
+                return conn, True
+            conn.close()
+        conn = self.__connectionClass(self.__host, timeout=timeout)
+        try:
+            conn.connect()
+        except OSError as e:
+            conn.close()
+            raise TransportError("Cannot connect to bridge: " + str(e), False)
+        with self.__lock:
+            self.__connections += 1
+        return conn, False
+
+    def __release(self, conn):
+        with self.__lock:
+            if len(self.__idle) < self.__pool_size:
+                self.__idle.append(conn)
+                return
+        conn.close()
+
+    def stats(self):
+        with self.__lock:
+            return {
+                "requests": self.__requests,
+                "connections": self.__connections,
+                "reused": self.__requests - self.__connections
+            }
+
+    def close(self):
+        with self.__lock:
+            idle = self.__idle
+            self.__idle = []
+        for conn in idle:
+            conn.close()
+
+class RequestsTransport(Transport):
+    """
+    HTTP transport using the requests package (only imported when this transport is used).
+
+    All calls go through one pooled keep-alive session, so the TCP connection to the
+    bridge is reused for the whole lifetime of the transport.
+    """
+
+    def __init__(self, urlbase, pool_size=4, timeout=10):
+        super().__init__()
+        import requests
+        self.__requests = requests
+        self.urlbase = urlbase
+        self.timeout = timeout
+        self.__session = requests.Session()
+        self.__adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.__session.mount("http://", self.__adapter)
+        self.__session.mount("https://", self.__adapter)
+
+    def send(self, method, resource, data, timeout):
+        url = self.urlbase + "/" + resource
+        if timeout is None:
+            timeout = self.timeout
+        try:
+            if data is None:
+                return self.__session.request(method, url, timeout=timeout)
+            return self.__session.request(method, url, json=data, timeout=timeout)
+        except self.__requests.exceptions.ConnectTimeout as e:
+            raise TransportError("Cannot connect to bridge: " + str(e), False)
+        except self.__requests.exceptions.RequestException as e:
+            raise TransportError("Cannot " + method + " " + resource + ": " + str(e), True)
+
+    def stats(self):
+        pools = self.__adapter.poolmanager.pools
+        num_requests = 0
+        connections = 0
+        for key in pools.keys():
+            pool = pools[key]
+            num_requests += pool.num_requests
+            connections += pool.num_connections
+        return {
+            "requests": num_requests,
+            "connections": connections,
+            "reused": num_requests - connections
+        }
+
+    def close(self):
+        self.__session.close()
+
+BACKENDS = {
+    "http": HttpTransport,
+    "requests": RequestsTransport
+}
+
+def createTransport(backend, urlbase, pool_size=4, timeout=10):
+    """
+    Create transport using the HTTP backend with the given name (see BACKENDS)
+    """
+    if backend not in BACKENDS:
+        raise Exception("Unknown transport " + backend + ", use one of " + ", ".join(BACKENDS.keys()))
+    return BACKENDS[backend](urlbase, pool_size, timeout)
@@ -0,0 +1,208 @@
+import json
+from .address import AddressTranslator
+from .storage import sceneLightstates
+
+# sections in the order of the restore
+VERIFIED_SECTIONS = ["lights", "sensors", "groups", "scenes", "schedules", "rules", "resourcelinks"]
+
+# fields with addresses of other resources
+ADDRESS_FIELDS = [("rules", "conditions"), ("rules", "actions"), ("schedules", "command"), ("resourcelinks", "links")]
+
+# sensor configuration restored by the planner
+SENSOR_CONFIG = ["on", "sunriseoffset", "sunsetoffset"]
+
+class VerificationReport():
+    """
+    Differences between the bridge and the backup per resource type.
+
+    For each section, the report lists the resources of the backup, which were not
+    restored (not mapped to the bridge, e.g., missing lights), which are missing in the
+    bridge although they were restored, and the differing fields of restored resources
+    with expected (backup translated to ids of the bridge) and actual values.
+    """
+
+    def __init__(self):
+        self.sections = {section: {"verified": 0, "not_restored": [], "missing": [], "different": []} for section in VERIFIED_SECTIONS}
+
+    def problems(self):
+        """
+        Return number of missing resources and differing fields
+        """
+        return sum(len(data["missing"]) + len(data["different"]) for data in self.sections.values())
+
+    def print(self):
+        """
+        Print summary per resource type and all differences
+        """
+        print("Verification of the bridge against the backup:")
+        for section, data in self.sections.items():
+            line = "   - " + section + ": " + str(data["verified"]) + " verified"
+            for key in ["not_restored", "missing", "different"]:
+                if data[key]:
+                    line += ", " + str(len(data[key])) + " " + key.replace("_", " ")
+            print(line)
+            for name in data["missing"]:
+                print("     missing " + name)
+            for diff in data["different"]:
+                print("     " + diff["resource"] + " (" + diff["name"] + ") " + diff["field"] + ": expected " +
+                      str(diff["expected"]) + ", found " + str(diff["actual"]))
+                if "actual_backup" in diff:
+                    print("       (with ids of the backup: " + str(diff["actual_backup"]) + ")")
+        if self.problems() == 0:
+            print("Bridge matches the backup")
+        else:
+            print(str(self.problems()) + " difference(s) found")
+
+    def write(self, filename):
+        """
+        Write the report as JSON into the file
+        """
+        with open(filename, "w") as f:
+            json.dump({"problems": self.problems(), "sections": self.sections}, f, indent=2)
+
+class RestoreVerifier():
+    """
+    Comparison of the bridge state with the backup after a restore.
+
+    Current is the ResourceStore of the bridge (with light states of the restored scenes),
+    target the ResourceStore of the backup and maps the mapping of ids from the backup
+    to the bridge per resource type as used by the restore (see RestorePlanner.maps()).
+    Only properties written by the restore are compared, ids in them are translated to
+    the bridge using the maps.
+    """
+
+    def __init__(self, current, target, maps, apiKey):
+        self.__current = current
+        self.__target = target
+        self.__maps = maps
+        self.__addresses = AddressTranslator(maps, apiKey)
+        self.__backupAddresses = self.__addresses.reverse()
+        self.report = VerificationReport()
+        # expected values of compared fields per section
+        self.__expect = {
+            "lights": self.__expectLights,
+            "sensors": self.__expectSensors,
+            "groups": self.__expectGroups,
+            "scenes": self.__expectScenes,
+            "schedules": self.__expectSchedules,
+            "rules": self.__expectRules,
+            "resourcelinks": self.__expectResourcelinks
+        }
+
+    def scenes(self):
+        """
+        Return ids of restored scenes in the bridge, whose light states are to be compared
+        """
+        s = self.__current.section("scenes")
+        return [sid for sid in self.__maps["scenes"].values() if sid in s]
+
+    def run(self):
+        """
+        Compare all sections and return the VerificationReport
+        """
+        for section in VERIFIED_SECTIONS:
+            s = self.__current.section(section)
+            t = self.__target.section(section)
+            expect = self.__expect[section]
+            result = self.report.sections[section]
+            for index, data in t.items():
+                if section == "rules" and data["status"] == "resourcedeleted":
+                    continue
+                if (section == "lights" or section == "sensors") and "uniqueid" not in data:
+                    # e.g., the daylight sensor, which is not restored
+                    continue
+                name = data["name"]
+                idx = self.__maps[section].get(index)
+                if idx is None:
+                    result["not_restored"].append(name)
+                    continue
+                if idx not in s:
+                    result["missing"].append(name)
+                    continue
+                result["verified"] += 1
+                for field, expected in expect(index, data).items():
+                    actual = self.__actual(s[idx], field)
+                    if actual != expected:
+                        diff = {"resource": section + "/" + idx, "name": name, "field": field,
+                                "expected": expected, "actual": actual}
+                        if (section, field) in ADDRESS_FIELDS and actual is not None:
+                            diff["actual_backup"] = self.__toBackup(section, field, actual)
+                        result["different"].append(diff)
+        return self.report
+
+    def __toBackup(self, section, field, actual):
+        # addresses of the bridge translated to ids of the backup, None if not from the backup
+        addresses = self.__backupAddresses
+        if field == "conditions":
+            return [dict(c, address=addresses.translate(c["address"], False)[0]) for c in actual]
+        if field == "actions":
+            return [addresses.translateAction(a, False)[0] for a in actual]
+        if field == "command":
+            return addresses.translateAction(actual, True)[0]
+        return [addresses.translate(l, False)[0] for l in actual]
+
+    def __actual(self, data, field):
+        # fields are paths like "config/on" or "lightstates/3/bri"
+        for key in field.split("/"):
+            if type(data) is not dict or key not in data:
+                return None
+            data = data[key]
+        if type(data) is list and field in ["lights", "sensors", "links"]:
+            return sorted(data)
+        return data
+
+    def __mapIds(self, section, ids):
+        return sorted(self.__maps[section][idx] for idx in ids if idx in self.__maps[section])
+
+    def __expectLights(self, index, data):
+        return {"name": data["name"]}
+
+    def __expectSensors(self, index, data):
+        expected = {"name": data["name"]}
+        for key in SENSOR_CONFIG:
+            if key in data.get("config", {}):
+                expected["config/" + key] = data["config"][key]
+        return expected
+
+    def __expectGroups(self, index, data):
+        expected = {"name": data["name"], "type": data["type"], "lights": self.__mapIds("lights", data["lights"]),
+                    "sensors": self.__mapIds("sensors", data["sensors"])}
+        if "class" in data:
+            expected["class"] = data["class"]
+        return expected
+
+    def __expectScenes(self, index, data):
+        expected = {"name": data["name"], "type": data["type"]}
+        if "group" in data:
+            expected["group"] = self.__maps["groups"].get(data["group"])
+        elif "lights" in data:
+            expected["lights"] = self.__mapIds("lights", data["lights"])
+        if "lightstates" in data:
+            # only restored properties of light states are compared, the bridge may add others
+            lights = self.__maps["lights"]
+            for lidx, ldata in sceneLightstates(self.__target.state, data).items():
+                if lidx in lights:
+                    for key, value in ldata.items():
+                        expected["lightstates/" + lights[lidx] + "/" + key] = value
+        return expected
+
+    def __expectSchedules(self, index, data):
+        command, refs = self.__addresses.translateAction(data["command"], True)
+        return {"name": data["name"], "description": data["description"], "command": command,
+                "localtime": data["localtime"], "status": data["status"]}
+
+    def __expectRules(self, index, data):
+        conditions = []
+        for c in data["conditions"]:
+            address, parsed = self.__addresses.translate(c["address"], False)
+            c = dict(c)
+            c["address"] = address
+            conditions.append(c)
+        actions = [self.__addresses.translateAction(a, False)[0] for a in data["actions"]]
+        return {"name": data["name"], "status": data["status"], "conditions": conditions, "actions": actions}
+
+    def __expectResourcelinks(self, index, data):
+        # links, which could not be translated, are not restored
+        links = [self.__addresses.translate(l, False)[0] for l in data["links"]]
+        return {"name": data["name"], "description": data["description"], "classid": data["classid"],
+                "links": sorted(l for l in links if l is not None)}
@@ -0,0 +1,315 @@
+import json
+import os
+from .incremental import BackupChain
+from .planner import RestorePlanner, ResourceLinkCleanup, completeScene
+from .executor import DependencyGraph
+from .profile import phase
+from .journal import RestoreJournal, backupFingerprint, inDoubtPosts, existingIds
+from .storage import writeBackup, readBackup, internLightstates
+from .store import ResourceStore, fixNames
+from .scenecache import SceneCache
+from .repository import BackupRepository, repositoryOf, bridgeName
+from .selection import RestoreSelection
+from .verify import RestoreVerifier
+from .catalog import BackupCatalog
+
+# Backup and restore are written once as steps (generators), which yield requests to
+# the bridge and to files as tuples of the request and its arguments. HueBackup runs
+# the requests as blocking calls, AsyncHueBackup as coroutines on the event loop, and
+# sends the result back to the steps (or throws the error into them).
+
+# read the bridge state on first use, result is its ResourceStore
+LOAD = "load"
+# read the bridge state again, result is its ResourceStore
+REFRESH = "refresh"
+# read light states of the given scenes into the bridge state
+FETCH_LIGHTSTATES = "fetchLightstates"
+# execute the dependency graph except operations done using the journal, result is the PlanExecutor
+EXECUTE = "execute"
+# delete the resource from the bridge
+DELETE = "delete"
+# call the (blocking) function with the arguments, result is its result
+CALL = "call"
+
+def readResult(response):
+    """
+    Return data of a successful GET response of the bridge
+    """
+    if response.status_code != 200:
+        raise Exception("Cannot read bridge data: status code " + str(response.status_code))
+    response.encoding = 'utf-8'
+    data = json.loads(response.text)
+    if type(data) is list and "error" in data[0].keys():
+        raise Exception("Cannot read bridge data: " + data[0]["error"]["description"])
+    return data
+
+def writeResult(method, resource, data, response):
+    """
+    Check the response of the bridge to a write request, return id of the created
+    resource for POST
+    """
+    if response.status_code != 200:
+        if data is not None:
+            print("Data:", data)
+        raise Exception("Cannot " + method.lower() + " " + resource + ": " + response.text)
+    result = json.loads(response.text)[0];
+    if not "success" in result:
+        if data is not None:
+            print("Data:", data)
+        raise Exception("Cannot " + method.lower() + " " + resource + ": " + response.text)
+    if method != "POST":
+        return None
+    if "id" in result["success"]:
+        return result["success"]["id"]
+    elif "address" in result["success"]:
+        return result["success"]["address"]
+    else:
+        raise Exception("Unknown success response: " + str(result))
+
+def applyWrite(store, method, resource, data, response):
+    """
+    Check the response of the bridge to a write request and apply the write to the
+    ResourceStore of the bridge, return id of the created resource for POST
+    """
+    idx = writeResult(method, resource, data, response)
+    if method == "PUT":
+        store.update(resource, data)
+    elif method == "POST":
+        store.create(resource, idx, data)
+    else:
+        store.delete(resource)
+    return idx
+
+def addLightstates(current, guids, scenes):
+    """
+    Add light states of scenes read from the bridge (in the order of guids) to the
+    bridge state
+    """
+    for guid, data in zip(guids, scenes):
+        current["scenes"][guid]["lightstates"] = data["lightstates"]
+
+def loadBackup(filename, point=None):
+    """
+    Load the backup from a file (plain or compressed), a manifest of a backup repository
+    or from the given point of a chain of incremental backups in a directory
+    """
+    if os.path.isdir(filename):
+        return BackupChain(filename).load(point)
+    root = repositoryOf(filename)
+    if root is not None:
+        return BackupRepository(root).load(filename)
+    return readBackup(filename)
+
+def dropLinks(maps, dropped):
+    """
+    Return maps without resource links deleted by the cleanup after the restore
+    """
+    maps = dict(maps)
+    maps["resourcelinks"] = {index: idx for index, idx in maps["resourcelinks"].items() if "resourcelinks/" + idx not in dropped}
+    return maps
+
+def snapshotNumber(name):
+    """
+    Return position of the snapshot file written by BackupChain.write() in the chain
+    """
+    return int(name.split("-")[0])
+
+def catalogBackup(filename, bridge, state, location, point=None):
+    """
+    Add the backup of the bridge to the catalog in the file
+    """
+    catalog = BackupCatalog(filename)
+    try:
+        catalog.add(bridge, state, location, point)
+        print("   - added to catalog " + filename)
+    finally:
+        catalog.close()
+
+def existingScenes(current, target):
+    """
+    Return ids of scenes of the bridge without light states, which may be updated by
+    the restore of the target (light states are needed to skip unchanged scenes)
+    """
+    names = set(data["name"] for data in target["scenes"].values())
+    return [guid for guid, data in current["scenes"].items() if data["name"] in names and "lightstates" not in data]
+
+def sceneCompletion(deferred, lightstates, map_light):
+    """
+    Return the check before an operation of PlanExecutor, which completes deferred
+    scene operations (operation number to scene id and its state in the bridge) with
+    light states from lightstates (scene ids to futures of the scene data), waiting for
+    them if needed. Returns False for scenes, which are already up to date.
+    """
+    def before(op):
+        if op.number not in deferred:
+            return True
+        guid, old = deferred.pop(op.number)
+        return completeScene(op, old, lightstates[guid].result()["lightstates"], map_light)
+    return before
+
+def printErrors(errors):
+    if len(errors) > 0:
+        print("ERRORS FOUND:")
+        for s in errors:
+            print(" - " + s)
+
+def printStats(stats, retried):
+    """
+    Print connection reuse statistics of the transport and number of retried writes
+    """
+    print("Used " + str(stats["connections"]) + " connection(s) for " + str(stats["requests"]) +
+          " request(s), " + str(stats["reused"]) + " request(s) reused an open connection")
+    if retried > 0:
+        print("Retried " + str(retried) + " write request(s) on a busy bridge")
+
+def backupSteps(bridge, filename, incremental=False, full_every=7, fmt=None, intern=False, previous=None, cache=True, repository=False, catalog=None):
+    """
+    Steps of the backup of the bridge with the given name (see HueBackup.backup())
+    """
+    store = yield (LOAD,)
+    current = store.state
+    print("Fixing duplicate names")
+    for section in ["groups", "rules", "schedules", "resourcelinks"]:
+        fixNames(store, section)
+
+    print("Determining light states for scenes")
+    guids = list(current["scenes"].keys())
+    if cache:
+        if previous is None and repository:
+            previous = BackupRepository(filename).latest(bridgeName(current, bridge))
+        guids = (yield (CALL, SceneCache.load, previous or filename)).apply(current["scenes"])
+    with phase("fetchLightstates"):
+        yield (FETCH_LIGHTSTATES, guids)
+
+    print("Backing up Hue bridge data to " + filename)
+    location, point = filename, None
+    if repository:
+        location = yield (CALL, BackupRepository(filename).write, bridgeName(current, bridge), current)
+    elif incremental:
+        point = snapshotNumber((yield (CALL, BackupChain(filename).write, current, full_every)))
+    else:
+        data = (yield (CALL, internLightstates, current)) if intern else current
+        yield (CALL, writeBackup, filename, data, fmt)
+    if catalog:
+        yield (CALL, catalogBackup, catalog, bridgeName(current, bridge), current, location, point)
+
+def restoreSteps(bridge, apiKey, filename, point=None, dry_run=False, resume=False, only=None, verify=False, max_rate=None, errors=None):
+    """
+    Steps of the restore into the bridge with the given name and API key (see
+    HueBackup.restore()), max_rate is the rate of writes printed with the plan, errors
+    the list of errors of the bridge to add errors of the restore to. Returns the
+    VerificationReport if verify is set.
+
+    Everything except printing and bookkeeping (files, the journal, selection, planning
+    and verification) is a request, so it doesn't block the event loop of AsyncHueBackup.
+    """
+    print("Loading Hue bridge data from " + filename)
+    state = yield (CALL, loadBackup, filename, point)
+    if only:
+        state = yield (CALL, RestoreSelection(ResourceStore(state), only).run)
+    journal = RestoreJournal(filename.rstrip(os.sep) + ".journal")
+    return (yield from restoreStateSteps(bridge, apiKey, state, journal, dry_run, resume, verify, max_rate, errors))
+
+def migrateSteps(source, bridge, apiKey, journal, dry_run=False, resume=False, verify=False, max_rate=None, errors=None):
+    """
+    Steps of the migration of the source bridge (a HueBackup) into the bridge with the
+    given name and API key (see HueBackup.migrate()) with the journal in the given file,
+    other arguments like for restoreSteps().
+
+    The state of the source is restored like a backup, except that light states of
+    scenes are read from the source in the background while the plan is executed.
+    Scenes are planned without them and completed as soon as they arrive.
+    """
+    print("Reading Hue bridge data from " + source.bridge)
+    state = yield (CALL, source.readState)
+    lightstates = None
+    if not dry_run:
+        lightstates = yield (CALL, source.prefetchLightstates, list(state["scenes"].keys()))
+    return (yield from restoreStateSteps(bridge, apiKey, state, RestoreJournal(journal), dry_run, resume, verify, max_rate, errors,
+                                         True, lightstates))
+
+def restoreStateSteps(bridge, apiKey, state, journal, dry_run=False, resume=False, verify=False, max_rate=None, errors=None,
+                      defer=False, lightstates=None):
+    """
+    Steps of the restore of the bridge state (of a backup or of the source of a migration)
+    using the RestoreJournal. With defer set, scenes without light states are planned
+    without them and completed from lightstates (dictionary of scene ids to futures of
+    the scene data with light states) before they are written.
+    """
+    errors = [] if errors is None else errors
+    target = yield (CALL, ResourceStore, state)
+    fingerprint = yield (CALL, backupFingerprint, bridge + "/" + apiKey, state)
+    done = {}
+    if resume and not dry_run:
+        if not journal.exists():
+            raise Exception("No journal of an interrupted restore found in " + journal.filename)
+        print("Resuming restore from journal " + journal.filename)
+        plan, maps, planned_errors, done, in_doubt = yield (CALL, journal.resume, fingerprint)
+        deferred = journal.deferred
+        errors.extend(planned_errors)
+        posts = inDoubtPosts(in_doubt)
+        if posts:
+            # find out, which resources of interrupted POST requests were created before the interruption
+            with phase("refresh"):
+                store = yield (REFRESH,)
+            done.update((yield (CALL, journal.resolveInDoubt, store, plan, done, posts)))
+        print("   - " + str(len(done)) + " of " + str(len(plan)) + " request(s) already done")
+        graph = yield (CALL, DependencyGraph, plan)
+    else:
+        store = yield (LOAD,)
+        guids = existingScenes(store.state, state)
+        if guids:
+            print("Determining light states of existing scenes")
+            with phase("fetchLightstates"):
+                yield (FETCH_LIGHTSTATES, guids)
+        planner = RestorePlanner(store, target, apiKey, defer)
+        plan = yield (CALL, planner.run)
+        maps = planner.maps()
+        deferred = planner.deferred
+        errors.extend(planner.errors)
+        graph = yield (CALL, DependencyGraph, plan)
+        if dry_run:
+            plan.print(max_rate)
+            print("Requests can be executed in " + str(graph.levels()) + " level(s) of independent requests")
+        else:
+            if journal.exists():
+                print("WARNING: replacing journal of an unfinished restore (use --resume to continue it)")
+            existing = yield (CALL, existingIds, store, plan)
+            yield (CALL, journal.begin, fingerprint, plan, maps, planner.errors, existing, deferred)
+
+    report = None
+    if not dry_run:
+        store = yield (LOAD,)
+        before = sceneCompletion(deferred, lightstates, maps["lights"]) if deferred else None
+        try:
+            executor = yield (EXECUTE, graph, done, journal, before)
+            print("Cleaning up resources without light control")
+            maps = executor.resolve(maps)
+            with phase("cleanupResourceLinks"):
+                # the store was updated by all writes of the restore, so the bridge doesn't need to be read again
+                cleanup = ResourceLinkCleanup(store, target, maps["resourcelinks"])
+                dropped = yield (CALL, cleanup.run)
+                for resource in dropped:
+                    yield (DELETE, resource)
+                errors.extend(cleanup.errors)
+        except BaseException:
+            journal.close()
+            print("Restore interrupted, run the restore again with --resume to continue")
+            raise
+        yield (CALL, journal.finish)
+        if verify:
+            if lightstates is not None:
+                # light states of the target are needed for comparison
+                scenes = yield (CALL, lambda: [future.result() for future in lightstates.values()])
+                addLightstates(state, list(lightstates.keys()), scenes)
+            # the bridge is read in bulk: one request for everything, one per restored scene for light states
+            print("Verifying the bridge")
+            with phase("verify"):
+                store = yield (REFRESH,)
+                verifier = RestoreVerifier(store, target, dropLinks(maps, dropped), apiKey)
+                yield (FETCH_LIGHTSTATES, verifier.scenes())
+                report = yield (CALL, verifier.run)
+            report.print()
+
+    printErrors(errors)
+    return report
@@ -0,0 +1,132 @@
+from hue import HueBackup
+from hue.mock_bridge import MockBridgeServer
+from hue.synthetic import generateConfig, newBridgeState
+from hue.scheduler import MAX_RATE
+import argparse
+import contextlib
+import copy
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+class Benchmark():
+    """
+    End-to-end benchmark of backup and restore against mock bridges.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.results = {}
+
+    def measure(self, name, server, func):
+        """
+        Run func and record wall time, requests seen by the mock bridge and peak memory
+        """
+        server.bridge.resetStats()
+        if self.args.memory:
+            tracemalloc.start()
+        out = io.StringIO()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(sys.stdout if self.args.verbose else out):
+            func()
+        duration = time.perf_counter() - start
+        peak = 0
+        if self.args.memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        stats = server.bridge.stats()
+        self.results[name] = {"time": round(duration, 3), "requests": stats["total"], "methods": stats["requests"],
+                              "connections": stats["connections"], "rejected": stats["rejected"], "peak_memory": peak}
+        print("%-14s %8.2fs %6d requests %4d connections %4d rejected %8.1f MiB peak" %
+              (name, duration, stats["total"], stats["connections"], stats["rejected"], peak / 1048576.0))
+
+    def run(self):
+        a = self.args
+        config = generateConfig(a.lights, a.rooms, a.scenes_per_room, a.switches, a.schedules)
+        print("Synthetic configuration: " + ", ".join(str(len(config[k])) + " " + k for k in
+              ["lights", "groups", "scenes", "sensors", "rules", "schedules", "resourcelinks"]))
+        options = {"latency": a.latency / 1000.0, "connect_cost": a.connect_cost / 1000.0, "rate": a.bridge_rate}
+        src = MockBridgeServer("sourcekey", copy.deepcopy(config), **options)
+        dst = MockBridgeServer("targetkey", newBridgeState(config), **options)
+        tmpdir = tempfile.mkdtemp()
+        filename = os.path.join(tmpdir, "backup.json")
+        try:
+            self.measure("backup", src, lambda: self.__backup(src, filename))
+            self.measure("backup-again", src, lambda: self.__backup(src, filename))
+            self.measure("restore", dst, lambda: self.__restore(dst, filename))
+            self.measure("restore-again", dst, lambda: self.__restore(dst, filename))
+        finally:
+            src.close()
+            dst.close()
+            if os.path.exists(filename):
+                os.remove(filename)
+            os.rmdir(tmpdir)
+        return {"config": {"lights": a.lights, "rooms": a.rooms, "scenes_per_room": a.scenes_per_room,
+                           "switches": a.switches, "schedules": a.schedules, "latency": a.latency,
+                           "connect_cost": a.connect_cost, "bridge_rate": a.bridge_rate,
+                           "jobs": a.jobs, "rate": a.rate},
+                "results": self.results}
+
+    def __backup(self, server, filename):
+        br = HueBackup(server.address, "sourcekey", self.args.jobs, self.args.rate)
+        br.backup(filename)
+        br.close()
+
+    def __restore(self, server, filename):
+        br = HueBackup(server.address, "targetkey", self.args.jobs, self.args.rate)
+        br.restore(filename)
+        br.close()
+
+def compare(results, baseline, tolerance):
+    """
+    Compare results with baseline results, return list of regressions
+    """
+    regressions = []
+    for name, r in results["results"].items():
+        if name not in baseline["results"]:
+            continue
+        b = baseline["results"][name]
+        if r["time"] > b["time"] * (1 + tolerance):
+            regressions.append(name + ": time " + str(r["time"]) + "s, baseline " + str(b["time"]) + "s")
+        if r["requests"] > b["requests"]:
+            regressions.append(name + ": " + str(r["requests"]) + " requests, baseline " + str(b["requests"]))
+        if b["peak_memory"] and r["peak_memory"] > b["peak_memory"] * (1 + tolerance):
+            regressions.append(name + ": peak memory " + str(r["peak_memory"]) + ", baseline " + str(b["peak_memory"]))
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Hue Bridge Backup and Recovery benchmark using mock bridges")
+    parser.add_argument("--lights", type=int, default=30, help="number of lights (default %(default)s)")
+    parser.add_argument("--rooms", type=int, default=6, help="number of rooms (default %(default)s)")
+    parser.add_argument("--scenes-per-room", type=int, default=4, help="number of scenes per room (default %(default)s)")
+    parser.add_argument("--switches", type=int, default=6, help="number of switches with 4 rules and a resource link each (default %(default)s)")
+    parser.add_argument("--schedules", type=int, default=3, help="number of schedules (default %(default)s)")
+    parser.add_argument("--latency", type=float, default=5, help="latency of the mock bridge per request in ms (default %(default)s)")
+    parser.add_argument("--connect-cost", type=float, default=50, help="cost of opening a connection to the mock bridge in ms (default %(default)s)")
+    parser.add_argument("--bridge-rate", type=float, help="write requests per second accepted by the mock bridge (default unlimited)")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="number of concurrent requests (default %(default)s)")
+    parser.add_argument("--rate", type=float, default=MAX_RATE, help="maximum number of write requests per second (default %(default)s)")
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="don't measure peak memory (tracemalloc slows down the run)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="show output of backup and restore")
+    parser.add_argument("-o", "--output", metavar="FILENAME", help="write results as JSON to the file")
+    parser.add_argument("--baseline", metavar="FILENAME", help="compare results with JSON results of a previous run")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown against baseline (default %(default)s)")
+    args = parser.parse_args()
+
+    results = Benchmark(args).run()
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("REGRESSIONS FOUND:")
+            for r in regressions:
+                print(" - " + r)
+            sys.exit(1)
+        print("No regressions against baseline")
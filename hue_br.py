@@ -1,19 +1,176 @@
 from hue import HueBackup
+from hue.fleet import FleetBackup, loadInventory, printSummary
+from hue.aio import AsyncHueBackup, AsyncFleetBackup
+from hue.profile import Profiler
+from hue.storage import FORMATS
+from hue.transport import BACKENDS, createTransport, bridgeUrl
+from hue.recording import RecordingTransport, ReplayTransport
+from hue.scheduler import MAX_RATE
+from hue.catalog import BackupCatalog
+from hue.selection import parseSelector
 import argparse
+import asyncio
+import json
+import sys
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Hue Bridge Backup and Recovery")
-    parser.add_argument("bridge", help="name or IP address of the Hue bridge to backup or recover")
-    parser.add_argument("key", help="API key of the bridge under which to backup or recover")
+    parser.add_argument("bridge", nargs="?", help="name or IP address of the Hue bridge to backup or recover")
+    parser.add_argument("key", nargs="?", help="API key of the bridge under which to backup or recover")
     parser.add_argument_group()
     parser.add_argument("-b", "--backup", metavar="FILENAME", help="run backup of the bridge")
     parser.add_argument("-r", "--restore", metavar="FILENAME", help="run recovery of the bridge")
+    parser.add_argument("--format", choices=FORMATS, help="backup file format (default by extension: .gz gzip, .xz xz, otherwise json), detected automatically on restore")
+    parser.add_argument("--intern-lightstates", action="store_true", help="store each distinct light state of scenes only once in a table referenced by the scenes")
+    parser.add_argument("--previous", metavar="FILENAME", help="previous backup file or chain to take light states of unchanged scenes from (default the backup FILENAME itself)")
+    parser.add_argument("--no-scene-cache", action="store_true", help="read light states of all scenes from the bridge, even if unchanged since the previous backup")
+    parser.add_argument("-i", "--incremental", action="store_true", help="store backup incrementally into a backup chain directory FILENAME")
+    parser.add_argument("--full-every", metavar="N", type=int, default=7, help="write a full snapshot every N incremental backups (default 7)")
+    parser.add_argument("--repository", action="store_true", help="add the backup to the content-addressed backup repository in directory FILENAME (restore from it by passing the manifest file)")
+    parser.add_argument("--catalog", metavar="FILENAME", help="SQLite catalog of the backup history, updated by each backup and queried by --history and --find")
+    parser.add_argument("--catalog-add", metavar="FILENAME", nargs="+", help="add existing backup files, manifests or backup chain directories to the --catalog")
+    parser.add_argument("--history", metavar="KIND:NAME", help="list changes of the resource in all backups in the --catalog (kind as for --only)")
+    parser.add_argument("--find", metavar="KIND:NAME", help="list bridges having the resource in their latest backup in the --catalog (kind as for --only)")
+    parser.add_argument("--snapshot", metavar="N", type=int, help="backup in the chain to restore (default the latest, negative counts from the end)")
+    parser.add_argument("--watch", metavar="DIRECTORY", help="back up the bridge continuously, adding each change to the backup chain DIRECTORY")
+    parser.add_argument("--interval", metavar="SECONDS", type=float, default=60, help="interval of polling the bridge in watch mode (default %(default)s)")
+    parser.add_argument("--only", metavar="KIND:NAME", action="append", help="restore only the resource (kind one of light, sensor, group, scene, schedule, rule, resourcelink) with everything it needs, can be repeated")
+    parser.add_argument("--verify", metavar="REPORT", nargs="?", const="", help="read the bridge after the restore or migration and report differences from the backup or source bridge, optionally also as JSON into the file REPORT")
+    parser.add_argument("-n", "--dry-run", action="store_true", help="only print the restore plan, don't change the bridge")
+    parser.add_argument("--resume", action="store_true", help="continue an interrupted restore from its journal FILENAME.journal (migration from migrate-DST_IP.journal)")
+    parser.add_argument("-j", "--jobs", metavar="N", type=int, default=1, help="number of concurrent requests to the bridge (default 1)")
+    parser.add_argument("--rate", metavar="R", type=float, default=MAX_RATE, help="maximum number of write requests per second (default %(default)s)")
+    parser.add_argument("--transport", choices=BACKENDS.keys(), default="http", help="HTTP implementation used to talk to the bridge (default %(default)s)")
+    parser.add_argument("--record", metavar="FILENAME", help="record all requests to the bridge and their responses into the file")
+    parser.add_argument("--replay", metavar="FILENAME", help="don't contact the bridge, answer requests with responses recorded using --record")
+    parser.add_argument("--migrate", nargs=4, metavar=("SRC_IP", "SRC_KEY", "DST_IP", "DST_KEY"), help="restore the state of the source bridge directly into the destination bridge")
+    parser.add_argument("--fleet", metavar="INVENTORY", help="backup all bridges listed in JSON or CSV inventory file")
+    parser.add_argument("--parallel", metavar="N", type=int, default=4, help="number of bridges to backup in parallel in fleet mode (default 4)")
+    parser.add_argument("--max-requests", metavar="N", type=int, help="maximum number of concurrent requests over all bridges in fleet mode")
+    parser.add_argument("--asyncio", action="store_true", help="talk to the bridge(s) using asyncio on a single thread instead of worker threads")
+    parser.add_argument("--summary", metavar="FILENAME", help="write JSON summary of the fleet backup to the file")
+    parser.add_argument("--profile", metavar="FILENAME", help="print timing breakdown per phase and resource type and write JSON trace of all requests to the file")
     args = parser.parse_args()
 
-    br = HueBackup(args.bridge, args.key)
-    if args.backup:
-        br.backup(args.backup)
-    if args.restore:
-        br.restore(args.restore)
-    if not args.backup and not args.restore:
-        raise Exception("At least one of --backup and --restore has to be specified") 
\ No newline at end of file
+    if args.verify is not None and (not (args.restore or args.migrate) or args.dry_run):
+        parser.error("--verify requires --restore or --migrate without --dry-run")
+    if args.migrate and (args.asyncio or args.record or args.replay):
+        parser.error("--migrate cannot be combined with --asyncio, --record and --replay")
+    if args.asyncio and (args.record or args.replay or args.transport != "http"):
+        parser.error("--asyncio cannot be combined with --record, --replay and --transport")
+
+    if args.migrate:
+        profiler = Profiler() if args.profile else None
+        hooks = [profiler] if profiler else None
+        source = HueBackup(args.migrate[0], args.migrate[1], args.jobs, args.rate, hooks, args.transport)
+        br = HueBackup(args.migrate[2], args.migrate[3], args.jobs, args.rate, hooks, args.transport)
+        try:
+            report = br.migrate(source, args.dry_run, args.resume, args.verify is not None)
+        finally:
+            source.close()
+            br.close()
+            if profiler:
+                profiler.report()
+                profiler.writeTrace(args.profile)
+        if report is not None:
+            if args.verify:
+                report.write(args.verify)
+            sys.exit(1 if report.problems() > 0 else 0)
+        sys.exit(0)
+
+    if args.fleet:
+        if args.asyncio:
+            summary = asyncio.run(AsyncFleetBackup(loadInventory(args.fleet), args.parallel, args.jobs, args.rate,
+                                                   args.incremental, args.full_every, args.max_requests, args.repository,
+                                                   args.catalog).run())
+        else:
+            summary = FleetBackup(loadInventory(args.fleet), args.parallel, args.jobs, args.rate,
+                                  args.incremental, args.full_every, args.repository, args.catalog,
+                                  args.max_requests).run()
+        if args.summary:
+            with open(args.summary, "w") as f:
+                json.dump(summary, f, indent=4)
+        if printSummary(summary) > 0:
+            sys.exit(1)
+        sys.exit(0)
+
+    if args.catalog_add or args.history or args.find:
+        if not args.catalog:
+            parser.error("--catalog-add, --history and --find require --catalog")
+        catalog = BackupCatalog(args.catalog)
+        try:
+            for filename in args.catalog_add or []:
+                print("Added " + str(catalog.addFile(filename)) + " backup(s) from " + filename + " to the catalog")
+            if args.history:
+                section, name = parseSelector(args.history)
+                changes = catalog.history(section, name)
+                if not changes:
+                    print("No " + section[:-1] + " named " + name + " found in the catalog")
+                for c in changes:
+                    print(c["time"] + " " + c["bridge"] + ": " + c["change"] + " " + section + "/" + c["id"] +
+                          " (backup " + c["location"] + ("" if c["point"] is None else " --snapshot " + str(c["point"])) + ")")
+            if args.find:
+                section, name = parseSelector(args.find)
+                found = catalog.find(section, name)
+                if not found:
+                    print("No bridge has a " + section[:-1] + " named " + name + " in its latest backup")
+                for f in found:
+                    print(f["bridge"] + ": " + section + "/" + f["id"] + " in the latest backup from " + f["time"] +
+                          " (backup " + f["location"] + ("" if f["point"] is None else " --snapshot " + str(f["point"])) + ")")
+        finally:
+            catalog.close()
+        sys.exit(0)
+
+    if not args.bridge or not args.key:
+        parser.error("bridge and key are required")
+    if not args.backup and not args.restore and not args.watch:
+        raise Exception("At least one of --backup, --restore and --watch has to be specified")
+    if args.watch and args.asyncio:
+        parser.error("--watch cannot be combined with --asyncio")
+    profiler = Profiler() if args.profile else None
+    if args.asyncio:
+        async def run():
+            br = AsyncHueBackup(args.bridge, args.key, args.jobs, args.rate, [profiler] if profiler else None)
+            try:
+                if args.backup:
+                    await br.backup(args.backup, args.incremental, args.full_every, args.format, args.intern_lightstates,
+                                    args.previous, not args.no_scene_cache, args.repository, args.catalog)
+                if args.restore:
+                    return await br.restore(args.restore, args.snapshot, args.dry_run, args.resume, args.only, args.verify is not None)
+            finally:
+                await br.close()
+        try:
+            report = asyncio.run(run())
+        finally:
+            if profiler:
+                profiler.report()
+                profiler.writeTrace(args.profile)
+        if report is not None:
+            if args.verify:
+                report.write(args.verify)
+            sys.exit(1 if report.problems() > 0 else 0)
+        sys.exit(0)
+    transport = args.transport
+    if args.replay:
+        transport = ReplayTransport(args.replay)
+    elif args.record:
+        transport = RecordingTransport(createTransport(args.transport, bridgeUrl(args.bridge, args.key), args.jobs), args.record)
+    br = HueBackup(args.bridge, args.key, args.jobs, args.rate, [profiler] if profiler else None, transport)
+    report = None
+    try:
+        if args.backup:
+            br.backup(args.backup, args.incremental, args.full_every, args.format, args.intern_lightstates,
+                      args.previous, not args.no_scene_cache, args.repository, args.catalog)
+        if args.restore:
+            report = br.restore(args.restore, args.snapshot, args.dry_run, args.resume, args.only, args.verify is not None)
+        if args.watch:
+            br.watch(args.watch, args.interval, args.full_every, catalog=args.catalog)
+    finally:
+        br.close()
+        if profiler:
+            profiler.report()
+            profiler.writeTrace(args.profile)
+    if report is not None:
+        if args.verify:
+            report.write(args.verify)
+        sys.exit(1 if report.problems() > 0 else 0)
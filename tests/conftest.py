@@ -0,0 +1,57 @@
+import os
+import sys
+import pytest
+
+# run the tests against the hue package of this checkout
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hue import HueBackup
+from hue.mock_bridge import MockBridge, MockTransport
+from hue.synthetic import generateConfig, newBridgeState
+
+@pytest.fixture
+def config():
+    """
+    Synthetic configuration of a small bridge (12 lights, 3 rooms with 2 scenes each,
+    2 switches with rules, 1 schedule)
+    """
+    return generateConfig(12, 3, 2, 2, 1)
+
+@pytest.fixture
+def target(config):
+    """
+    MockBridge (API key "targetkey") with the lights and sensors of config connected,
+    but nothing configured
+    """
+    return MockBridge("targetkey", newBridgeState(config))
+
+@pytest.fixture
+def writes():
+    """
+    Function returning the number of write requests handled by a MockBridge
+    """
+    return lambda bridge: sum(count for method, count in bridge.stats()["requests"].items() if method != "GET")
+
+@pytest.fixture
+def backup(tmp_path, config):
+    """
+    Function backing up a MockBridge with config (or the given state) into the file
+    of the given name in tmp_path, returns the file name
+    """
+    def backup(name="backup.json", state=None, **options):
+        filename = str(tmp_path / name)
+        source = MockBridge("sourcekey", config if state is None else state)
+        HueBackup("mock", "sourcekey", 4, 1000, transport=MockTransport(source, "sourcekey")).backup(filename, **options)
+        return filename
+    return backup
+
+@pytest.fixture
+def restore(target):
+    """
+    Function restoring the backup file into target (or through the given transport),
+    returns the result of HueBackup.restore()
+    """
+    def restore(filename, jobs=4, transport=None, **options):
+        transport = MockTransport(target, "targetkey") if transport is None else transport
+        return HueBackup("mock", "targetkey", jobs, 1000, transport=transport).restore(filename, **options)
+    return restore
@@ -0,0 +1,46 @@
+from hue.address import AddressTranslator
+from hue.store import ResourceStore
+from hue.verify import RestoreVerifier
+
+MAPS = {"lights": {"1": "11", "2": "12"}, "sensors": {"2": "20", "5": "21"}, "groups": {"3": "30"},
+        "scenes": {"abc": "xyz"}, "rules": {"1": "10"}, "schedules": {}, "resourcelinks": {}}
+
+CONDITIONS = [{"address": "/sensors/2/state/buttonevent", "operator": "eq", "value": "1002"},
+              {"address": "/rules/1/state/lasttriggered", "operator": "ddx", "value": "PT00:00:05"},
+              {"address": "/config/localtime", "operator": "in", "value": "T08:00:00/T20:00:00"}]
+ACTIONS = [{"address": "/groups/3/action", "method": "PUT", "body": {"scene": "abc"}},
+           {"address": "/lights/2/state", "method": "PUT", "body": {"on": False}},
+           {"address": "/sensors/5/state", "method": "PUT", "body": {"status": 1}}]
+
+def testReverseTranslation():
+    forward = AddressTranslator(MAPS, "newkey")
+    backward = forward.reverse()
+    for condition in CONDITIONS:
+        address, parsed = forward.translate(condition["address"], False)
+        assert backward.translate(address, False)[0] == condition["address"]
+    assert forward.translate("/sensors/2/state/buttonevent", False)[0] == "/sensors/20/state/buttonevent"
+    for action in ACTIONS:
+        translated, refs = forward.translateAction(action, False)
+        assert backward.translateAction(translated, False)[0] == action
+    assert forward.translateAction(ACTIONS[0], False)[0]["body"] == {"scene": "xyz"}
+    # schedules keep the API key of the bridge when translated back
+    command = {"address": "/api/oldkey/groups/3/action", "method": "PUT", "body": {"on": True}}
+    translated = forward.translateAction(command, True)[0]
+    assert translated["address"] == "/api/newkey/groups/30/action"
+    assert backward.translateAction(translated, True)[0]["address"] == "/api/newkey/groups/3/action"
+    # resources of the bridge not restored from the backup have no backup id
+    assert backward.translate("/sensors/99/state", False) == (None, None)
+
+def testVerifierReportsAddressesInBackupIds():
+    target = ResourceStore({"rules": {"1": {"name": "Switch", "status": "enabled", "conditions": CONDITIONS, "actions": ACTIONS}}})
+    forward = AddressTranslator(MAPS)
+    conditions = [dict(c, address=forward.translate(c["address"], False)[0]) for c in CONDITIONS]
+    actions = [forward.translateAction(a, False)[0] for a in ACTIONS]
+    # the bridge addresses sensor 20 (sensor 2 of the backup) instead of sensor 21
+    actions[2]["address"] = "/sensors/20/state"
+    current = ResourceStore({"rules": {"10": {"name": "Switch", "status": "enabled", "conditions": conditions, "actions": actions}}})
+    report = RestoreVerifier(current, target, MAPS, "newkey").run()
+    diff, = report.sections["rules"]["different"]
+    assert (diff["resource"], diff["field"]) == ("rules/10", "actions")
+    assert diff["actual_backup"][2]["address"] == "/sensors/2/state"
+    assert diff["actual_backup"][0:2] == ACTIONS[0:2]
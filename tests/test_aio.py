@@ -0,0 +1,40 @@
+import asyncio
+import threading
+from hue.aio import AsyncHueBackup
+from hue.journal import RestoreJournal
+from hue.mock_bridge import MockBridgeServer
+from hue.synthetic import newBridgeState
+
+def testBackupAndRestore(tmp_path, monkeypatch, config, writes):
+    # the journal is written (and synced) on worker threads, not on the event loop
+    threads = {}
+    for name in ["begin", "started", "completed", "finish"]:
+        def recordThread(self, *args, original=getattr(RestoreJournal, name), name=name):
+            threads.setdefault(name, set()).add(threading.current_thread())
+            return original(self, *args)
+        monkeypatch.setattr(RestoreJournal, name, recordThread)
+
+    src = MockBridgeServer("sourcekey", config)
+    dst = MockBridgeServer("targetkey", newBridgeState(config))
+    filename = str(tmp_path / "backup.json")
+    async def run():
+        br = AsyncHueBackup(src.address, "sourcekey", 4, 1000)
+        await br.backup(filename)
+        await br.close()
+        reports = []
+        for attempt in range(2):
+            br = AsyncHueBackup(dst.address, "targetkey", 4, 1000)
+            reports.append(await br.restore(filename, verify=True))
+            await br.close()
+            if attempt == 0:
+                restored = writes(dst.bridge)
+        return reports, restored
+    try:
+        reports, restored = asyncio.run(run())
+    finally:
+        src.close()
+        dst.close()
+    assert [report.problems() for report in reports] == [0, 0]
+    assert restored > 0 and writes(dst.bridge) == restored
+    assert sorted(threads.keys()) == ["begin", "completed", "finish", "started"]
+    assert all(threading.main_thread() not in used for used in threads.values())
@@ -0,0 +1,47 @@
+import copy
+import os
+from hue.catalog import BackupCatalog
+from hue.synthetic import generateConfig
+
+def sceneIds(state, name):
+    return sorted((idx for idx, data in state["scenes"].items() if data["name"] == name), key=lambda idx: (len(idx), idx))
+
+def testHistoryOfResourcesSharingName(tmp_path):
+    state = generateConfig(12, 6, 2, 2, 1)
+    for data in state["scenes"].values():
+        data["name"] = data["name"].split(" of room ")[0]
+    ids = sceneIds(state, "Scene 0")
+    assert len(ids) == 6
+    catalog = BackupCatalog(str(tmp_path / "catalog.db"))
+    catalog.add("bridge", state, str(tmp_path / "1.json"), timestamp=1000)
+    state = copy.deepcopy(state)
+    state["scenes"][ids[2]]["lightstates"][next(iter(state["scenes"][ids[2]]["lightstates"]))]["bri"] = 17
+    catalog.add("bridge", state, str(tmp_path / "2.json"), timestamp=2000)
+    state = copy.deepcopy(state)
+    del state["scenes"][ids[4]]
+    catalog.add("bridge", state, str(tmp_path / "3.json"), timestamp=3000)
+    history = catalog.history("scenes", "Scene 0")
+    assert [(change["change"], change["id"]) for change in history] == \
+        [("added", idx) for idx in ids] + [("changed", ids[2]), ("removed", ids[4])]
+    assert [change["location"][-6:] for change in history[6:]] == ["2.json", "3.json"]
+    assert catalog.history("scenes", "Scene 0") == history
+    catalog.close()
+
+def testFindUsesLatestBackup(tmp_path):
+    state = generateConfig(12, 3, 2, 2, 1)
+    room = state["groups"]["1"]["name"]
+    catalog = BackupCatalog(str(tmp_path / "catalog.db"))
+    catalog.add("bridge", state, str(tmp_path / "1.json"), timestamp=1000)
+    catalog.add("other", state, str(tmp_path / "other.json"), timestamp=1000)
+    renamed = copy.deepcopy(state)
+    renamed["groups"]["1"]["name"] = "Renamed"
+    # backups of the same second, the one added last is the latest
+    catalog.add("bridge", renamed, str(tmp_path / "2.json"), timestamp=2000)
+    catalog.add("bridge", state, str(tmp_path / "3.json"), timestamp=2000)
+    found = catalog.find("groups", room)
+    assert [(f["bridge"], f["id"], os.path.basename(f["location"])) for f in found] == \
+        [("bridge", "1", "3.json"), ("other", "1", "other.json")]
+    assert catalog.find("groups", "Renamed") == []
+    catalog.add("other", renamed, str(tmp_path / "other2.json"), timestamp=500)
+    assert [f["bridge"] for f in catalog.find("groups", room)] == ["bridge", "other"]
+    catalog.close()
@@ -0,0 +1,37 @@
+import json
+import pytest
+
+def restoreWithRules(tmp_path, config, restore, rules, jobs):
+    config["rules"].update(rules)
+    filename = str(tmp_path / "backup.json")
+    with open(filename, "w") as f:
+        json.dump(config, f)
+    return restore(filename, jobs, verify=True)
+
+def rule(name, conditions, actions):
+    return {"name": name, "owner": "synthetic", "status": "enabled", "recycle": False,
+            "conditions": conditions, "actions": actions}
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def testSelfReferencingRule(tmp_path, config, target, restore, jobs):
+    # debounce: the rule only fires if it didn't fire during the last 5 seconds
+    rules = {"90": rule("Debounced", [{"address": "/sensors/2/state/buttonevent", "operator": "eq", "value": "1002"},
+                                      {"address": "/rules/90/state/lasttriggered", "operator": "ddx", "value": "PT00:00:05"}],
+                        [{"address": "/groups/1/action", "method": "PUT", "body": {"on": True}}])}
+    report = restoreWithRules(tmp_path, config, restore, rules, jobs)
+    assert report.problems() == 0
+    rid = [idx for idx, data in target.state["rules"].items() if data["name"] == "Debounced"][0]
+    assert target.state["rules"][rid]["conditions"][1]["address"] == "/rules/" + rid + "/state/lasttriggered"
+    assert target.state["rules"][rid]["status"] == "enabled"
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def testRulesReferencingEachOther(tmp_path, config, target, restore, jobs):
+    rules = {"90": rule("Enable other", [{"address": "/sensors/2/state/buttonevent", "operator": "eq", "value": "1002"}],
+                        [{"address": "/rules/91", "method": "PUT", "body": {"status": "enabled"}}]),
+             "91": rule("Disable other", [{"address": "/sensors/2/state/buttonevent", "operator": "eq", "value": "4002"}],
+                        [{"address": "/rules/90", "method": "PUT", "body": {"status": "disabled"}}])}
+    report = restoreWithRules(tmp_path, config, restore, rules, jobs)
+    assert report.problems() == 0
+    ids = {data["name"]: idx for idx, data in target.state["rules"].items()}
+    assert target.state["rules"][ids["Enable other"]]["actions"][0]["address"] == "/rules/" + ids["Disable other"]
+    assert target.state["rules"][ids["Disable other"]]["actions"][0]["address"] == "/rules/" + ids["Enable other"]
@@ -0,0 +1,80 @@
+import asyncio
+import os
+import threading
+import time
+import pytest
+from hue.aio import AsyncFleetBackup
+from hue.fleet import FleetBackup, loadInventory, printSummary
+from hue.mock_bridge import MockBridge, MockBridgeServer
+from hue.storage import readBackup
+
+@pytest.fixture
+def fleet(tmp_path, config):
+    """
+    Inventory of two mock bridges and an unreachable one
+    """
+    servers = [MockBridgeServer("key", config) for i in range(2)]
+    inventory = [{"bridge": server.address, "key": "key", "output": str(tmp_path / ("bridge" + str(i) + ".json"))}
+                 for i, server in enumerate(servers)]
+    inventory.insert(1, {"bridge": "127.0.0.1:1", "key": "key", "output": str(tmp_path / "unreachable.json")})
+    yield inventory
+    for server in servers:
+        server.close()
+
+def checkSummary(inventory, summary, config, capsys):
+    assert [r["bridge"] for r in summary] == [entry["bridge"] for entry in inventory]
+    ok, failed = [summary[0], summary[2]], summary[1]
+    for r in ok:
+        assert r["error"] is None and r["requests"] > 0
+        assert readBackup(r["output"])["lights"].keys() == config["lights"].keys()
+    assert failed["error"].startswith("Cannot connect to bridge")
+    assert failed["requests"] == 0
+    assert not os.path.exists(failed["output"])
+    capsys.readouterr()
+    assert printSummary(summary) == 1
+    out = capsys.readouterr().out
+    assert "127.0.0.1:1: " in out and "FAILED: Cannot connect to bridge" in out
+    assert "2 of 3 bridge(s) backed up successfully" in out
+
+def testFleetBackup(fleet, config, capsys):
+    checkSummary(fleet, FleetBackup(fleet, 2, 2, 1000).run(), config, capsys)
+
+def testAsyncFleetBackup(fleet, config, capsys):
+    checkSummary(fleet, asyncio.run(AsyncFleetBackup(fleet, 2, 2, 1000, max_requests=2).run()), config, capsys)
+
+def testLoadInventory(tmp_path):
+    filename = str(tmp_path / "inventory.csv")
+    with open(filename, "w") as f:
+        f.write("bridge,key,output\n10.0.0.2,abc,b1.json\n10.0.0.3,def,b2.json\n")
+    assert loadInventory(filename) == [{"bridge": "10.0.0.2", "key": "abc", "output": "b1.json"},
+                                       {"bridge": "10.0.0.3", "key": "def", "output": "b2.json"}]
+    filename = str(tmp_path / "inventory.json")
+    with open(filename, "w") as f:
+        f.write('[{"bridge": "10.0.0.2", "key": "abc"}]')
+    with pytest.raises(Exception, match="missing output"):
+        loadInventory(filename)
+
+def testMaxRequestsCapsThreadedFleet(fleet, monkeypatch):
+    # count requests being handled by both bridges at the same time
+    running = [0, 0]
+    lock = threading.Lock()
+    def handle(self, method, path, body, original=MockBridge.handle):
+        with lock:
+            running[0] += 1
+            running[1] = max(running)
+        try:
+            time.sleep(0.005)
+            return original(self, method, path, body)
+        finally:
+            with lock:
+                running[0] -= 1
+    monkeypatch.setattr(MockBridge, "handle", handle)
+    fleet = [entry for entry in fleet if entry["bridge"] != "127.0.0.1:1"]
+    FleetBackup(fleet, 2, 4, 1000).run()
+    assert running[1] > 2
+    running[1] = 0
+    # new outputs, so light states of scenes are read again
+    fleet = [dict(entry, output=entry["output"] + ".capped") for entry in fleet]
+    summary = FleetBackup(fleet, 2, 4, 1000, max_requests=2).run()
+    assert [r["error"] for r in summary] == [None, None]
+    assert running[1] == 2
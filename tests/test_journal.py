@@ -0,0 +1,57 @@
+import json
+import pytest
+from hue import HueBackup
+from hue.mock_bridge import MockBridge, MockTransport
+from hue.synthetic import generateConfig, newBridgeState
+from hue.transport import TransportError
+
+class InterruptingTransport(MockTransport):
+    """
+    MockTransport losing the connection after the bridge executed the first request
+    with the given method and resource
+    """
+
+    def __init__(self, bridge, apiKey, method, resource):
+        super().__init__(bridge, apiKey)
+        self.method = method
+        self.resource = resource
+        self.armed = True
+
+    def send(self, method, resource, data, timeout):
+        response = super().send(method, resource, data, timeout)
+        if self.armed and method == self.method and resource == self.resource:
+            self.armed = False
+            raise TransportError("connection lost", True)
+        return response
+
+def sharedSceneNames(state):
+    # real bridges have scenes with the same name in every room
+    for scene in state["scenes"].values():
+        scene["name"] = scene["name"].split(" of ")[0]
+    return state
+
+def testResumeAfterInterruptedScenePost(tmp_path):
+    backup = sharedSceneNames(generateConfig(12, 3, 2, 2, 1))
+    filename = str(tmp_path / "backup.json")
+    with open(filename, "w") as f:
+        json.dump(backup, f)
+    state = newBridgeState(backup)
+    # unrelated room with a scene of the same name as the first restored scene
+    light = next(iter(state["lights"].keys()))
+    state["groups"]["90"] = {"name": "Other room", "lights": [light], "sensors": [], "type": "Room", "class": "Office",
+                             "recycle": False, "action": {"on": False}, "state": {"all_on": False, "any_on": False}}
+    state["scenes"]["preexisting"] = {"name": "Scene 0", "type": "GroupScene", "group": "90", "lights": [light],
+                                      "owner": "user", "recycle": False, "locked": False, "appdata": {"version": 1, "data": "abcde_r90_d00"},
+                                      "picture": "", "lastupdated": "2021-01-01T10:00:00", "version": 2,
+                                      "lightstates": {light: {"on": True, "bri": 1}}}
+    bridge = MockBridge("key", state)
+
+    with pytest.raises(Exception):
+        HueBackup("mock", "key", rate=1000, transport=InterruptingTransport(bridge, "key", "POST", "scenes")).restore(filename)
+    report = HueBackup("mock", "key", rate=1000, transport=MockTransport(bridge, "key")).restore(filename, resume=True, verify=True)
+
+    assert report.problems() == 0
+    assert bridge.state["scenes"]["preexisting"]["group"] == "90"
+    # every scene of the backup exists exactly once besides the preexisting one
+    assert len(bridge.state["scenes"]) == len(backup["scenes"]) + 1
+    assert sum(1 for s in bridge.state["scenes"].values() if s["name"] == "Scene 0") == 4
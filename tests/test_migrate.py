@@ -0,0 +1,35 @@
+import os
+from hue import HueBackup
+from hue.mock_bridge import MockBridge, MockTransport
+
+def migrate(source, target, journal, **options):
+    src = HueBackup("source", "sourcekey", 4, 1000, transport=MockTransport(source, "sourcekey"))
+    dst = HueBackup("target", "targetkey", 4, 1000, transport=MockTransport(target, "targetkey"))
+    try:
+        return dst.migrate(source=src, journal=journal, **options)
+    finally:
+        src.close()
+        dst.close()
+
+def testMigrateVerifies(tmp_path, config, target, writes):
+    source = MockBridge("sourcekey", config)
+    journal = str(tmp_path / "migrate.journal")
+    report = migrate(source, target, journal, verify=True)
+    assert report.problems() == 0
+    assert not any(data["not_restored"] for data in report.sections.values())
+    migrated = writes(target)
+    assert migrated > 0
+    assert not os.path.exists(journal)
+    # the bridge already matches the source
+    report = migrate(source, target, journal, verify=True)
+    assert report.problems() == 0
+    assert writes(target) == migrated
+
+def testMigrateDryRunDoesNotWrite(tmp_path, config, target, writes):
+    source = MockBridge("sourcekey", config)
+    journal = str(tmp_path / "migrate.journal")
+    assert migrate(source, target, journal, dry_run=True) is None
+    assert writes(target) == 0
+    assert not os.path.exists(journal)
+    # light states of scenes are only read from the source for writing them
+    assert source.stats()["requests"] == {"GET": 1}
@@ -0,0 +1,61 @@
+import asyncio
+import json
+from hue import HueBackup
+from hue.aio import AsyncHueBackup
+from hue.mock_bridge import MockBridge, MockBridgeServer, MockTransport
+from hue.profile import Profiler, phase, currentPhase
+
+def phases(profiler):
+    return {name: s["requests"] for name, s in profiler.breakdown("phase").items()}
+
+def testPhasesOfBackupAndRestore(tmp_path, config, target, writes):
+    filename = str(tmp_path / "backup.json")
+    profiler = Profiler()
+    source = MockBridge("sourcekey", config)
+    HueBackup("mock", "sourcekey", 4, 1000, [profiler], MockTransport(source, "sourcekey")).backup(filename)
+    # light states are read on worker threads, but recorded in the phase of the caller
+    assert phases(profiler) == {"refresh": 1, "fetchLightstates": len(config["scenes"])}
+
+    profiler = Profiler()
+    HueBackup("mock", "targetkey", 4, 1000, [profiler], MockTransport(target, "targetkey")).restore(filename, verify=True)
+    restored = phases(profiler)
+    assert restored["refresh"] == 1 and restored["verify"] > 1
+    for name in ["restoreLights", "restoreGroups", "restoreScenes", "restoreRules"]:
+        assert restored[name] > 0
+    assert "other" not in restored
+    assert sum(count for name, count in restored.items() if name.startswith("restore")) == writes(target)
+    types = profiler.breakdown("type")
+    assert types["all"]["requests"] == 2
+    assert types["scenes"]["requests"] >= len(config["scenes"])
+
+def testTrace(tmp_path, config):
+    profiler = Profiler()
+    source = MockBridge("sourcekey", config)
+    HueBackup("mock", "sourcekey", 4, 1000, [profiler], MockTransport(source, "sourcekey")).backup(str(tmp_path / "backup.json"))
+    filename = str(tmp_path / "trace.json")
+    profiler.writeTrace(filename)
+    with open(filename) as f:
+        trace = json.load(f)
+    events = trace["traceEvents"]
+    assert len(events) == len(profiler.records)
+    assert events[0]["name"] == "GET all" and events[0]["cat"] == "refresh"
+    assert all(e["ph"] == "X" and e["dur"] >= 0 and e["args"]["status"] == 200 for e in events)
+    assert sorted(set(e["tid"] for e in events)) == list(range(1, len(set(r["thread"] for r in profiler.records)) + 1))
+    assert trace["otherData"]["phases"] == json.loads(json.dumps(profiler.breakdown("phase")))
+
+def testPhaseOfAsyncioTasks(tmp_path, config):
+    profiler = Profiler()
+    server = MockBridgeServer("sourcekey", config)
+    async def run():
+        br = AsyncHueBackup(server.address, "sourcekey", 4, 1000, [profiler])
+        try:
+            await br.backup(str(tmp_path / "backup.json"))
+        finally:
+            await br.close()
+    try:
+        with phase("outer"):
+            asyncio.run(run())
+            assert currentPhase() == "outer"
+    finally:
+        server.close()
+    assert phases(profiler) == {"refresh": 1, "fetchLightstates": len(config["scenes"])}
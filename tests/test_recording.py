@@ -0,0 +1,49 @@
+import json
+import pytest
+from hue import HueBackup
+from hue.mock_bridge import MockBridge, MockTransport
+from hue.recording import RecordingTransport, ReplayTransport
+from hue.transport import TransportError
+
+def testReplayBackup(tmp_path, config):
+    recording = str(tmp_path / "requests.json")
+    source = MockBridge("key", config)
+    br = HueBackup("mock", "key", 4, 1000, transport=RecordingTransport(MockTransport(source, "key"), recording))
+    br.backup(str(tmp_path / "recorded.json"))
+    br.close()
+    # the bridge is not contacted again
+    source.resetStats()
+    br = HueBackup("mock", "key", 4, 1000, transport=ReplayTransport(recording))
+    br.backup(str(tmp_path / "replayed.json"))
+    br.close()
+    assert source.stats()["total"] == 0
+    with open(str(tmp_path / "recorded.json")) as f, open(str(tmp_path / "replayed.json")) as g:
+        assert json.load(f) == json.load(g)
+
+def testReplayRestore(tmp_path, backup, target, writes):
+    filename = backup()
+    recording = str(tmp_path / "requests.json")
+    # one job, so ids of created resources are assigned in the recorded order
+    br = HueBackup("mock", "targetkey", 1, 1000, transport=RecordingTransport(MockTransport(target, "targetkey"), recording))
+    assert br.restore(filename, verify=True).problems() == 0
+    br.close()
+    with open(recording) as f:
+        recorded = json.load(f)
+    assert sum(1 for e in recorded if e["method"] != "GET") == writes(target)
+
+    transport = ReplayTransport(recording)
+    br = HueBackup("mock", "targetkey", 1, 1000, transport=transport)
+    assert br.restore(filename, verify=True).problems() == 0
+    assert transport.stats()["requests"] == len(recorded)
+
+def testReplayOrderAndUnknownRequests(tmp_path):
+    recording = str(tmp_path / "requests.json")
+    with open(recording, "w") as f:
+        json.dump([{"method": "GET", "resource": "config", "data": None, "status": 200, "response": "1"},
+                   {"method": "GET", "resource": "config", "data": None, "status": 200, "response": "2"}], f)
+    transport = ReplayTransport(recording)
+    # identical requests get the recorded responses in order, the last one repeats
+    assert [transport.request("GET", "config").text for i in range(3)] == ["1", "2", "2"]
+    with pytest.raises(TransportError) as error:
+        transport.request("PUT", "config", {"name": "Bridge"})
+    assert not error.value.sent
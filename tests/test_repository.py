@@ -0,0 +1,33 @@
+import copy
+import os
+from hue.repository import BackupRepository
+from hue.synthetic import generateConfig
+
+def objectCount(directory):
+    return sum(len(files) for path, dirs, files in os.walk(os.path.join(directory, "objects")))
+
+def testVolatileChangesStoreNoObjects(tmp_path):
+    repository = BackupRepository(str(tmp_path))
+    state = generateConfig(12, 3, 2, 2, 1)
+    state["config"]["swupdate2"] = {"state": "noupdates"}
+    first = repository.write("bridge", state)
+    count = objectCount(str(tmp_path))
+    changed = copy.deepcopy(state)
+    for data in changed["lights"].values():
+        data["state"]["on"] = not data["state"]["on"]
+    for data in changed["groups"].values():
+        data["state"] = {"all_on": True, "any_on": True}
+    for data in changed["rules"].values():
+        data["lasttriggered"] = "2026-10-16T12:00:00"
+        data["timestriggered"] = 42
+    changed["config"]["UTC"] = "2026-10-16T12:00:01"
+    changed["config"]["swupdate2"] = {"state": "transferring"}
+    second = repository.write("bridge", changed)
+    assert objectCount(str(tmp_path)) == count
+    assert repository.load(first) == state
+    assert repository.load(second) == changed
+
+def testRestoreFromManifest(tmp_path, config, restore):
+    filename = BackupRepository(str(tmp_path)).write("bridge", config)
+    report = restore(filename, verify=True)
+    assert report.problems() == 0
@@ -0,0 +1,81 @@
+import glob
+import os
+import pytest
+from hue.mock_bridge import MockTransport
+
+def uniqueIds(state, lights):
+    return sorted(state["lights"][idx]["uniqueid"] for idx in lights)
+
+@pytest.mark.parametrize("name,options", [
+    ("backup.json", {"intern": False}),
+    ("backup.json", {"intern": True}),
+    ("backup.json.gz", {}),
+    ("backup.json.xz", {}),
+    ("chain", {"incremental": True}),
+    ("repository", {"repository": True})
+])
+def testRoundTrip(backup, restore, target, writes, name, options):
+    filename = backup(name, **options)
+    if options.get("repository"):
+        filename, = glob.glob(os.path.join(filename, "manifests", "*", "*.json"))
+    report = restore(filename, verify=True)
+    assert report.problems() == 0
+    assert not any(data["not_restored"] for data in report.sections.values())
+    restored = writes(target)
+    assert restored > 0
+    # the bridge already matches the backup
+    report = restore(filename, verify=True)
+    assert report.problems() == 0
+    assert writes(target) == restored
+
+def testOnlyRestoresClosure(backup, restore, target, config):
+    rule = [data for data in config["rules"].values() if data["name"] == "Switch 1 button 0"][0]
+    room = rule["actions"][0]["address"].split("/")[2]
+    scene = config["scenes"][rule["actions"][0]["body"]["scene"]]
+    report = restore(backup(), only=["rule:Switch 1 button 0"], verify=True)
+    assert report.problems() == 0
+    state = target.state
+    assert [data["name"] for data in state["rules"].values()] == ["Switch 1 button 0"]
+    assert [data["name"] for data in state["groups"].values()] == [config["groups"][room]["name"]]
+    # the recalled scene, but not other scenes of the room
+    assert [data["name"] for data in state["scenes"].values()] == [scene["name"]]
+    group, = state["groups"].values()
+    assert uniqueIds(state, group["lights"]) == uniqueIds(config, config["groups"][room]["lights"])
+
+def testOnlyGroupIncludesScenes(backup, restore, target, config):
+    room = config["groups"]["1"]["name"]
+    report = restore(backup(), only=["group:" + room], verify=True)
+    assert report.problems() == 0
+    assert [data["name"] for data in target.state["groups"].values()] == [room]
+    assert sorted(data["name"] for data in target.state["scenes"].values()) == \
+        sorted(data["name"] for data in config["scenes"].values() if data["group"] == "1")
+    assert target.state["rules"] == {}
+
+class TamperingTransport(MockTransport):
+    """
+    MockTransport renaming each created group, as if the bridge didn't store the write as sent
+    """
+
+    def send(self, method, resource, data, timeout):
+        if method == "POST" and resource == "groups":
+            data = dict(data, name=data["name"] + "!")
+        return super().send(method, resource, data, timeout)
+
+def testVerifyReportsTamperedWrite(backup, restore, target):
+    report = restore(backup(), transport=TamperingTransport(target, "targetkey"), verify=True)
+    tampered = sorted("groups/" + idx for idx, data in target.state["groups"].items() if data["name"].endswith("!"))
+    assert len(tampered) == 3
+    different = report.sections["groups"]["different"]
+    assert sorted(diff["resource"] for diff in different) == tampered
+    assert all(diff["field"] == "name" and diff["actual"] == diff["expected"] + "!" for diff in different)
+    assert report.problems() == len(tampered)
+
+def testDryRunDoesNotWrite(backup, restore, target, writes, capsys):
+    filename = backup()
+    capsys.readouterr()
+    assert restore(filename, dry_run=True) is None
+    assert writes(target) == 0
+    assert not os.path.exists(filename + ".journal")
+    # the plan of all requests is printed instead
+    out = capsys.readouterr().out
+    assert "POST groups" in out and "POST scenes" in out and "POST rules" in out
@@ -0,0 +1,52 @@
+import copy
+import json
+from hue import HueBackup
+from hue.mock_bridge import MockBridge, MockTransport
+from hue.scenecache import SceneCache
+from hue.storage import internLightstates, writeBackup
+
+def bridgeScenes(state):
+    # scenes as read in bulk from the bridge, without light states
+    return {guid: {k: v for k, v in data.items() if k != "lightstates"} for guid, data in state["scenes"].items()}
+
+def testUnchangedScenesAreReused(config):
+    cache = SceneCache(config)
+    scenes = bridgeScenes(config)
+    assert cache.apply(scenes) == []
+    assert all(data["lightstates"] == config["scenes"][guid]["lightstates"] for guid, data in scenes.items())
+
+def testChangedScenesAreRead(config):
+    cache = SceneCache(config)
+    scenes = bridgeScenes(config)
+    first, second, third = list(scenes.keys())[:3]
+    scenes[first]["lastupdated"] = "2030-01-01T00:00:00"
+    scenes[second]["version"] = scenes[second]["version"] + 1
+    scenes[third]["lights"] = scenes[third]["lights"][:-1]
+    scenes["new"] = dict(scenes[first])
+    assert cache.apply(scenes) == [first, second, third, "new"]
+    assert all("lightstates" not in scenes[guid] for guid in [first, second, third, "new"])
+
+def testInternedAndMissingBackups(tmp_path, config):
+    filename = str(tmp_path / "backup.json.gz")
+    writeBackup(filename, internLightstates(config))
+    assert SceneCache.load(filename).apply(bridgeScenes(config)) == []
+    scenes = bridgeScenes(config)
+    assert SceneCache.load(str(tmp_path / "missing.json")).apply(scenes) == list(scenes.keys())
+
+def testBackupReadsOnlyChangedScenes(tmp_path, config):
+    bridge = MockBridge("key", copy.deepcopy(config))
+    filename = str(tmp_path / "backup.json")
+    def backup():
+        bridge.resetStats()
+        HueBackup("mock", "key", 4, 1000, transport=MockTransport(bridge, "key")).backup(filename)
+        return bridge.stats()["requests"]["GET"]
+    assert backup() == 1 + len(config["scenes"])
+    assert backup() == 1
+    # changing light states of a scene updates its lastupdated
+    guid, data = next(iter(config["scenes"].items()))
+    light = data["lights"][0]
+    bridge.handle("PUT", "/api/key/scenes/" + guid + "/lightstates/" + light, {"on": False, "bri": 1})
+    assert backup() == 2
+    with open(filename) as f:
+        lightstate = json.load(f)["scenes"][guid]["lightstates"][light]
+    assert lightstate["on"] is False and lightstate["bri"] == 1
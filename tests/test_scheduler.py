@@ -0,0 +1,73 @@
+import json
+import time
+import pytest
+from hue.scheduler import TokenBucket, WriteScheduler, MIN_RATE
+from hue.transport import Response, TransportError
+
+SUCCESS = Response(200, json.dumps([{"success": {"id": "1"}}]).encode("utf-8"))
+
+class ScriptedTransport():
+    """
+    Transport answering requests with the given responses (or raising given errors)
+    """
+
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.requests = 0
+
+    def request(self, method, resource, data=None, timeout=None):
+        self.requests += 1
+        answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+def error(status, error_type=None):
+    if error_type is None:
+        return Response(status, b"error")
+    return Response(status, json.dumps([{"error": {"type": error_type, "description": "internal error"}}]).encode("utf-8"))
+
+def testTokenBucketPacing():
+    bucket = TokenBucket(10, 2)
+    # the burst is available at once, further requests queue up behind each other
+    waits = [bucket.reserve() for n in range(5)]
+    assert waits[0:2] == [0, 0]
+    assert waits[2:] == pytest.approx([0.1, 0.2, 0.3], abs=0.01)
+    start = time.monotonic()
+    TokenBucket(20, 1).acquire()
+    assert time.monotonic() - start < 0.05
+
+def testRateHalvingAndRecovery():
+    scheduler = WriteScheduler(ScriptedTransport(), 8, retries=2, backoff=0)
+    for rate in [4, 2, 1, MIN_RATE, MIN_RATE]:
+        scheduler.onOverload("PUT", "lights/1/state", 0, "busy")
+        assert scheduler.bucket.rate == rate
+    with pytest.raises(Exception, match="after 3 attempts"):
+        scheduler.onOverload("PUT", "lights/1/state", 2, "busy")
+    rates = []
+    while scheduler.bucket.rate < 8:
+        scheduler.onSuccess()
+        rates.append(scheduler.bucket.rate)
+    assert rates == sorted(rates) and rates[-1] == 8 and len(rates) < 100
+
+@pytest.mark.parametrize("answer", [error(429), error(503), error(200, 901), TransportError("refused", False)])
+def testPostRetriedIfNotProcessed(answer):
+    transport = ScriptedTransport(answer, SUCCESS)
+    response = WriteScheduler(transport, 1000, backoff=0).request("POST", "groups", {"name": "Kitchen"})
+    assert response is SUCCESS and transport.requests == 2
+
+@pytest.mark.parametrize("status", [500, 502, 504])
+def testPostNotRetriedAfterServerError(status):
+    transport = ScriptedTransport(error(status), SUCCESS)
+    response = WriteScheduler(transport, 1000, backoff=0).request("POST", "groups", {"name": "Kitchen"})
+    assert response.status_code == status and transport.requests == 1
+    # while other requests can be repeated safely
+    transport = ScriptedTransport(error(status), SUCCESS)
+    assert WriteScheduler(transport, 1000, backoff=0).request("PUT", "groups/1", {"name": "Kitchen"}) is SUCCESS
+    assert transport.requests == 2
+
+def testPostNotRetriedAfterSentTransportError():
+    transport = ScriptedTransport(TransportError("connection lost", True), SUCCESS)
+    with pytest.raises(TransportError):
+        WriteScheduler(transport, 1000, backoff=0).request("POST", "scenes", {"name": "Relax"})
+    assert transport.requests == 1
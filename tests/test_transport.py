@@ -0,0 +1,122 @@
+import json
+import threading
+import time
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from hue.mock_bridge import MockBridgeServer
+from hue.transport import HttpTransport, TransportError, bridgeUrl
+
+class DroppingHandler(BaseHTTPRequestHandler):
+    """
+    Keep-alive handler answering only the first requests of each connection: then it
+    closes the connection after answering (idle) or instead of answering (dropped)
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        self.answered = 0
+
+    def __handle(self):
+        length = int(self.headers.get("Content-Length", 0) or 0)
+        self.rfile.read(length)
+        if self.answered == self.server.answer:
+            # request of a connection the bridge already gave up
+            self.close_connection = True
+            return
+        self.answered += 1
+        body = json.dumps([{"success": {"id": "1"}}]).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        if self.server.idle_close:
+            self.close_connection = True
+
+    def do_GET(self):
+        self.__handle()
+
+    def do_POST(self):
+        self.__handle()
+
+@pytest.fixture
+def dropping():
+    servers = []
+    def start(answer=1, idle_close=False):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), DroppingHandler)
+        server.daemon_threads = True
+        server.answer = answer
+        server.idle_close = idle_close
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return HttpTransport(bridgeUrl("127.0.0.1:" + str(server.server_address[1]), "key"))
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def testConnectionIsReused(config):
+    server = MockBridgeServer("key", config)
+    transport = HttpTransport(bridgeUrl(server.address, "key"))
+    try:
+        for i in range(10):
+            assert transport.request("GET", "lights").status_code == 200
+    finally:
+        transport.close()
+        server.close()
+    assert transport.stats() == {"requests": 10, "connections": 1, "reused": 9}
+    assert server.bridge.connections == 1
+
+def testConcurrentRequestsShareThePool(config):
+    server = MockBridgeServer("key", config, latency=0.01)
+    transport = HttpTransport(bridgeUrl(server.address, "key"), pool_size=4)
+    def get():
+        for i in range(5):
+            transport.request("GET", "lights")
+    threads = [threading.Thread(target=get) for i in range(4)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        transport.close()
+        server.close()
+    stats = transport.stats()
+    assert stats["requests"] == 20
+    assert stats["connections"] <= 4
+
+def testConnectionClosedWhileIdleIsReplaced(dropping):
+    transport = dropping(idle_close=True)
+    try:
+        assert transport.request("GET", "lights").status_code == 200
+        # let the close of the bridge arrive
+        time.sleep(0.1)
+        assert transport.request("GET", "lights").status_code == 200
+    finally:
+        transport.close()
+    assert transport.stats() == {"requests": 2, "connections": 2, "reused": 0}
+
+def testDroppedRequestIsRepeatedOnNewConnection(dropping):
+    transport = dropping()
+    try:
+        assert transport.request("GET", "lights").status_code == 200
+        assert transport.request("GET", "lights").status_code == 200
+    finally:
+        transport.close()
+    assert transport.stats()["connections"] == 2
+
+def testDroppedPostIsNotRepeated(dropping):
+    transport = dropping()
+    try:
+        assert transport.request("POST", "groups", {"name": "Room"}).status_code == 200
+        with pytest.raises(TransportError) as error:
+            transport.request("POST", "groups", {"name": "Room"})
+        assert error.value.sent
+    finally:
+        transport.close()
+    assert transport.stats()["connections"] == 1
@@ -0,0 +1,43 @@
+import os
+from hue import HueBackup
+from hue.mock_bridge import MockBridge, MockTransport
+from hue.synthetic import generateConfig
+
+def testWatchIgnoresVolatileChanges(tmp_path):
+    bridge = MockBridge("key", generateConfig(10, 2, 2, 2, 1))
+    polls = []
+
+    def toggle(method, resource, data, response, start, end):
+        # after each poll, switch lights and let a rule fire, as happens all the time
+        if method != "GET" or resource != "":
+            return
+        polls.append(resource)
+        n = len(polls)
+        with bridge.lock:
+            state = bridge.state
+            state["groups"]["1"]["state"] = {"all_on": n % 2 == 1, "any_on": n % 2 == 1}
+            state["groups"]["1"]["action"]["on"] = n % 2 == 1
+            for light in state["lights"].values():
+                light["state"]["on"] = n % 2 == 1
+            rule = next(iter(state["rules"].values()))
+            rule["lasttriggered"] = "2021-01-01T10:00:%02d" % n
+            rule["timestriggered"] = n
+            state["config"]["UTC"] = "2021-01-01T10:00:%02d" % n
+            state["config"]["swupdate2"] = {"lastchange": "2021-01-01T10:00:%02d" % n}
+
+    directory = str(tmp_path / "chain")
+    br = HueBackup("mock", "key", hooks=[toggle], transport=MockTransport(bridge, "key"))
+    br.watch(directory, interval=0, count=10)
+    # a second watcher compares against the hashes of the chain instead of the last poll
+    HueBackup("mock", "key", hooks=[toggle], transport=MockTransport(bridge, "key")).watch(directory, interval=0, count=1)
+    assert len(polls) == 11
+    assert sorted(os.listdir(directory)) == ["000000-full.json", "chain.json"]
+
+def testWatchBacksUpRealChanges(tmp_path):
+    bridge = MockBridge("key", generateConfig(10, 2, 2, 2, 1))
+    directory = str(tmp_path / "chain")
+    transport = MockTransport(bridge, "key")
+    HueBackup("mock", "key", transport=transport).watch(directory, interval=0, count=1)
+    bridge.state["groups"]["1"]["name"] = "Renamed"
+    HueBackup("mock", "key", transport=transport).watch(directory, interval=0, count=1)
+    assert sorted(os.listdir(directory)) == ["000000-full.json", "000001-delta.json", "chain.json"]